@@ -0,0 +1,161 @@
+"""
+Benchmarks the DJORNL importer on synthetic datasets of increasing size.
+
+For each scale tier, a dataset is generated (or reused from an earlier run)
+and `load_edges`, `load_node_metadata`, `load_cluster_data` and a full
+`load_data` (against a local stand-in for the RE API) are each run in a fresh
+process, recording wall time, throughput and peak RSS. Results can be saved,
+and compared with a saved baseline, failing if any time or peak RSS has grown
+by more than a threshold.
+
+    python -m importers.bench.benchmark --tiers xs,s --output results.json
+    python -m importers.bench.benchmark --tiers xs,s --baseline results.json --threshold 0.2
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from importers.bench.generate import generate_dataset
+from importers.bench.server import StandInServer
+
+
+# number of edges in the dataset for each tier
+TIERS = {
+    'xs': 10000,
+    's': 100000,
+    'm': 1000000,
+    'l': 10000000,
+    'xl': 50000000,
+}
+
+BENCHMARKS = ['load_edges', 'load_node_metadata', 'load_cluster_data', 'load_data']
+
+# differences smaller than these are treated as noise
+_MIN_SECS = 0.1
+_MIN_RSS_KB = 10 * 1024
+
+
+def _run_one(benchmark, data_dir):
+    """Run a single benchmark in this process, returning its measurements."""
+    from importers.djornl.parser import DJORNL_Parser
+    from importers.utils.metrics import peak_rss_kb
+
+    os.environ['RES_ROOT_DATA_PATH'] = data_dir
+    parser = DJORNL_Parser()
+    parser.config()
+    start = time.monotonic()
+    with contextlib.redirect_stdout(sys.stderr):
+        result = getattr(parser, benchmark)()
+    wall_secs = time.monotonic() - start
+
+    if benchmark == 'load_data':
+        rows = sum(phase['rows_parsed'] for phase in parser.metrics().report().values())
+    elif benchmark == 'load_edges':
+        rows = len(result['edges'])
+    else:
+        rows = len(result['nodes'])
+    return {
+        'wall_secs': round(wall_secs, 3),
+        'rows': rows,
+        'rows_per_sec': round(rows / wall_secs, 1) if wall_secs else None,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def run_benchmarks(data_dir, tiers=None, benchmarks=None, log=print):
+    """
+    Run the benchmarks for each tier, given as a dict of tier names to edge
+    counts, generating datasets under `data_dir` as needed. Returns the
+    measurements for each benchmark in each tier.
+    """
+    tiers = tiers or TIERS
+    benchmarks = benchmarks or BENCHMARKS
+    results = {}
+    with StandInServer(store=False) as server:
+        for (tier, n_edges) in tiers.items():
+            tier_dir = os.path.join(data_dir, f'{tier}-{n_edges}')
+            done_marker = os.path.join(tier_dir, '.complete')
+            if not os.path.exists(done_marker):
+                log(f"Generating {n_edges} edges for tier {tier}")
+                generate_dataset(tier_dir, n_edges)
+                open(done_marker, 'w').close()
+
+            results[tier] = {}
+            for benchmark in benchmarks:
+                # a fresh process for each benchmark, so that peak RSS is its own, with none of
+                # the importer settings of the calling shell
+                env = {name: val for (name, val) in os.environ.items() if not name.startswith('RES_')}
+                env['RES_API_URL'] = server.url
+                cmd = [sys.executable, '-m', 'importers.bench.benchmark', '--run-one', benchmark, tier_dir]
+                proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+                if proc.returncode != 0:
+                    raise RuntimeError(f"{benchmark} failed for tier {tier}:\n{proc.stderr.decode()}")
+                results[tier][benchmark] = json.loads(proc.stdout.decode().splitlines()[-1])
+                log(f"  {tier} {benchmark}: {json.dumps(results[tier][benchmark])}")
+    return results
+
+
+def find_regressions(results, baseline, threshold=0.2):
+    """
+    Compare results with a baseline, returning a description of each wall
+    time or peak RSS that is more than `threshold` (a fraction) worse.
+    """
+    regressions = []
+    for (tier, benchmarks) in results.items():
+        for (benchmark, result) in benchmarks.items():
+            base = baseline.get(tier, {}).get(benchmark)
+            if base is None:
+                continue
+            for (metric, min_diff) in [('wall_secs', _MIN_SECS), ('peak_rss_kb', _MIN_RSS_KB)]:
+                (new, old) = (result[metric], base[metric])
+                if new > old * (1 + threshold) and new - old > min_diff:
+                    change = (new - old) / old if old else float('inf')
+                    regressions.append(f"{tier} {benchmark} {metric}: {old} -> {new} (+{change:.0%})")
+    return regressions
+
+
+def get_args():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--tiers', default='xs,s',
+        help=f"comma-separated tiers to run, from {', '.join(f'{t} ({n} edges)' for (t, n) in TIERS.items())}"
+    )
+    argparser.add_argument('--benchmarks', default=','.join(BENCHMARKS), help='comma-separated benchmarks to run')
+    argparser.add_argument(
+        '--data-dir', default=os.path.join('/tmp', 'djornl-bench'),
+        help='where to keep the generated datasets, which are reused (default: %(default)s)'
+    )
+    argparser.add_argument('--output', help='write the results to this JSON file')
+    argparser.add_argument('--baseline', help='compare the results with this JSON file of earlier results')
+    argparser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help='fail if a time or peak RSS is more than this fraction worse than the baseline (default: %(default)s)'
+    )
+    argparser.add_argument('--run-one', nargs=2, metavar=('BENCHMARK', 'DATA_DIR'), help=argparse.SUPPRESS)
+    return argparser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    if args.run_one:
+        print(json.dumps(_run_one(*args.run_one)))
+        sys.exit(0)
+
+    tiers = {tier: TIERS[tier] for tier in args.tiers.split(',')}
+    results = run_benchmarks(args.data_dir, tiers, args.benchmarks.split(','))
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fd:
+            regressions = find_regressions(results, json.load(fd), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print('  ' + regression)
+            sys.exit(1)
+        print("No regressions")
@@ -0,0 +1,133 @@
+"""
+Writes a synthetic set of DJORNL source files -- a node table, a multi-layer
+edge file and the I2/I4/I6 cluster files -- at any scale, for benchmarking.
+
+The files have the same names, columns and value formats as the real data,
+with a similar mix of edge layers, and are the same for a given seed.
+
+    python -m importers.bench.generate /path/to/output --edges 1000000
+"""
+import argparse
+import csv
+import os
+import random
+
+
+_NODE_FILE = 'aranet2-aragwas-MERGED-AMW-v2_091319_nodeTable.csv'
+_EDGE_FILE = 'merged_edges-AMW-060820_AF.tsv'
+_CLUSTER_FILE = 'out.aranetv2_subnet_AT-CX_top10percent_anno_AF_082919.abc.{}_named.tsv'
+
+_NODE_HEADER = [
+    'node_id', 'node_type', 'transcript', 'gene_symbol', 'gene_full_name', 'gene_model_type',
+    'TAIR_Computational_description', 'TAIR_Curator_summary', 'TAIR_short_description', 'GO_descr',
+    'GO_terms', 'MapMan_bin', 'MapMan_name', 'MapMan_descr', 'pheno_AraGWAS_ID', 'pheno_descrip1',
+    'pheno_descrip2', 'pheno_descrip3', 'pheno_ref', 'UserNotes',
+]
+
+# (layer name, score description, share of the edges), roughly as in the real data
+_LAYERS = [
+    ('AraNetv2-CX_pairwise-gene-coexpression', 'AraNetv2_log-likelihood-score', 0.45),
+    ('AraNetv2-DC_domain-co-occurrence', 'AraNetv2_log-likelihood-score', 0.15),
+    ('AraNetv2-HT_high-throughput-ppi', 'AraNetv2_log-likelihood-score', 0.10),
+    ('AraNetv2-LC_lit-curated-ppi', 'AraNetv2_log-likelihood-score', 0.10),
+    ('AraGWAS-Phenotype_Associations', 'AraGWAS-Association_score', 0.20),
+]
+
+# mean cluster size for each clustering inflation value
+_CLUSTER_SIZES = {'I2': 40, 'I4': 12, 'I6': 5}
+
+_WORDS = (
+    'protein domain containing family transcription factor kinase binding receptor '
+    'like transporter membrane nuclear activity regulation response stress root leaf '
+    'seed development plasma chloroplast mitochondrial putative hydrolase synthase'
+).split()
+
+
+def gene_id(ix):
+    """An Arabidopsis-style gene ID, e.g. AT1G01010."""
+    return f'AT{ix % 5 + 1}G{(ix // 5 + 1) * 10:05d}'
+
+
+def _text(rand, n_words):
+    return ' '.join(rand.choice(_WORDS) for _ in range(n_words))
+
+
+def default_sizes(n_edges):
+    """The number of genes and phenotypes for a dataset with `n_edges` edges."""
+    n_genes = min(30000, max(20, n_edges // 10))
+    return (n_genes, max(2, n_genes // 100))
+
+
+def generate_dataset(root, n_edges, n_genes=None, n_phenotypes=None, seed=0):
+    """
+    Write a synthetic dataset with `n_edges` edges to the directory `root`.
+    Returns a summary of what was written.
+    """
+    rand = random.Random(seed)
+    (default_genes, default_phenotypes) = default_sizes(n_edges)
+    n_genes = n_genes or default_genes
+    n_phenotypes = n_phenotypes or default_phenotypes
+    genes = [gene_id(ix) for ix in range(n_genes)]
+    phenotypes = [f'{rand.choice(["As", "Na", "Cd", "FT", "LD"])}{ix}' for ix in range(n_phenotypes)]
+    os.makedirs(os.path.join(root, 'cluster_data'), exist_ok=True)
+
+    with open(os.path.join(root, _NODE_FILE), 'w', newline='') as fd:
+        writer = csv.writer(fd)
+        writer.writerow(_NODE_HEADER)
+        for pheno in phenotypes:
+            writer.writerow(
+                [pheno, 'pheno'] + [''] * 12 +
+                [f'10.21958/phenotype:{rand.randrange(1000)}', _text(rand, 20), _text(rand, 3),
+                 _text(rand, 25), 'Atwell et. al, Nature 2010', '']
+            )
+        for gene in genes:
+            go_terms = ', '.join(f'GO:{rand.randrange(10 ** 7):07d}' for _ in range(rand.randrange(4)))
+            writer.writerow([
+                gene, 'gene', f'{gene}.1', gene[-5:], _text(rand, 4), 'protein_coding',
+                _text(rand, 6) + ';(source:Araport11)', _text(rand, rand.choice([0, 15])), _text(rand, 4),
+                _text(rand, 5), go_terms, f'{rand.randrange(1, 36)}.{rand.randrange(10)}', '.' + _text(rand, 5),
+                _text(rand, 30), '', '', '', '', '', '',
+            ])
+
+    weights = [share for (_, _, share) in _LAYERS]
+    with open(os.path.join(root, _EDGE_FILE), 'w') as fd:
+        fd.write('node1\tnode2\tedge\tedge_descrip\tlayer_descrip\n')
+        for start in range(0, n_edges, 10000):
+            lines = []
+            for (layer, descrip, _) in rand.choices(_LAYERS, weights, k=min(10000, n_edges - start)):
+                if layer.startswith('AraGWAS'):
+                    (node1, score) = (rand.choice(phenotypes), f'{rand.uniform(5, 50):.1f}')
+                else:
+                    (node1, score) = (rand.choice(genes), repr(rand.uniform(1, 10)))
+                lines.append(f'{node1}\t{rand.choice(genes)}\t{score}\t{descrip}\t{layer}\n')
+            fd.write(''.join(lines))
+
+    # as for the real data, only some of the genes are in the clustered subnetwork
+    clustered = genes[:max(1, int(n_genes * 0.6))]
+    for (label, mean_size) in _CLUSTER_SIZES.items():
+        members = list(clustered)
+        rand.shuffle(members)
+        with open(os.path.join(root, 'cluster_data', _CLUSTER_FILE.format(label)), 'w') as fd:
+            cluster_no = 0
+            while members:
+                cluster_no += 1
+                size = max(1, int(rand.expovariate(1 / mean_size)))
+                (cluster, members) = (members[:size], members[size:])
+                fd.write('\t'.join([f'Cluster{cluster_no}'] + cluster) + '\n')
+
+    return {'edges': n_edges, 'genes': n_genes, 'phenotypes': n_phenotypes}
+
+
+def get_args():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('root', help='directory to write the files to')
+    argparser.add_argument('--edges', type=int, default=100000, help='number of edges (default: %(default)s)')
+    argparser.add_argument('--genes', type=int, help='number of genes (default: scaled to the edges)')
+    argparser.add_argument('--phenotypes', type=int, help='number of phenotypes (default: 1%% of the genes)')
+    argparser.add_argument('--seed', type=int, default=0)
+    return argparser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    print(generate_dataset(args.root, args.edges, args.genes, args.phenotypes, args.seed))
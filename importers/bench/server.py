@@ -0,0 +1,262 @@
+"""
+A local stand-in for the RE API's bulk document endpoint, for measuring
+importer throughput without an RE API and ArangoDB stack.
+
+It implements `PUT /api/v1/documents` with the `collection`, `on_duplicate`,
+`overwrite` and `display_errors` params and a newline-delimited JSON body
+(optionally gzipped), keeps the saved documents in memory, and can add
+artificial latency and errors to its responses. `GET /stats` returns the
+number of requests, docs and bytes it has received and its response times.
+
+Run it with e.g.
+
+    python -m importers.bench.server --port 5000 --latency 0.05 --error-rate 0.01
+
+and point an importer at it with `RES_API_URL=http://localhost:5000`.
+"""
+import argparse
+import gzip
+import http.server
+import json
+import random
+import threading
+import time
+import urllib.parse
+
+
+ON_DUPLICATE = ('error', 'update', 'replace', 'ignore')
+
+
+def _percentile(sorted_vals, pct):
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * pct / 100))]
+
+
+class StandInServer(object):
+    """
+    Serves the bulk document endpoint from a background thread; use it as a
+    context manager, or call `start` and `stop`.
+
+    Each response is delayed by `latency` seconds plus a random amount of up
+    to `jitter` seconds. A fraction `error_rate` of requests fail with an
+    `error_status` response (with a `Retry-After` header for 429 and 503)
+    without saving anything. If `store` is false, documents are counted but
+    not kept, so that memory use does not grow with the number of docs.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_status=503, store=True, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.store = store
+        self.collections = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_stats()
+        self._httpd = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.stand_in = self
+        self._thread = None
+
+    @property
+    def url(self):
+        (host, port) = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {
+                'requests': 0,
+                'failed_requests': 0,
+                'docs': 0,
+                'bytes_received': 0,
+                'bytes_decoded': 0,
+            }
+            self._timings = []
+            self._first_request = None
+            self._last_response = None
+
+    def stats(self):
+        """Counts of what has been received, with response time percentiles in ms."""
+        with self._lock:
+            timings = sorted(self._timings)
+            stats = dict(self._stats)
+            span = (self._last_response - self._first_request) if self._timings else 0
+        stats['elapsed_secs'] = round(span, 3)
+        stats['docs_per_sec'] = round(stats['docs'] / span, 1) if span else None
+        stats['response_ms'] = {
+            'p50': _percentile(timings, 50),
+            'p95': _percentile(timings, 95),
+            'p99': _percentile(timings, 99),
+            'max': timings[-1] if timings else None,
+        }
+        return stats
+
+    def save(self, coll_name, docs, on_dupe, overwrite, details):
+        """Save docs as the RE API would, returning the counts for its response."""
+        result = {'created': 0, 'errors': 0, 'empty': 0, 'updated': 0, 'ignored': 0}
+        with self._lock:
+            if overwrite or coll_name not in self.collections:
+                self.collections[coll_name] = {}
+            coll = self.collections[coll_name]
+            for doc in docs:
+                if not doc:
+                    result['empty'] += 1
+                    continue
+                key = doc.setdefault('_key', str(len(coll) + 1))
+                if key not in coll:
+                    result['created'] += 1
+                    if self.store:
+                        coll[key] = doc
+                    else:
+                        coll[key] = None
+                elif on_dupe == 'error':
+                    result['errors'] += 1
+                    details.append(f"unique constraint violated; conflicting key: {key}")
+                elif on_dupe == 'ignore':
+                    result['ignored'] += 1
+                else:
+                    result['updated'] += 1
+                    if self.store and on_dupe == 'update':
+                        # a shallow merge; ArangoDB also merges nested objects
+                        coll[key] = dict(coll[key], **doc)
+                    elif self.store:
+                        coll[key] = doc
+        return result
+
+    def _record(self, start, n_bytes, n_decoded, n_docs, ok):
+        end = time.monotonic()
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['failed_requests'] += 0 if ok else 1
+            self._stats['docs'] += n_docs
+            self._stats['bytes_received'] += n_bytes
+            self._stats['bytes_decoded'] += n_decoded
+            self._timings.append(round((end - start) * 1000, 3))
+            if self._first_request is None or start < self._first_request:
+                self._first_request = start
+            self._last_response = end
+
+    def _delay(self):
+        with self._lock:
+            extra = self._random.uniform(0, self.jitter) if self.jitter else 0
+            fail = self.error_rate and self._random.random() < self.error_rate
+        if self.latency or extra:
+            time.sleep(self.latency + extra)
+        return fail
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for (name, val) in (headers or {}).items():
+            self.send_header(name, val)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        if path == '/stats':
+            return self._respond(200, self.server.stand_in.stats())
+        if path in ('/', ''):
+            return self._respond(200, {'arangodb_status': 'stand-in'})
+        self._respond(404, {'error': f'Not found: {path}'})
+
+    def do_PUT(self):
+        stand_in = self.server.stand_in
+        start = time.monotonic()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        (path, _, query) = self.path.partition('?')
+        if path != '/api/v1/documents':
+            return self._respond(404, {'error': f'Not found: {path}'})
+        params = dict(urllib.parse.parse_qsl(query))
+
+        if stand_in._delay():
+            stand_in._record(start, len(body), 0, 0, False)
+            headers = {'Retry-After': '1'} if stand_in.error_status in (429, 503) else None
+            return self._respond(stand_in.error_status, {'error': 'Injected error'}, headers)
+
+        (status, result, n_decoded, n_docs) = self._save(stand_in, params, body)
+        stand_in._record(start, len(body), n_decoded, n_docs, status < 400)
+        self._respond(status, result)
+
+    def _save(self, stand_in, params, body):
+        """Returns (status, response body, decoded body size, doc count)."""
+        if not self.headers.get('Authorization'):
+            return (403, {'error': 'Missing header: Authorization'}, 0, 0)
+        coll_name = params.get('collection')
+        if not coll_name:
+            return (400, {'error': "Missing param: 'collection'"}, 0, 0)
+        on_dupe = params.get('on_duplicate', 'error')
+        if on_dupe not in ON_DUPLICATE:
+            return (400, {'error': f"Invalid on_duplicate: {on_dupe}"}, 0, 0)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        try:
+            docs = [json.loads(line) for line in body.split(b'\n') if line.strip()]
+        except ValueError as err:
+            return (400, {'error': f'Invalid JSON: {err}'}, len(body), 0)
+        overwrite = params.get('overwrite', '').lower() in ('1', 'true', 'yes')
+        details = []
+        result = stand_in.save(coll_name, docs, on_dupe, overwrite, details)
+        result['error'] = False
+        if params.get('display_errors'):
+            result['details'] = details
+        return (200, result, len(body), len(docs))
+
+
+def get_args():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('--host', default='127.0.0.1')
+    argparser.add_argument('--port', type=int, default=5000)
+    argparser.add_argument('--latency', type=float, default=0.0, help='seconds to delay each response')
+    argparser.add_argument('--jitter', type=float, default=0.0, help='up to this many more seconds of random delay')
+    argparser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests to fail')
+    argparser.add_argument('--error-status', type=int, default=503, help='status code of failed requests')
+    argparser.add_argument('--no-store', action='store_true', help='count docs without keeping them in memory')
+    argparser.add_argument('--seed', type=int, help='random seed, for repeatable runs')
+    return argparser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    server = StandInServer(
+        args.host, args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        error_status=args.error_status, store=not args.no_store, seed=args.seed,
+    )
+    print(f"Serving the RE API documents endpoint at {server.url}; Ctrl-C to stop")
+    try:
+        with server:
+            while True:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats(), indent=2))
@@ -4,8 +4,50 @@ arangodb.
 
 Running this requires a set of source files provided by the ORNL group.
 """
+import argparse
+import json
+import sys
+
 from importers.djornl.parser import DJORNL_Parser
+from importers.utils.export import BulkExporter
+
+
+def get_args():
+    argparser = argparse.ArgumentParser(description=__doc__)
+    argparser.add_argument(
+        '--export', metavar='DIR',
+        help='write JSONL files for arangoimport to DIR instead of uploading through the RE API'
+    )
+    argparser.add_argument(
+        '--gzip', action='store_true',
+        help='gzip the exported files'
+    )
+    argparser.add_argument(
+        '--shard-size', type=int, default=1000000,
+        help='maximum number of docs per exported file (default: %(default)s)'
+    )
+    argparser.add_argument(
+        '--resume', action='store_true',
+        help='skip the docs that a previous, failed run saved, as recorded at RES_CHECKPOINT_PATH'
+    )
+    argparser.add_argument(
+        '--check-integrity', action='store_true',
+        help=(
+            'only report edge endpoints that are not in the node data and nodes that no edge uses, '
+            'without loading anything'
+        ),
+    )
+    return argparser.parse_args()
+
 
 if __name__ == '__main__':
-    parser = DJORNL_Parser()
+    args = get_args()
+    exporter = None
+    if args.export:
+        exporter = BulkExporter(args.export, shard_size=args.shard_size, compress=args.gzip)
+    parser = DJORNL_Parser(exporter=exporter, resume=args.resume)
+    if args.check_integrity:
+        report = parser.check_integrity()
+        print(json.dumps(report, indent=2))
+        sys.exit(1 if report['dangling_endpoints'] else 0)
     parser.load_data()
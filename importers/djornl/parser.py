@@ -4,41 +4,125 @@ arangodb.
 
 Running this requires a set of source files provided by the ORNL group.
 """
-import json
-import requests
+import concurrent.futures
+import itertools
+import io
 import os
-import csv
 
-import importers.utils.config as config
-
-
-class DJORNL_Parser(object):
-
-    def config(self):
-        if not hasattr(self, '_config'):
-            return self._configure()
-
-        return self._config
-
-    def _configure(self):
-
-        configuration = config.load_from_env(extra_required=['ROOT_DATA_PATH'])
+from importers.utils.assembler import DocAssembler
+from importers.utils.dedup import POLICIES as DEDUP_POLICIES, dedup_edges, find_key_collision
+from importers.utils.edge_store import EdgeStore
+from importers.utils.importer import Importer, parse_delimited
+from importers.utils.integrity import IntegrityError, check_references
+from importers.utils.keys import DIGEST_SIZE, hashed_key
+from importers.utils.parsing import ParseError, find_source, is_compressed, line_aligned_ranges, map_ranges, read_range
+from importers.utils.pipeline import in_thread
+from importers.utils.schema import SchemaValidationError
+
+_SCHEMA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'schemas', 'djornl')
+
+# map from the layer names used in the edge file to djornl_edge edge_types
+_EDGE_REMAP = {
+  'AraGWAS-Phenotype_Associations':         'pheno_assn',
+  'AraNetv2-CX_pairwise-gene-coexpression': 'gene_coexpr',
+  'AraNetv2-DC_domain-co-occurrence':       'domain_co_occur',
+  'AraNetv2-HT_high-throughput-ppi':        'ppi_hithru',
+  'AraNetv2-LC_lit-curated-ppi':            'ppi_liter',
+}
+
+# the edge file columns used for edges: node1, node2, score and layer
+_EDGE_COLUMNS = (0, 1, 2, 4)
+_EDGE_ENUMS = {4: (_EDGE_REMAP, 'edge type')}
+
+# edge types whose edges have no direction, so that A-B and B-A are the same edge
+_SYMMETRIC_EDGE_TYPES = {'domain_co_occur', 'gene_coexpr', 'ppi_hithru', 'ppi_liter'}
+
+
+# the fields of a node doc, in the order of the columns of the node metadata file
+_NODE_FIELDS = [
+    '_key', 'node_type', 'transcript', 'gene_symbol', 'gene_full_name', 'gene_model_type',
+    'tair_computational_desc', 'tair_curator_summary', 'tair_short_desc', 'go_descr', 'go_terms',
+    'mapman_bin', 'mapman_name', 'mapman_desc', 'pheno_aragwas_id', 'pheno_desc1', 'pheno_desc2',
+    'pheno_desc3', 'pheno_ref', 'user_notes',
+]
+_NODE_ENUMS = {1: ({'gene', 'pheno'}, 'node type')}
+_GO_TERMS_COL = _NODE_FIELDS.index('go_terms')
+
+
+def _parse_edge_range(path, start, end, expected_col_count, backend='rows'):
+    """
+    Parse a byte range of the edge file into an EdgeStore, for use in a worker
+    process. Returns (edges, error), where line numbers in both are relative
+    to the start of the range, and `error` is a ParseError or None.
+    """
+    edges = EdgeStore(_EDGE_REMAP.values())
+    lines = io.StringIO(read_range(path, start, end))
+    try:
+        rows = parse_delimited(
+            lines, '\t', expected_col_count, columns=_EDGE_COLUMNS, enums=_EDGE_ENUMS, backend=backend
+        )
+        for row in rows:
+            edges.append(*row)
+    except ParseError as err:
+        return (edges, err)
+    return (edges, None)
+
+
+def _index_nodes(rows, node_ix):
+    """Pass through edge rows, adding the IDs of the nodes they connect to `node_ix`."""
+    for row in rows:
+        node_ix[row[1]] = 1
+        node_ix[row[2]] = 1
+        yield row
+
+
+class DJORNL_Parser(Importer):
+
+    REQUIRED_CONFIG = ['ROOT_DATA_PATH']
+    OPTIONAL_CONFIG = ['EDGE_KEY_SCHEME', 'INTEGRITY_CHECK', 'INTEGRITY_BLOOM', 'EDGE_DEDUP', 'DEDUP_RUN_SIZE']
+    CONFIG_DEFAULTS = {
+        # 'full': node1__node2__edge_type__score; 'hash': a hash of node1, node2 and edge_type
+        'EDGE_KEY_SCHEME': 'full',
+        # what to do about edge endpoints that are not in the node data: 'warn', 'fail' or 'off'
+        'INTEGRITY_CHECK': 'warn',
+        # check integrity with Bloom filters rather than sets
+        'INTEGRITY_BLOOM': False,
+        # what to do with duplicate edges: 'off', or one of the DEDUP_POLICIES
+        'EDGE_DEDUP': 'off',
+        # number of edges to sort in memory when looking for duplicates or hashed key collisions
+        'DEDUP_RUN_SIZE': 1000000,
+    }
+    SCHEMA_DIR = _SCHEMA_DIR
+    COLLECTIONS = ['djornl_node', 'djornl_edge']
+
+    def configure(self, configuration):
+        if configuration['EDGE_KEY_SCHEME'] not in ('full', 'hash'):
+            raise ValueError(f"Invalid EDGE_KEY_SCHEME: {configuration['EDGE_KEY_SCHEME']}")
+        if configuration['INTEGRITY_CHECK'] not in ('warn', 'fail', 'off'):
+            raise ValueError(f"Invalid INTEGRITY_CHECK: {configuration['INTEGRITY_CHECK']}")
+        if configuration['EDGE_DEDUP'] not in ('off',) + DEDUP_POLICIES:
+            raise ValueError(f"Invalid EDGE_DEDUP: {configuration['EDGE_DEDUP']}")
+        if configuration['EDGE_DEDUP'] != 'off' and configuration['PIPELINE']:
+            raise ValueError("EDGE_DEDUP needs the whole edge file to be parsed first, so cannot be used with PIPELINE")
+        if configuration['INTEGRITY_CHECK'] == 'fail' and configuration['PIPELINE']:
+            raise ValueError("INTEGRITY_CHECK=fail needs the edges to be checked before any is sent, "
+                             "so cannot be used with PIPELINE")
 
         # Collection name config
         configuration['_NODE_NAME'] = 'djornl_node'
         configuration['_EDGE_NAME'] = 'djornl_edge'
 
-        # Path config
-        configuration['_NODE_PATH'] = os.path.join(
+        # Path config; each source file may also be gzip, bz2 or xz compressed
+        configuration['_NODE_PATH'] = find_source(os.path.join(
             configuration['ROOT_DATA_PATH'],
             'aranet2-aragwas-MERGED-AMW-v2_091319_nodeTable.csv'
-        )
+        ))
         configuration['_NODE_FILE_COL_COUNT'] = 20
 
-        configuration['_EDGE_PATH'] = os.path.join(
+        configuration['_EDGE_PATH'] = find_source(os.path.join(
             configuration['ROOT_DATA_PATH'],
             'merged_edges-AMW-060820_AF.tsv'
-        )
+        ))
         configuration['_EDGE_FILE_COL_COUNT'] = 5
 
         _CLUSTER_BASE = os.path.join(configuration['ROOT_DATA_PATH'], 'cluster_data')
@@ -56,159 +140,354 @@ class DJORNL_Parser(object):
                 'out.aranetv2_subnet_AT-CX_top10percent_anno_AF_082919.abc.I6_named.tsv'
             ),
         }
-        self._config = configuration
-        return self._config
+        for (cluster_label, path) in configuration['_CLUSTER_PATHS'].items():
+            configuration['_CLUSTER_PATHS'][cluster_label] = find_source(path)
+
+
+    def source_paths(self):
+        conf = self.config()
+        return [conf['_EDGE_PATH'], conf['_NODE_PATH']] + list(conf['_CLUSTER_PATHS'].values())
 
 
     def load_edges(self):
+        """Load edges and the nodes that they connect"""
+
+        edges = self.parse_edges()
+        return {
+            'nodes': [{'_key': n} for n in edges.node_ids],
+            'edges': list(self.edge_docs(edges)),
+        }
+
+
+    def parse_edges(self):
+        """
+        Parse the edge file into a compact EdgeStore.
+
+        If PARSE_WORKERS is more than 1 and the file is not compressed, it is
+        split into line-aligned byte ranges that are parsed in a pool of worker
+        processes.
+
+        If EDGE_DEDUP is set, edges that join the same nodes with the same edge
+        type (in either direction, for symmetric edge types) are then collapsed
+        into one, according to its policy.
+        """
+        edges = EdgeStore(_EDGE_REMAP.values())
+        if self._parse_in_parallel():
+            for (chunk, line_offset) in self._iter_edge_chunks():
+                edges.extend(chunk, line_offset)
+        else:
+            for row in self.iter_edge_rows():
+                edges.append(*row)
+
+        if self.config()['EDGE_DEDUP'] != 'off':
+            (edges, n_duplicates) = dedup_edges(
+                edges, self.config()['EDGE_DEDUP'], _SYMMETRIC_EDGE_TYPES,
+                run_size=self.config()['DEDUP_RUN_SIZE'],
+            )
+            if n_duplicates:
+                print(f"Collapsed {n_duplicates} duplicate edges")
+
+        if self.config()['EDGE_KEY_SCHEME'] == 'hash':
+            self._check_edge_keys(edges)
+        return edges
+
+
+    def _check_edge_keys(self, edges):
+        """Raise a ParseError if two distinct edges in an EdgeStore have the same hashed key."""
+        collision = find_key_collision(
+            edges, lambda *edge: int(self.edge_key(*edge), 16), DIGEST_SIZE,
+            run_size=self.config()['DEDUP_RUN_SIZE'],
+        )
+        if collision is not None:
+            (ix, first_ix) = collision
+            (line_no, node1, node2, _, edge_type) = edges.row(ix)
+            key = self.edge_key(node1, node2, edge_type)
+            raise ParseError(line_no, f"edge key {key} collides with the edge on line {edges._line[first_ix]}")
+
+
+    def _store_edges(self, rows, edges):
+        """Pass through edge rows, adding each to the EdgeStore `edges`."""
+        for row in rows:
+            edges.append(*row)
+            yield row
+
+
+    def _parse_in_parallel(self):
+        # compressed files cannot be split into byte ranges
+        return self.config()['PARSE_WORKERS'] > 1 and not is_compressed(self.config()['_EDGE_PATH'])
+
+
+    def _iter_edge_chunks(self):
+        """
+        Parse the edge file in a pool of PARSE_WORKERS processes, yielding an
+        (EdgeStore, line_offset) pair for each byte range of the file, in order.
+        Line numbers in each store are relative to its `line_offset`.
+        """
+        workers = self.config()['PARSE_WORKERS']
+        path = self.config()['_EDGE_PATH']
+        # several ranges per worker evens out the load if some ranges parse slower
+        ranges = line_aligned_ranges(path, workers * 4, skip_lines=1)
+        results = map_ranges(
+            _parse_edge_range, path, ranges, workers,
+            expected_col_count=self.config()['_EDGE_FILE_COL_COUNT'],
+            backend=self.config()['PARSE_BACKEND'],
+        )
+
+        phase = self.metrics().phase(self.config()['_EDGE_NAME'])
+        # the header is line 1
+        line_offset = 1
+        for ((start, end), (chunk, error)) in zip(ranges, results):
+            if error is not None:
+                raise ParseError(error.line_no + line_offset, error.reason)
+            phase.add(rows_parsed=len(chunk), bytes_read=end - start)
+            yield (chunk, line_offset)
+            line_offset += len(chunk)
+
+
+    def iter_edges(self, node_ix=None):
+        """
+        Parse the edge file, yielding edge documents one at a time.
+
+        If `node_ix` is supplied, the ID of each node seen is added to it as a key.
+        """
+        if node_ix is None:
+            node_ix = {}
+        return self.edge_docs(_index_nodes(self.iter_edge_rows(), node_ix))
+
+
+    def iter_edge_rows(self):
+        """
+        Parse and validate the edge file, yielding a
+        (line_no, node1, node2, score_text, edge_type) tuple for each edge.
+        """
         # Headers and sample row:
         # node1	node2	edge	edge_descrip	layer_descrip
         # AT1G01370	AT1G57820	4.40001558779779	AraNetv2_log-likelihood-score	AraNetv2-LC_lit-curated-ppi
-        edge_remap = {
-          'AraGWAS-Phenotype_Associations':         'pheno_assn',
-          'AraNetv2-CX_pairwise-gene-coexpression': 'gene_coexpr',
-          'AraNetv2-DC_domain-co-occurrence':       'domain_co_occur',
-          'AraNetv2-HT_high-throughput-ppi':        'ppi_hithru',
-          'AraNetv2-LC_lit-curated-ppi':            'ppi_liter',
-        }
+        if self._parse_in_parallel():
+            for (chunk, line_offset) in self._iter_edge_chunks():
+                for (line_no, *edge) in chunk:
+                    yield (line_no + line_offset, *edge)
+            return
+
+        yield from self.iter_delimited(
+            self.config()['_EDGE_PATH'], self.config()['_EDGE_NAME'], '\t', self.config()['_EDGE_FILE_COL_COUNT'],
+            columns=_EDGE_COLUMNS, enums=_EDGE_ENUMS,
+        )
 
-        # dict of nodes, indexed by node ID (node1 and node2 from the file)
-        node_ix = {}
-        edges = []
-        node_name = self.config()['_NODE_NAME']
-        expected_col_count = self.config()['_EDGE_FILE_COL_COUNT']
-
-        with open(self.config()['_EDGE_PATH']) as fd:
-            csv_reader = csv.reader(fd, delimiter='\t')
-            next(csv_reader, None)  # skip headers
-            line_no = 1
-            for row in csv_reader:
-                line_no += 1
-
-                cols = [c.strip() for c in row]
-                if len(cols) != expected_col_count:
-                    n_cols = len(cols)
-                    raise RuntimeError(f"line {line_no}: expected {expected_col_count} cols, found {n_cols}")
-
-                node_ix[cols[0]] = 1
-                node_ix[cols[1]] = 1
-                edge_type = cols[4]
-                if edge_type not in edge_remap:
-                    raise RuntimeError(f"line {line_no}: invalid edge type: {edge_type}")
-
-                edges.append({
-                    '_key': f'{cols[0]}__{cols[1]}__{edge_remap[edge_type]}__{cols[2]}',
-                    '_from': f'{node_name}/{cols[0]}',
-                    '_to': f'{node_name}/{cols[1]}',
-                    'score': float(cols[2]),
-                    'edge_type': edge_remap[edge_type],
-                })
 
-        return {
-            'nodes': [{'_key': n} for n in node_ix.keys()],
-            'edges': edges,
-        }
+    def edge_key(self, node1, node2, edge_type, score=None):
+        """
+        The _key for an edge. With the 'hash' EDGE_KEY_SCHEME, keys are fixed-width
+        and do not depend on the score, so a re-scored edge replaces the old one.
+        """
+        if self.config()['EDGE_KEY_SCHEME'] == 'hash':
+            return hashed_key(node1, node2, edge_type)
+        return f'{node1}__{node2}__{edge_type}__{score}'
+
+
+    def edge_doc_refs(self, rows):
+        """Build ('line N', edge document) pairs from edge rows, for schema validation."""
+        (rows, doc_rows) = itertools.tee(rows)
+        return zip((f'line {row[0]}' for row in rows), self.edge_docs(doc_rows))
+
+
+    def edge_docs(self, rows):
+        """Build edge documents from (line_no, node1, node2, score_text, edge_type) rows."""
+        node_name = self.config()['_NODE_NAME']
+        for (_, node1, node2, score, edge_type) in rows:
+            yield {
+                '_key': self.edge_key(node1, node2, edge_type, score),
+                '_from': f'{node_name}/{node1}',
+                '_to': f'{node_name}/{node2}',
+                'score': float(score),
+                'edge_type': edge_type,
+            }
 
 
     def load_node_metadata(self):
         """Load node metadata"""
+        return {'nodes': list(self.iter_node_metadata())}
+
 
-        nodes = []
-        expected_col_count = self.config()['_NODE_FILE_COL_COUNT']
-        with open(self.config()['_NODE_PATH']) as fd:
-            csv_reader = csv.reader(fd, delimiter=',')
-            next(csv_reader, None)  # skip headers
-            line_no = 1
-            for row in csv_reader:
-                line_no += 1
-
-                cols = [c.strip() for c in row]
-                if len(cols) != expected_col_count:
-                    n_cols = len(cols)
-                    raise RuntimeError(f"line {line_no}: expected {expected_col_count} cols, found {n_cols}")
-
-                _key = cols[0]
-                node_type = cols[1]
-                if node_type != 'gene' and node_type != 'pheno':
-                    raise RuntimeError(f"line {line_no}: invalid node type: {node_type}")
-
-                go_terms = [c.strip() for c in cols[10].split(',')] if len(cols[10]) else []
-
-                doc = {
-                    '_key': _key,
-                    'node_type': node_type,
-                    'transcript': cols[2],
-                    'gene_symbol': cols[3],
-                    'gene_full_name': cols[4],
-                    'gene_model_type': cols[5],
-                    'tair_computational_desc': cols[6],
-                    'tair_curator_summary': cols[7],
-                    'tair_short_desc': cols[8],
-                    'go_descr': cols[9],
-                    'go_terms': go_terms,
-                    'mapman_bin': cols[11],
-                    'mapman_name': cols[12],
-                    'mapman_desc': cols[13],
-                    'pheno_aragwas_id': cols[14],
-                    'pheno_desc1': cols[15],
-                    'pheno_desc2': cols[16],
-                    'pheno_desc3': cols[17],
-                    'pheno_ref': cols[18],
-                    'user_notes': cols[19],
-                }
-                nodes.append(doc)
-
-        return {'nodes': nodes}
+    def iter_node_metadata(self):
+        """Parse the node metadata file, yielding node documents one at a time."""
+        rows = self.iter_delimited(
+            self.config()['_NODE_PATH'], self.config()['_NODE_NAME'], ',', self.config()['_NODE_FILE_COL_COUNT'],
+            enums=_NODE_ENUMS,
+        )
+        for (_, *values) in rows:
+            go_terms = values[_GO_TERMS_COL]
+            values[_GO_TERMS_COL] = [c.strip() for c in go_terms.split(',')] if len(go_terms) else []
+            yield dict(zip(_NODE_FIELDS, values))
 
 
     def load_cluster_data(self):
         """Annotate genes with cluster ID fields."""
-        nodes = []
+        return {'nodes': list(self.iter_cluster_data())}
+
+
+    def iter_cluster_data(self):
+        """Parse the cluster files, yielding one partial node doc per cluster membership."""
         cluster_paths = self.config()['_CLUSTER_PATHS']
         for (cluster_label, path) in cluster_paths.items():
-            with open(path) as fd:
-                csv_reader = csv.reader(fd, delimiter='\t')
-                for row in csv_reader:
-                    if len(row) > 1:
-                        # remove the 'Cluster' text
-                        cluster_id = row[0].replace('Cluster','')
-                        gene_keys = row[1:]
-                        nodes += [
-                            {'_key': key, cluster_label: int(cluster_id)}
-                            for key in gene_keys
-                        ]
-
-        return {'nodes': nodes}
+            for row in self.iter_rows(path, self.config()['_NODE_NAME'], delimiter='\t'):
+                if len(row) > 1:
+                    # remove the 'Cluster' text
+                    cluster_id = row[0].replace('Cluster','')
+                    gene_keys = row[1:]
+                    for key in gene_keys:
+                        yield {'_key': key, cluster_label: int(cluster_id)}
+
+
+    def assemble_nodes(self, node_ix=None):
+        """
+        Merge the node metadata, the cluster data and the nodes from the edge
+        file (supplied as `node_ix`, an iterable of node IDs such as an
+        EdgeStore's `node_ids`) into a single document per node. The edge file
+        nodes are only added if they are not already in the node data.
+        """
+        nodes = DocAssembler()
+        nodes.add_all(self.iter_node_metadata())
+        nodes.add_all(self.iter_cluster_data())
+        return self.add_edge_nodes(nodes, node_ix or [])
+
+
+    def add_edge_nodes(self, nodes, node_ix):
+        """Add a doc with just a key to a DocAssembler for each node ID in `node_ix` that it does not have."""
+        return nodes.add_all({'_key': n} for n in node_ix if n not in nodes)
+
+
+    def node_doc_refs(self, nodes):
+        """Build ('node KEY', node document) pairs from a DocAssembler, for schema validation."""
+        return ((f"node {doc['_key']}", doc) for doc in nodes.docs())
+
+
+    def check_integrity(self, endpoints=None, nodes=None):
+        """
+        Compare the nodes used by the edges with the keys in the node metadata
+        and cluster files, returning a report of the edge endpoints that are not
+        in either file, and of the node rows that no edge touches.
+
+        `endpoints` is a sized collection of unique node IDs, such as an
+        EdgeStore's `node_ids`; if it is not given, the edge file is parsed.
+        `nodes` is a DocAssembler of the node metadata and cluster data, before
+        the edge file nodes are added; if it is not given, the files are parsed.
+        With INTEGRITY_BLOOM, Bloom filters are used instead of sets, which may
+        leave a few keys out of the report.
+        """
+        if endpoints is None:
+            endpoints = self.parse_edges().node_ids
+        if nodes is None:
+            nodes = self.assemble_nodes()
+        return check_references(endpoints, nodes.keys(), bloom=self.config()['INTEGRITY_BLOOM'])
+
+
+    def _report_integrity(self, endpoints, nodes):
+        """Run the integrity check according to INTEGRITY_CHECK, printing or raising the report."""
+        mode = self.config()['INTEGRITY_CHECK']
+        if mode == 'off':
+            return
+        report = self.check_integrity(endpoints, nodes)
+        if report['dangling_endpoints'] and mode == 'fail':
+            raise IntegrityError(report)
+        for (name, keys) in report.items():
+            if keys:
+                sample = ', '.join(keys[:10]) + (', ...' if len(keys) > 10 else '')
+                print(f"Integrity check: {len(keys)} {name.replace('_', ' ')}: {sample}")
 
 
     def save_dataset(self, dataset):
-
-        if 'nodes' in dataset and len(dataset['nodes']) > 0:
+        """
+        Save the 'nodes' and 'edges' of a dataset. Either may be a list or any
+        other iterable of documents, such as a generator.
+        """
+        if 'nodes' in dataset:
             self.save_docs(self.config()['_NODE_NAME'], dataset['nodes'])
 
-        if 'edges' in dataset and len(dataset['edges']) > 0:
+        if 'edges' in dataset:
             self.save_docs(self.config()['_EDGE_NAME'], dataset['edges'])
 
 
-    def save_docs(self, coll_name, docs, on_dupe='update'):
-
-        resp = requests.put(
-            self.config()['API_URL'] + '/api/v1/documents',
-            params={'collection': coll_name, 'on_duplicate': on_dupe},
-            headers={'Authorization': self.config()['AUTH_TOKEN']},
-            data='\n'.join(json.dumps(d) for d in docs)
-        )
-        if not resp.ok:
-            raise RuntimeError(resp.text)
-
-        print(f"Saved docs to collection {coll_name}!")
-        print(resp.text)
-        print('=' * 80)
-        return resp
+    def _load_graph(self):
+        metrics = self.metrics()
+        edge_name = self.config()['_EDGE_NAME']
+        node_name = self.config()['_NODE_NAME']
+        # parse all the source files before sending anything; the EdgeStore
+        # keeps the edges compact, and edge docs are only built as they are sent
+        with metrics.timed(edge_name):
+            edges = self.parse_edges()
+        with metrics.timed(node_name):
+            nodes = self.assemble_nodes()
+        self._report_integrity(edges.node_ids, nodes)
+        with metrics.timed(node_name):
+            # each node is written exactly once, with all its data merged
+            self.add_edge_nodes(nodes, edges.node_ids)
+
+        # the nodes are already in memory, so they are all checked against their schema before
+        # anything is sent; each edge doc is built once, and checked on its way to save_docs
+        with metrics.timed(node_name):
+            self.check_docs(node_name, self.node_doc_refs(nodes))
+
+        with metrics.timed(edge_name):
+            edge_failures = []
+            self.save_docs(edge_name, self.valid_docs(edge_name, self.edge_doc_refs(edges), edge_failures))
+        if edge_failures:
+            raise SchemaValidationError(edge_name, edge_failures)
+        with metrics.timed(node_name):
+            self.save_docs(node_name, nodes.docs())
+
+
+    def _load_graph_pipelined(self):
+        """
+        Load the edges and nodes with parsing, doc building and uploading all
+        running at once, connected by bounded queues. Edges are sent as they are
+        parsed, so an error late in the edge file leaves the earlier edges saved.
+
+        Docs that do not match their schema are not sent; they are reported in a
+        SchemaValidationError once the rest of the collection has been saved.
+        The edge endpoints are checked against the node data once the edges have
+        been sent, so INTEGRITY_CHECK=fail, which must stop dangling edges from
+        being saved, cannot be used.
+        """
+        node_ix = {}
+        rows = _index_nodes(self.iter_edge_rows(), node_ix)
+        # hashed keys are checked for collisions once all the edges have been seen
+        stored_edges = None
+        if self.config()['EDGE_KEY_SCHEME'] == 'hash':
+            stored_edges = EdgeStore(_EDGE_REMAP.values())
+            rows = self._store_edges(rows, stored_edges)
+        # parse -> build docs -> validate -> serialize and upload (in save_docs)
+        rows = in_thread(rows, maxsize=4, chunk_size=1000)
+        edge_failures = []
+        docs = self.valid_docs(self.config()['_EDGE_NAME'], self.edge_doc_refs(rows), edge_failures)
+        docs = in_thread(docs, maxsize=4, chunk_size=1000)
+
+        metrics = self.metrics()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            # parse the node metadata and cluster files while the edges are uploaded
+            nodes_future = executor.submit(self.assemble_nodes)
+            with metrics.timed(self.config()['_EDGE_NAME']):
+                self.save_docs(self.config()['_EDGE_NAME'], docs)
+            nodes = nodes_future.result()
+        if stored_edges is not None:
+            self._check_edge_keys(stored_edges)
+        if edge_failures:
+            raise SchemaValidationError(self.config()['_EDGE_NAME'], edge_failures)
+        self._report_integrity(list(node_ix), nodes)
+
+        with metrics.timed(self.config()['_NODE_NAME']):
+            self.add_edge_nodes(nodes, node_ix)
+            node_failures = []
+            docs = self.valid_docs(self.config()['_NODE_NAME'], self.node_doc_refs(nodes), node_failures)
+            self.save_docs(self.config()['_NODE_NAME'], docs)
+        if node_failures:
+            raise SchemaValidationError(self.config()['_NODE_NAME'], node_failures)
 
 
     def load_data(self):
-        self.save_dataset(self.load_edges())
-        self.save_dataset(self.load_node_metadata())
-        self.save_dataset(self.load_cluster_data())
+        if self.config()['PIPELINE']:
+            self._load_graph_pipelined()
+        else:
+            self._load_graph()
 
+        self.finish_load()
@@ -0,0 +1,45 @@
+"""
+Merges partial documents from several sources into one document per key.
+"""
+
+
+class DocAssembler(object):
+    """
+    Collects partial documents, merging those that share a `_key`.
+
+    Fields are merged in the order the partial documents are added, so a later
+    value for a field replaces an earlier one -- the same result as saving each
+    partial document in turn with `on_duplicate=update`, but without sending
+    the same document more than once.
+    """
+
+    def __init__(self):
+        self._docs = {}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, key):
+        return key in self._docs
+
+    def add(self, doc):
+        """Merge a single partial document."""
+        key = doc['_key']
+        if key in self._docs:
+            self._docs[key].update(doc)
+        else:
+            self._docs[key] = dict(doc)
+
+    def add_all(self, docs):
+        """Merge each of an iterable of partial documents."""
+        for doc in docs:
+            self.add(doc)
+        return self
+
+    def keys(self):
+        """The keys of the merged documents, in order of first appearance."""
+        return self._docs.keys()
+
+    def docs(self):
+        """Iterate over the merged documents, in order of first appearance."""
+        return iter(self._docs.values())
@@ -0,0 +1,75 @@
+"""
+Records how far each phase of an import has got, so that a failed import
+can be resumed from where it stopped.
+"""
+import hashlib
+import json
+import os
+import time
+
+
+def file_fingerprint(path, sample_size=1024 * 1024):
+    """
+    A cheap fingerprint of a file: its size, modification time and a hash of
+    its first and last `sample_size` bytes.
+    """
+    stat = os.stat(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as fd:
+        digest.update(fd.read(sample_size))
+        if stat.st_size > sample_size:
+            fd.seek(max(sample_size, stat.st_size - sample_size))
+            digest.update(fd.read(sample_size))
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sample_hash': digest.hexdigest()}
+
+
+class Checkpoint(object):
+    """
+    A JSON file recording fingerprints of an import's source files and, for
+    each phase of the import, the number of docs at the start of the phase's
+    doc stream that have been saved.
+
+    When `resume` is true, the recorded progress is loaded, provided that the
+    source files have not changed since it was written; otherwise every phase
+    starts from the beginning. Progress is written at most every
+    `flush_interval` seconds, and at the end of each phase.
+    """
+
+    def __init__(self, path, source_paths, resume=False, flush_interval=5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.sources = {p: file_fingerprint(p) for p in source_paths if os.path.exists(p)}
+        self.phases = {}
+        self._last_flush = 0.0
+        if resume and os.path.exists(path):
+            with open(path) as fd:
+                saved = json.load(fd)
+            if saved['sources'] != self.sources:
+                raise RuntimeError(f"Source files have changed since checkpoint {path} was written; cannot resume")
+            self.phases = saved['phases']
+
+    def saved(self, phase):
+        """The number of docs already saved for a phase."""
+        return self.phases.get(phase, {}).get('docs', 0)
+
+    def is_complete(self, phase):
+        return self.phases.get(phase, {}).get('complete', False)
+
+    def record(self, phase, docs, complete=False):
+        """Record the number of docs saved for a phase."""
+        self.phases[phase] = {'docs': docs, 'complete': complete}
+        if complete or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fd:
+            json.dump({'sources': self.sources, 'phases': self.phases}, fd, indent=2)
+        os.replace(tmp_path, self.path)
+        self._last_flush = time.monotonic()
+
+    def clear(self):
+        """Remove the checkpoint file once the whole import has succeeded."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.phases = {}
@@ -6,16 +6,38 @@ import os
 
 
 REQUIRED = []
-OPTIONAL = ['AUTH_TOKEN', 'API_URL']
+OPTIONAL = [
+    'AUTH_TOKEN', 'API_URL', 'BATCH_SIZE', 'BATCH_SIZE_MAX', 'BATCH_BYTES',
+    'UPLOAD_WORKERS', 'UPLOAD_RETRIES', 'UPLOAD_TIMEOUT', 'UPLOAD_TARGET_LATENCY',
+    'MANIFEST_PATH', 'CHECKPOINT_PATH', 'PARSE_WORKERS', 'PIPELINE',
+    'METRICS_PATH', 'PROFILE_DIR', 'TRACE_MEMORY', 'VALIDATE_DOCS', 'UPLOAD_GZIP', 'PARSE_BACKEND',
+]
 DEFAULTS = {
     'AUTH_TOKEN': 'admin_token',  # test default
     'API_URL': 'http://localhost:5000',  # test default
+    'BATCH_SIZE': 10000,  # initial number of docs per upload request
+    'BATCH_SIZE_MAX': 100000,  # max number of docs per upload request
+    'BATCH_BYTES': 8 * 1024 * 1024,  # max size of an upload request body
+    'UPLOAD_WORKERS': 4,  # number of upload requests to keep in flight
+    'UPLOAD_RETRIES': 5,  # retries per batch for timeouts, 429s and 5xx errors
+    'UPLOAD_TIMEOUT': 300.0,  # seconds
+    'UPLOAD_TARGET_LATENCY': 10.0,  # seconds per request; 0 disables adaptive batch sizes
+    'UPLOAD_GZIP': 0,  # gzip level (1-9) for request bodies; 0 sends them uncompressed
+    'MANIFEST_PATH': '',  # fingerprints of the last load, for incremental re-imports
+    'CHECKPOINT_PATH': '',  # progress of the current load, for resuming after a failure
+    'PARSE_WORKERS': 1,  # number of processes used to parse large source files
+    'PARSE_BACKEND': 'rows',  # 'rows': parse source files a row at a time; 'columnar': a block of rows at a time
+    'PIPELINE': False,  # overlap parsing and uploading rather than parsing everything first
+    'METRICS_PATH': '',  # where to write a JSON report of per-phase import metrics
+    'PROFILE_DIR': '',  # where to write cProfile stats for each phase
+    'TRACE_MEMORY': False,  # measure peak Python memory use per phase with tracemalloc
+    'VALIDATE_DOCS': False,  # check docs against their collection schema before sending them
 }
 
 
-def load_from_env(extra_required=None, extra_optional=None, prefix='RES_'):
+def load_from_env(extra_required=None, extra_optional=None, prefix='RES_', extra_defaults=None):
     """Load all configuration vars from environment variables"""
-    conf = dict(DEFAULTS)
+    conf = dict(DEFAULTS, **(extra_defaults or {}))
     required = list(REQUIRED) + (extra_required or [])
     optional = list(OPTIONAL) + (extra_optional or [])
     for field in required:
@@ -24,5 +46,14 @@ def load_from_env(extra_required=None, extra_optional=None, prefix='RES_'):
             exit(1)
     for field in required + optional:
         if (prefix + field) in os.environ:
-            conf[field] = os.environ[prefix + field]
+            conf[field] = _coerce(os.environ[prefix + field], conf.get(field))
     return conf
+
+
+def _coerce(value, default):
+    """Cast an env var string to the type of its default value, if it has one."""
+    if isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes')
+    if isinstance(default, (int, float)):
+        return type(default)(value)
+    return value
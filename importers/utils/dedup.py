@@ -0,0 +1,171 @@
+"""
+Finds and collapses duplicate edges in an EdgeStore, and finds edges whose
+keys collide, spilling to disk as sorted runs if there are too many edges to
+sort in memory.
+"""
+import heapq
+import os
+import tempfile
+
+from importers.utils.parsing import ParseError
+
+
+# what to do with a set of duplicate edges
+POLICIES = ('max', 'first', 'fail')
+
+# the size of a row index in a spilled run
+_IX_BYTES = 4
+_IX_BITS = 8 * _IX_BYTES
+
+
+def _key_bits(edges):
+    """The number of bits used for a node index and for an edge type code in an edge key."""
+    node_bits = max(1, (len(edges.node_ids) - 1).bit_length())
+    type_bits = max(1, (len(edges.edge_types) - 1).bit_length())
+    return (node_bits, type_bits)
+
+
+def _edge_keys(edges, symmetric_types):
+    """
+    Yield a (key, ix) pair for each edge, where `key` is an int that is equal
+    for two edges if they join the same nodes with the same edge type. For
+    edge types in `symmetric_types`, the direction of the edge is ignored.
+    """
+    (node_bits, type_bits) = _key_bits(edges)
+    symmetric = [t in symmetric_types for t in edges.edge_types]
+    for (ix, (a, b, t)) in enumerate(zip(edges._from, edges._to, edges._type)):
+        if symmetric[t] and b < a:
+            (a, b) = (b, a)
+        yield ((((a << node_bits) | b) << type_bits) | t, ix)
+
+
+def _spill(run, path, key_bytes):
+    record_size = key_bytes + _IX_BYTES
+    with open(path, 'wb') as fd:
+        fd.write(b''.join(record.to_bytes(record_size, 'big') for record in run))
+
+
+def _read_run(path, key_bytes, block_records=65536):
+    record_size = key_bytes + _IX_BYTES
+    with open(path, 'rb') as fd:
+        while True:
+            block = fd.read(record_size * block_records)
+            if not block:
+                return
+            for start in range(0, len(block), record_size):
+                yield int.from_bytes(block[start:start + record_size], 'big')
+
+
+def _sorted_pairs(pairs, n_pairs, key_bytes, run_size, tmp_dir):
+    """
+    Yield `n_pairs` (key, ix) pairs in sorted order, where each key is an int
+    of up to `key_bytes` bytes. If there are more than `run_size`, they are
+    sorted in runs of `run_size` which are written to files in `tmp_dir`,
+    then merged.
+
+    Each pair is packed into a single int while it is sorted, which takes
+    about a third of the memory of a tuple of two ints.
+    """
+    records = ((key << _IX_BITS) | ix for (key, ix) in pairs)
+    if n_pairs <= run_size:
+        merged = sorted(records)
+    else:
+        paths = []
+        run = []
+        for record in records:
+            run.append(record)
+            if len(run) >= run_size:
+                paths.append(os.path.join(tmp_dir, f'run.{len(paths)}'))
+                run.sort()
+                _spill(run, paths[-1], key_bytes)
+                run = []
+        if run:
+            paths.append(os.path.join(tmp_dir, f'run.{len(paths)}'))
+            run.sort()
+            _spill(run, paths[-1], key_bytes)
+        del run
+        merged = heapq.merge(*(_read_run(path, key_bytes) for path in paths))
+    mask = (1 << _IX_BITS) - 1
+    for record in merged:
+        yield (record >> _IX_BITS, record & mask)
+
+
+def _sorted_keys(edges, symmetric_types, run_size, tmp_dir):
+    """Yield the (key, ix) pairs for all the edges in sorted order; see _sorted_pairs."""
+    (node_bits, type_bits) = _key_bits(edges)
+    key_bytes = (2 * node_bits + type_bits + 7) // 8
+    return _sorted_pairs(_edge_keys(edges, symmetric_types), len(edges), key_bytes, run_size, tmp_dir)
+
+
+def find_key_collision(edges, key_of, key_bytes, run_size=1000000):
+    """
+    Look for two edges in an EdgeStore that have the same key, as given by
+    `key_of(node1, node2, edge_type)`, an int of up to `key_bytes` bytes, but
+    that join different nodes or have different edge types. Repeats of the
+    same edge are not collisions.
+
+    Returns an (ix, first_ix) pair for the earliest edge that collides with an
+    edge before it, and the first edge with its key, or None if there are no
+    collisions. Memory use for the sort is bounded as in `dedup_edges`.
+    """
+    keys = (
+        (key_of(edges.node_ids[a], edges.node_ids[b], edges.edge_types[t]), ix)
+        for (ix, (a, b, t)) in enumerate(zip(edges._from, edges._to, edges._type))
+    )
+
+    def identity(ix):
+        return (edges._from[ix], edges._to[ix], edges._type[ix])
+
+    collision = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        (group_key, first) = (None, None)
+        for (key, ix) in _sorted_pairs(keys, len(edges), key_bytes, run_size, tmp_dir):
+            if key != group_key:
+                (group_key, first) = (key, ix)
+                continue
+            # within a group, edges come in their original order
+            if identity(ix) != identity(first) and (collision is None or ix < collision[0]):
+                collision = (ix, first)
+    return collision
+
+
+def dedup_edges(edges, policy, symmetric_types=(), run_size=1000000):
+    """
+    Collapse the edges in an EdgeStore that join the same nodes with the same
+    edge type, ignoring direction for the edge types in `symmetric_types`.
+    Returns a (deduped_edges, n_duplicates) pair, where `deduped_edges` is a
+    new EdgeStore holding the surviving edges in their original order.
+
+    With the 'max' policy, the edge with the highest score is kept; with
+    'first', the one that comes first; with 'fail', a ParseError is raised
+    for the first duplicate found. Ties go to the edge that comes first.
+
+    Memory use for the sort is bounded by `run_size` edges at a time; larger
+    edge sets are sorted in runs that are spilled to temporary files.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Invalid dedup policy: {policy}")
+
+    # one flag per edge, rather than a dict of keys
+    keep = bytearray(len(edges))
+    n_duplicates = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        (group_key, best) = (None, None)
+        for (key, ix) in _sorted_keys(edges, symmetric_types, run_size, tmp_dir):
+            if key != group_key:
+                if best is not None:
+                    keep[best] = 1
+                (group_key, best) = (key, ix)
+                continue
+            # a duplicate; within a group, edges come in their original order
+            n_duplicates += 1
+            if policy == 'fail':
+                raise ParseError(edges._line[ix], f"duplicate of the edge on line {edges._line[best]}")
+            if policy == 'max' and edges._score[ix] > edges._score[best]:
+                best = ix
+        if best is not None:
+            keep[best] = 1
+
+    if not n_duplicates:
+        return (edges, 0)
+    return (edges.select(keep), n_duplicates)
@@ -0,0 +1,105 @@
+"""
+A compact, column-oriented store for parsed edges.
+"""
+import itertools
+from array import array
+
+
+class EdgeStore(object):
+    """
+    Holds parsed edges as parallel arrays rather than one dict per edge.
+
+    Node IDs are interned and referenced by integer index, scores are kept as
+    doubles and edge types as small integer codes into `edge_types`, so each
+    edge costs about 21 bytes plus its node IDs' share of the intern table.
+    The source line number of each edge is kept for error reporting.
+
+    Scores are stored as floats; the original text of a score is kept only when
+    it does not round-trip through `repr(float(text))` (e.g. '2.50'), so that
+    anything derived from the text, such as a document key, is unchanged.
+    """
+
+    def __init__(self, edge_types):
+        self.edge_types = list(edge_types)
+        self._type_codes = {t: code for (code, t) in enumerate(self.edge_types)}
+        self.node_ids = []
+        self._node_ix = {}
+        self._from = array('I')
+        self._to = array('I')
+        self._score = array('d')
+        self._type = array('B')
+        self._line = array('I')
+        self._score_text = {}
+
+    def __len__(self):
+        return len(self._score)
+
+    def intern(self, node_id):
+        """Return the integer index for a node ID, adding it if it is new."""
+        ix = self._node_ix.get(node_id)
+        if ix is None:
+            ix = self._node_ix[node_id] = len(self.node_ids)
+            self.node_ids.append(node_id)
+        return ix
+
+    def append(self, line_no, node1, node2, score_text, edge_type):
+        """Add an edge; `edge_type` must be one of `edge_types`."""
+        # look these up first so that a bad value leaves the store unchanged
+        type_code = self._type_codes[edge_type]
+        score = float(score_text)
+        if repr(score) != score_text:
+            self._score_text[len(self._score)] = score_text
+        self._from.append(self.intern(node1))
+        self._to.append(self.intern(node2))
+        self._score.append(score)
+        self._type.append(type_code)
+        self._line.append(line_no)
+
+    def extend(self, other, line_offset=0):
+        """
+        Append all the edges from another EdgeStore, adding `line_offset` to
+        their line numbers.
+        """
+        node_remap = [self.intern(n) for n in other.node_ids]
+        type_remap = [self._type_codes[t] for t in other.edge_types]
+        base = len(self)
+        self._from.extend(node_remap[ix] for ix in other._from)
+        self._to.extend(node_remap[ix] for ix in other._to)
+        self._score.extend(other._score)
+        self._type.extend(type_remap[code] for code in other._type)
+        self._line.extend(line_no + line_offset for line_no in other._line)
+        self._score_text.update((base + ix, text) for (ix, text) in other._score_text.items())
+
+    def select(self, keep):
+        """
+        A new EdgeStore holding the edges whose entries in `keep` (a sequence
+        of flags, one per edge) are true, in the same order. The node table is
+        shared with this store, so it should no longer be changed.
+        """
+        selected = EdgeStore(self.edge_types)
+        selected.node_ids = self.node_ids
+        selected._node_ix = self._node_ix
+        for name in ('_from', '_to', '_score', '_type', '_line'):
+            getattr(selected, name).extend(itertools.compress(getattr(self, name), keep))
+        kept = itertools.compress(range(len(self)), keep)
+        selected._score_text = {
+            new_ix: self._score_text[ix] for (new_ix, ix) in enumerate(kept) if ix in self._score_text
+        }
+        return selected
+
+    def row(self, ix):
+        """The edge at index `ix`, as a (line_no, node1, node2, score_text, edge_type) tuple."""
+        score_text = self._score_text.get(ix)
+        if score_text is None:
+            score_text = repr(self._score[ix])
+        return (
+            self._line[ix],
+            self.node_ids[self._from[ix]],
+            self.node_ids[self._to[ix]],
+            score_text,
+            self.edge_types[self._type[ix]],
+        )
+
+    def __iter__(self):
+        """Iterate over the edges as (line_no, node1, node2, score_text, edge_type) tuples."""
+        return (self.row(ix) for ix in range(len(self)))
@@ -0,0 +1,102 @@
+"""
+Writes documents to sharded JSONL files for loading with `arangoimport`,
+as an alternative to sending them through the RE API.
+"""
+import gzip
+import hashlib
+import json
+import os
+
+
+class BulkExporter(object):
+    """
+    Writes each collection's documents to a series of JSONL shards under
+    `out_dir`, with at most `shard_size` docs per shard, optionally gzipped.
+
+    `write_manifest` records the doc count, size and sha256 checksum of every
+    shard in `out_dir/manifest.json`. Each shard can be loaded with e.g.
+
+        arangoimport --type jsonl --collection <coll> --on-duplicate <on_duplicate> --file <shard>
+    """
+
+    def __init__(self, out_dir, shard_size=1000000, compress=False):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.compress = compress
+        self.collections = {}
+
+    def export(self, coll_name, docs, on_dupe='update'):
+        """Write an iterable of documents to shards for a collection; returns the doc count."""
+        coll = self.collections.setdefault(coll_name, {'docs': 0, 'on_duplicate': on_dupe, 'shards': []})
+        os.makedirs(os.path.join(self.out_dir, coll_name), exist_ok=True)
+        count = 0
+        shard = None
+        for doc in docs:
+            if shard is None:
+                shard = _Shard(self._shard_path(coll_name, len(coll['shards'])), self.compress)
+            shard.write(json.dumps(doc).encode() + b'\n')
+            count += 1
+            if shard.docs >= self.shard_size:
+                coll['shards'].append(shard.close(self.out_dir))
+                shard = None
+        if shard is not None:
+            coll['shards'].append(shard.close(self.out_dir))
+        coll['docs'] += count
+        return count
+
+    def write_manifest(self):
+        """Write manifest.json, describing every shard written so far."""
+        path = os.path.join(self.out_dir, 'manifest.json')
+        with open(path, 'w') as fd:
+            json.dump({'collections': self.collections}, fd, indent=2)
+        return path
+
+    def _shard_path(self, coll_name, shard_no):
+        ext = '.jsonl.gz' if self.compress else '.jsonl'
+        return os.path.join(self.out_dir, coll_name, f'{coll_name}.{shard_no:05d}{ext}')
+
+
+class _Shard(object):
+    """A single output file, checksummed as it is written."""
+
+    def __init__(self, path, compress):
+        self.path = path
+        self.docs = 0
+        self._raw = open(path, 'wb')
+        self._hash = hashlib.sha256()
+        self._fd = gzip.GzipFile(fileobj=_HashingWriter(self._raw, self._hash), mode='wb') if compress else None
+
+    def write(self, line):
+        if self._fd is None:
+            self._hash.update(line)
+            self._raw.write(line)
+        else:
+            self._fd.write(line)
+        self.docs += 1
+
+    def close(self, base_dir):
+        """Close the file and return its manifest entry."""
+        if self._fd is not None:
+            self._fd.close()
+        self._raw.close()
+        return {
+            'path': os.path.relpath(self.path, base_dir),
+            'docs': self.docs,
+            'bytes': os.path.getsize(self.path),
+            'sha256': self._hash.hexdigest(),
+        }
+
+
+class _HashingWriter(object):
+    """A minimal file-like object that hashes bytes on their way to the real file."""
+
+    def __init__(self, fd, hasher):
+        self._fd = fd
+        self._hash = hasher
+
+    def write(self, data):
+        self._hash.update(data)
+        return self._fd.write(data)
+
+    def flush(self):
+        self._fd.flush()
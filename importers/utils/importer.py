@@ -0,0 +1,305 @@
+"""
+A base class for importers, with the parts of a load that do not depend on
+the data source: configuration from env vars, streaming parsers for
+delimited source files, schema validation, batched uploads over a pool of
+connections (or exports to files), incremental loads, checkpointing and
+per-phase metrics.
+
+An importer subclasses `Importer`, setting the collections it loads and
+any env vars of its own, and adding its source paths to the configuration
+in `configure`. It parses its sources with `iter_delimited` or `iter_rows`
+into documents (merging partial documents with a DocAssembler if need be),
+passes them to `check_docs` or `valid_docs` and then `save_docs`, and ends
+the load with `finish_load`.
+"""
+import csv
+import itertools
+import json
+import os
+
+import importers.utils.config as config
+from importers.utils.checkpoint import Checkpoint
+from importers.utils.columnar import parse_blocks
+from importers.utils.manifest import DeltaManifest
+from importers.utils.metrics import ImportMetrics, counted, peak_rss_kb
+from importers.utils.parsing import open_text, parse_rows
+from importers.utils.schema import SchemaValidationError, SchemaValidator
+from importers.utils.upload import batch_docs, AdaptiveBatchSize, BatchUploader
+
+
+# functions for each PARSE_BACKEND, which give the same results
+PARSE_BACKENDS = {
+    'rows': parse_rows,
+    'columnar': parse_blocks,
+}
+
+
+def parse_delimited(lines, delimiter, expected_col_count, first_line_no=1, columns=None, enums=None, backend='rows'):
+    """
+    Parse and check delimited rows with one of the PARSE_BACKENDS, yielding
+    a (line_no, *values) tuple for each; see `importers.utils.parsing.parse_rows`.
+    """
+    return PARSE_BACKENDS[backend](lines, delimiter, expected_col_count, first_line_no, columns, enums)
+
+
+class Importer(object):
+
+    # env vars used by the importer in addition to those in importers.utils.config
+    REQUIRED_CONFIG = []
+    OPTIONAL_CONFIG = []
+    # default values for OPTIONAL_CONFIG vars, which also set their types
+    CONFIG_DEFAULTS = {}
+    # the directory of the yaml schemas for the collections the importer loads
+    SCHEMA_DIR = None
+    # the names of the collections the importer loads
+    COLLECTIONS = []
+
+    def __init__(self, exporter=None, resume=False):
+        # if set, docs are written to files by this BulkExporter instead of being uploaded
+        self.exporter = exporter
+        # whether to pick up from the progress recorded at CHECKPOINT_PATH
+        self.resume = resume
+
+    def config(self):
+        if not hasattr(self, '_config'):
+            return self._configure()
+
+        return self._config
+
+    def _configure(self):
+        configuration = config.load_from_env(
+            extra_required=self.REQUIRED_CONFIG,
+            extra_optional=self.OPTIONAL_CONFIG,
+            extra_defaults=self.CONFIG_DEFAULTS,
+        )
+        if configuration['PARSE_BACKEND'] not in PARSE_BACKENDS:
+            raise ValueError(f"Invalid PARSE_BACKEND: {configuration['PARSE_BACKEND']}")
+
+        configuration['_SCHEMA_PATHS'] = {
+            name: os.path.join(self.SCHEMA_DIR, name + '.yaml') for name in self.COLLECTIONS
+        }
+        self.configure(configuration)
+        self._config = configuration
+        return self._config
+
+    def configure(self, configuration):
+        """
+        Check the importer's own settings in `configuration`, and add any that
+        are derived from them, such as the paths of the source files.
+        """
+
+    def source_paths(self):
+        """The paths of the source files, which a checkpoint is tied to."""
+        return []
+
+
+    def iter_rows(self, path, phase_name, delimiter=',', skip_lines=0):
+        """
+        Read the rows of a delimited source file, which may be compressed,
+        counting the rows and bytes read in the metrics for `phase_name`.
+        """
+        phase = self.metrics().phase(phase_name)
+        with open_text(path, phase) as fd:
+            for _ in range(skip_lines):
+                fd.readline()
+            yield from counted(csv.reader(fd, delimiter=delimiter), phase)
+
+
+    def iter_delimited(self, path, phase_name, delimiter, expected_col_count,
+                       columns=None, enums=None, skip_lines=1):
+        """
+        Parse and check the rows of a delimited source file, which may be
+        compressed, with the PARSE_BACKEND, yielding a (line_no, *values) tuple
+        for each; see `importers.utils.parsing.parse_rows`. The first `skip_lines`
+        lines (the headers, by default) are skipped.
+        """
+        phase = self.metrics().phase(phase_name)
+        with open_text(path, phase) as fd:
+            for _ in range(skip_lines):
+                fd.readline()
+            rows = parse_delimited(
+                fd, delimiter, expected_col_count, first_line_no=skip_lines + 1,
+                columns=columns, enums=enums, backend=self.config()['PARSE_BACKEND'],
+            )
+            yield from counted(rows, phase)
+
+
+    def uploader(self):
+        if not hasattr(self, '_uploader'):
+            conf = self.config()
+            batch_size = AdaptiveBatchSize(
+                conf['BATCH_SIZE'],
+                maximum=conf['BATCH_SIZE_MAX'],
+                target_latency=conf['UPLOAD_TARGET_LATENCY'],
+            )
+            self._uploader = BatchUploader(
+                conf['API_URL'],
+                conf['AUTH_TOKEN'],
+                workers=conf['UPLOAD_WORKERS'],
+                batch_size=batch_size,
+                retries=conf['UPLOAD_RETRIES'],
+                timeout=conf['UPLOAD_TIMEOUT'],
+                gzip_level=conf['UPLOAD_GZIP'],
+            )
+
+        return self._uploader
+
+
+    def manifest(self):
+        """The DeltaManifest for incremental loads, or None if MANIFEST_PATH is not set."""
+        if not hasattr(self, '_manifest'):
+            path = self.config()['MANIFEST_PATH']
+            self._manifest = DeltaManifest(path) if path else None
+
+        return self._manifest
+
+
+    def checkpoint(self):
+        """The Checkpoint for resumable uploads, or None if CHECKPOINT_PATH is not set."""
+        if not hasattr(self, '_checkpoint'):
+            path = self.config()['CHECKPOINT_PATH']
+            self._checkpoint = None
+            if path and self.exporter is None:
+                self._checkpoint = Checkpoint(path, self.source_paths(), resume=self.resume)
+
+        return self._checkpoint
+
+
+    def validator(self, coll_name):
+        """The SchemaValidator for a collection, or None if VALIDATE_DOCS is off."""
+        if not hasattr(self, '_validators'):
+            self._validators = {}
+        if not self.config()['VALIDATE_DOCS']:
+            return None
+        if coll_name not in self._validators:
+            self._validators[coll_name] = SchemaValidator(
+                self.config()['_SCHEMA_PATHS'][coll_name],
+                workers=self.config()['PARSE_WORKERS'],
+            )
+
+        return self._validators[coll_name]
+
+
+    def check_docs(self, coll_name, items):
+        """
+        Validate (ref, doc) pairs against the collection's schema, raising a
+        SchemaValidationError that lists every doc that fails.
+        """
+        validator = self.validator(coll_name)
+        if validator is None:
+            return
+        failures = validator.errors(items)
+        if failures:
+            raise SchemaValidationError(coll_name, failures)
+        print(f"Validated docs for collection {coll_name}")
+
+
+    def valid_docs(self, coll_name, items, failures):
+        """
+        Yield the docs from (ref, doc) pairs that match the collection's schema,
+        adding a (ref, reason) pair to `failures` for each of the others.
+        """
+        validator = self.validator(coll_name)
+        if validator is None:
+            return (doc for (_, doc) in items)
+        return validator.iter_valid(items, failures)
+
+
+    def metrics(self):
+        if not hasattr(self, '_metrics'):
+            self._metrics = ImportMetrics(
+                profile_dir=self.config()['PROFILE_DIR'] or None,
+                trace_memory=self.config()['TRACE_MEMORY'],
+            )
+
+        return self._metrics
+
+
+    def save_docs(self, coll_name, docs, on_dupe='update'):
+        """
+        Save an iterable of documents to a collection.
+
+        Documents are serialized and sent in batches capped by BATCH_BYTES and
+        by a doc count that starts at BATCH_SIZE and adapts to the API's response
+        times, with up to UPLOAD_WORKERS batches in flight at once, so memory use
+        does not grow with the number of documents.
+
+        If MANIFEST_PATH is set, only docs that are new or have changed since
+        the last successful load are sent. If the importer has an exporter, the
+        docs are written to its files rather than sent to the API.
+
+        If CHECKPOINT_PATH is set, progress through `docs` is recorded there as
+        batches are saved; when resuming, docs that were already saved are skipped.
+        """
+        if self.manifest():
+            docs = self.manifest().changed(coll_name, docs)
+
+        phase = self.metrics().phase(coll_name)
+        if self.exporter is not None:
+            count = self.exporter.export(coll_name, docs, on_dupe)
+            phase.add(docs_serialized=count)
+            print(f"Exported {count} docs for collection {coll_name}")
+            return {'exported': count}
+
+        checkpoint = self.checkpoint()
+        on_progress = None
+        if checkpoint:
+            if checkpoint.is_complete(coll_name):
+                # consume the docs anyway, so that the manifest sees them all
+                for _ in docs:
+                    pass
+                print(f"Skipping collection {coll_name}: already saved")
+                return {}
+            n_saved = checkpoint.saved(coll_name)
+            if n_saved:
+                print(f"Resuming collection {coll_name}: skipping {n_saved} docs already saved")
+                docs = itertools.islice(docs, n_saved, None)
+
+            def record_progress(n_docs):
+                checkpoint.record(coll_name, n_saved + n_docs)
+            on_progress = record_progress
+
+        uploader = self.uploader()
+        batches = batch_docs(docs, uploader.batch_size, self.config()['BATCH_BYTES'])
+        try:
+            totals = uploader.upload(
+                coll_name, batches, params={'on_duplicate': on_dupe},
+                on_progress=on_progress, metrics=phase,
+            )
+        finally:
+            if checkpoint:
+                # make sure the latest progress is on disk, even if the upload failed
+                checkpoint.flush()
+        if checkpoint:
+            checkpoint.record(coll_name, checkpoint.saved(coll_name), complete=True)
+
+        print(f"Saved docs to collection {coll_name}!")
+        print(json.dumps(totals))
+        print('=' * 80)
+        return totals
+
+
+    def finish_load(self):
+        """
+        Wrap up a successful load: write the export and delta manifests, clear
+        the checkpoint, and report the metrics.
+        """
+        if self.exporter is not None:
+            print(f"Export manifest written to {self.exporter.write_manifest()}")
+
+        manifest = self.manifest()
+        if manifest:
+            # the RE API cannot delete documents, so list them for removal
+            deleted_path = manifest.path + '.deleted.json'
+            manifest.save_deleted(deleted_path)
+            print(f"Changes since the last load: {json.dumps(manifest.summary())}")
+            print(f"Keys of deleted docs written to {deleted_path}")
+            manifest.save()
+
+        if self.checkpoint():
+            self.checkpoint().clear()
+
+        print(f"Import metrics: {json.dumps(self.metrics().report(), indent=2)}")
+        print(f"Peak RSS of the import: {peak_rss_kb()} KiB")
+        if self.config()['METRICS_PATH']:
+            self.metrics().write_report(self.config()['METRICS_PATH'])
@@ -0,0 +1,85 @@
+"""
+Checks that the edges of a graph only refer to nodes that exist, before
+anything is loaded.
+"""
+import hashlib
+import math
+
+
+class BloomFilter(object):
+    """
+    A set of strings that may report false positives (at a rate of about
+    `error_rate` once `capacity` items have been added) but never false
+    negatives, in a fixed amount of memory: about 1.2 bytes per item at the
+    default error rate, compared with over 50 for a set of short strings.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(1, capacity)
+        self.n_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+
+    def _positions(self, item):
+        # derive all the hashes from one digest ("double hashing")
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.n_bits for i in range(self.n_hashes))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class IntegrityError(RuntimeError):
+    """Raised when edges refer to nodes that are not in the node data."""
+
+    def __init__(self, report, max_listed=100):
+        self.report = report
+        dangling = report['dangling_endpoints']
+        lines = [f"{len(dangling)} edge endpoint(s) are not in the node data:"]
+        lines += [f"  {key}" for key in dangling[:max_listed]]
+        if len(dangling) > max_listed:
+            lines.append(f"  ... and {len(dangling) - max_listed} more")
+        super().__init__('\n'.join(lines))
+
+
+def check_references(endpoints, node_keys, bloom=False, error_rate=0.001):
+    """
+    Compare the node IDs used by a set of edges with the keys of the nodes in
+    the node data, returning a report of:
+
+        dangling_endpoints: edge endpoints that are not in the node data
+        unused_nodes: nodes in the node data that no edge refers to
+
+    both sorted. `endpoints` and `node_keys` must be sized collections of
+    unique IDs, such as an EdgeStore's `node_ids` and a DocAssembler's `keys()`.
+
+    With `bloom`, each side is looked up in a Bloom filter, sized from its
+    length, rather than in a set built from it. This saves the memory of the
+    two sets, but not of the inputs themselves, and each list may miss a few
+    entries: a key is only reported if it is certainly missing from the other
+    side.
+    """
+    if not bloom:
+        node_set = set(node_keys)
+        endpoint_set = set(endpoints)
+        return {
+            'dangling_endpoints': sorted(endpoint_set - node_set),
+            'unused_nodes': sorted(node_set - endpoint_set),
+        }
+
+    endpoint_filter = BloomFilter(len(endpoints), error_rate)
+    for key in endpoints:
+        endpoint_filter.add(key)
+    node_filter = BloomFilter(len(node_keys), error_rate)
+    for key in node_keys:
+        node_filter.add(key)
+    return {
+        'dangling_endpoints': sorted(key for key in endpoints if key not in node_filter),
+        'unused_nodes': sorted(key for key in node_keys if key not in endpoint_filter),
+    }
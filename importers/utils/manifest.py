@@ -0,0 +1,210 @@
+"""
+Tracks content fingerprints of imported documents so that re-imports only
+send the documents that have changed since the last successful load.
+"""
+import bisect
+import hashlib
+import json
+import os
+import tempfile
+
+from importers.utils.dedup import _IX_BYTES, _sorted_pairs
+from importers.utils.keys import DIGEST_SIZE
+
+# the number of bytes in a content fingerprint; it is only compared against the
+# fingerprint of a doc with the same _key, so 64 bits is plenty
+FINGERPRINT_SIZE = 8
+
+# a key digest and a fingerprint, as held for the current load
+_PAIR_SIZE = DIGEST_SIZE + FINGERPRINT_SIZE
+# a key digest, a fingerprint and the line of the key in the keys file, as saved
+_RECORD_SIZE = _PAIR_SIZE + _IX_BYTES
+
+
+def _digest(content, digest_size):
+    return hashlib.blake2b(content, digest_size=digest_size).digest()
+
+
+def _fingerprint(doc):
+    content = json.dumps(doc, sort_keys=True, separators=(',', ':')).encode()
+    return _digest(content, FINGERPRINT_SIZE)
+
+
+def fingerprint(doc):
+    """A short, stable hash of a document's content."""
+    return _fingerprint(doc).hex()
+
+
+def _read_records(path, block_records=65536):
+    with open(path, 'rb') as fd:
+        while True:
+            block = fd.read(_RECORD_SIZE * block_records)
+            if not block:
+                return
+            for start in range(0, len(block), _RECORD_SIZE):
+                yield block[start:start + _RECORD_SIZE]
+
+
+class _KeyDigests(object):
+    """The key digests in a block of saved records, as a sequence that can be bisected."""
+
+    def __init__(self, records):
+        self.records = records
+
+    def __len__(self):
+        return len(self.records) // _RECORD_SIZE
+
+    def __getitem__(self, ix):
+        start = ix * _RECORD_SIZE
+        return self.records[start:start + DIGEST_SIZE]
+
+    def fingerprint(self, ix):
+        start = ix * _RECORD_SIZE + DIGEST_SIZE
+        return self.records[start:start + FINGERPRINT_SIZE]
+
+
+class DeltaManifest(object):
+    """
+    Fingerprints of the documents saved by the last successful load.
+
+    `path` is a small JSON file giving the generation of the last load and the
+    collections that it saved. For each collection, `<path>.<generation>.<coll>.fp`
+    holds fixed-width records of a key digest, a content fingerprint and the
+    line of the key in `<path>.<generation>.<coll>.keys`, sorted by key digest.
+    Only the records are held in memory, at 24 bytes a document; the keys are
+    read back to list the deleted documents.
+
+    Pass each collection's documents through `changed` during a load, then call
+    `save` once the load has succeeded; a failed load leaves the previous
+    manifest in place, so the next run re-sends everything that did not make it.
+    This load's records are sorted in runs of `run_size`, as in `dedup_edges`.
+    """
+
+    def __init__(self, path, run_size=1000000):
+        self.path = path
+        self.run_size = run_size
+        self.generation = 0
+        self.previous = {}
+        self.current = {}
+        self.counts = {}
+        self._written = set()
+        self._deleted = {}
+        if os.path.exists(path):
+            with open(path) as fd:
+                index = json.load(fd)
+            self.generation = index['generation']
+            for coll_name in index['collections']:
+                with open(self._path(self.generation, coll_name, 'fp'), 'rb') as fd:
+                    self.previous[coll_name] = fd.read()
+
+    def _path(self, generation, coll_name, ext):
+        return f'{self.path}.{generation}.{coll_name}.{ext}'
+
+    def changed(self, coll_name, docs):
+        """Yield the docs that are new or have changed since the last load."""
+        previous = _KeyDigests(self.previous.get(coll_name, b''))
+        n_previous = len(previous)
+        mode = 'a' if coll_name in self.current else 'w'
+        current = self.current.setdefault(coll_name, bytearray())
+        counts = self.counts.setdefault(coll_name, {'inserted': 0, 'updated': 0, 'unchanged': 0})
+        self._written.discard(coll_name)
+        self._deleted.pop(coll_name, None)
+        with open(self._path(self.generation + 1, coll_name, 'keys'), mode) as keys_fd:
+            for doc in docs:
+                key = doc['_key']
+                key_digest = _digest(key.encode(), DIGEST_SIZE)
+                fp = _fingerprint(doc)
+                current += key_digest + fp
+                keys_fd.write(key + '\n')
+                ix = bisect.bisect_left(previous, key_digest, 0, n_previous)
+                if ix == n_previous or previous[ix] != key_digest:
+                    counts['inserted'] += 1
+                    yield doc
+                elif previous.fingerprint(ix) != fp:
+                    counts['updated'] += 1
+                    yield doc
+                else:
+                    counts['unchanged'] += 1
+
+    def _write_records(self, coll_name):
+        """Sort this load's records for a collection by key digest and write them out, once."""
+        path = self._path(self.generation + 1, coll_name, 'fp')
+        if coll_name in self._written:
+            return path
+        current = self.current[coll_name]
+        pairs = (
+            (int.from_bytes(current[start:start + _PAIR_SIZE], 'big'), ix)
+            for (ix, start) in enumerate(range(0, len(current), _PAIR_SIZE))
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir, open(path, 'wb') as fd:
+            sorted_pairs = _sorted_pairs(pairs, len(current) // _PAIR_SIZE, _PAIR_SIZE, self.run_size, tmp_dir)
+            for (pair, line_no) in sorted_pairs:
+                fd.write(pair.to_bytes(_PAIR_SIZE, 'big') + line_no.to_bytes(_IX_BYTES, 'big'))
+        self._written.add(coll_name)
+        return path
+
+    def deleted(self, coll_name):
+        """Keys that were saved by the last load but are absent from this one."""
+        if coll_name in self._deleted:
+            return self._deleted[coll_name]
+
+        # walk the two sorted sets of records together for the lines of the deleted keys
+        current = _read_records(self._write_records(coll_name)) if coll_name in self.current else iter(())
+        record = next(current, None)
+        previous = self.previous.get(coll_name, b'')
+        line_nos = []
+        for start in range(0, len(previous), _RECORD_SIZE):
+            key_digest = previous[start:start + DIGEST_SIZE]
+            while record is not None and record[:DIGEST_SIZE] < key_digest:
+                record = next(current, None)
+            if record is None or record[:DIGEST_SIZE] != key_digest:
+                line_nos.append(int.from_bytes(previous[start + _PAIR_SIZE:start + _RECORD_SIZE], 'big'))
+
+        keys = []
+        if line_nos:
+            line_nos.sort()
+            with open(self._path(self.generation, coll_name, 'keys')) as fd:
+                for (line_no, key) in enumerate(fd):
+                    if line_no == line_nos[len(keys)]:
+                        keys.append(key[:-1])
+                        if len(keys) == len(line_nos):
+                            break
+        self._deleted[coll_name] = keys
+        return keys
+
+    def summary(self):
+        """Per-collection counts of inserted, updated, unchanged and deleted docs."""
+        return {
+            coll_name: dict(counts, deleted=len(self.deleted(coll_name)))
+            for (coll_name, counts) in self.counts.items()
+        }
+
+    def save_deleted(self, path):
+        """Write the deleted keys for each collection to a JSON file."""
+        deleted = {coll_name: self.deleted(coll_name) for coll_name in self.current}
+        with open(path, 'w') as fd:
+            json.dump({k: v for (k, v) in deleted.items() if v}, fd, indent=2)
+        return deleted
+
+    def save(self):
+        """Replace the stored fingerprints with those seen in this load."""
+        generation = self.generation + 1
+        for coll_name in self.current:
+            self._write_records(coll_name)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fd:
+            json.dump({'generation': generation, 'collections': sorted(self.current)}, fd)
+        os.replace(tmp_path, self.path)
+        # the last load's files are no longer referenced
+        for coll_name in self.previous:
+            for ext in ('fp', 'keys'):
+                os.remove(self._path(self.generation, coll_name, ext))
+
+        self.generation = generation
+        self.previous = {}
+        for coll_name in self.current:
+            with open(self._path(generation, coll_name, 'fp'), 'rb') as fd:
+                self.previous[coll_name] = fd.read()
+        self.current = {}
+        self._written = set()
+        self._deleted = {}
@@ -0,0 +1,188 @@
+"""
+Collects per-phase throughput and memory metrics for importers.
+"""
+import contextlib
+import cProfile
+import io
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+
+# upper bounds, in milliseconds, of the request latency histogram buckets
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+
+
+class PhaseMetrics(object):
+    """Counters for one phase of an import; safe to update from several threads."""
+
+    def __init__(self, name):
+        self.name = name
+        self.elapsed = 0.0
+        self.counts = {
+            'rows_parsed': 0,
+            'bytes_read': 0,
+            'docs_serialized': 0,
+            'bytes_serialized': 0,
+            'bytes_sent': 0,
+            'requests': 0,
+            'failed_requests': 0,
+        }
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        # the resident set size at the end of the phase (the largest, if it is timed in several parts)
+        self.rss_kb = None
+        self.peak_traced_bytes = None
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for (key, val) in counts.items():
+                self.counts[key] += val
+
+    def record_request(self, latency, ok):
+        """Record the latency, in seconds, of a single request."""
+        latency_ms = latency * 1000
+        bucket = next((ix for (ix, bound) in enumerate(LATENCY_BUCKETS_MS) if latency_ms <= bound), -1)
+        with self._lock:
+            self.counts['requests'] += 1
+            if not ok:
+                self.counts['failed_requests'] += 1
+            self.latency_histogram[bucket] += 1
+
+    def report(self):
+        docs = self.counts['docs_serialized']
+        rows = self.counts['rows_parsed']
+        bounds = [f'<={b}ms' for b in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}ms']
+        return dict(
+            self.counts,
+            elapsed_secs=round(self.elapsed, 3),
+            rows_per_sec=round(rows / self.elapsed, 1) if self.elapsed else None,
+            docs_per_sec=round(docs / self.elapsed, 1) if self.elapsed else None,
+            latency_histogram={b: n for (b, n) in zip(bounds, self.latency_histogram) if n},
+            rss_kb=self.rss_kb,
+            peak_traced_bytes=self.peak_traced_bytes,
+        )
+
+
+class ImportMetrics(object):
+    """
+    Per-phase metrics for an import.
+
+    Counters are added to with `phase(name).add(...)`; wrap the code for a phase
+    in `timed(name)` to record its wall time and the resident set size at its
+    end. The peak RSS of the process is not per phase, so it is only reported
+    for a whole import, by `peak_rss_kb`.
+    If `profile_dir` is set, each timed phase is also run under cProfile, with
+    the stats dumped to `<profile_dir>/<phase>.prof` (cProfile only sees the
+    thread that the phase runs in). A phase may be timed in several parts,
+    whose times and profiles are added together. If `trace_memory` is set,
+    tracemalloc is used to measure the peak memory allocated by Python during
+    each phase, which for a phase timed in several parts is the largest peak
+    of any part.
+    """
+
+    def __init__(self, profile_dir=None, trace_memory=False):
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+        self.phases = {}
+        self._profilers = {}
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        with self._lock:
+            if name not in self.phases:
+                self.phases[name] = PhaseMetrics(name)
+            return self.phases[name]
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        phase = self.phase(name)
+        profiler = None
+        if self.profile_dir:
+            profiler = self._profilers.setdefault(name, cProfile.Profile())
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            elif hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        start = time.monotonic()
+        if profiler:
+            profiler.enable()
+        try:
+            yield phase
+        finally:
+            if profiler:
+                profiler.disable()
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profiler.dump_stats(os.path.join(self.profile_dir, f'{name}.prof'))
+            phase.elapsed += time.monotonic() - start
+            rss = current_rss_kb()
+            if rss is not None:
+                phase.rss_kb = max(phase.rss_kb or 0, rss)
+            if self.trace_memory:
+                # keep the largest peak of all the phase's parts
+                peak = tracemalloc.get_traced_memory()[1]
+                phase.peak_traced_bytes = max(phase.peak_traced_bytes or 0, peak)
+
+    def report(self):
+        return {name: phase.report() for (name, phase) in self.phases.items()}
+
+    def write_report(self, path):
+        with open(path, 'w') as fd:
+            json.dump(self.report(), fd, indent=2)
+
+
+def current_rss_kb():
+    """The current resident set size of this process, in KiB, or None where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as fd:
+            pages = int(fd.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * (os.sysconf('SC_PAGE_SIZE') // 1024)
+
+
+def peak_rss_kb():
+    """The peak resident set size of this process so far, in KiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes rather than KiB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class CountingReader(io.RawIOBase):
+    """Wraps a binary file, adding the number of bytes read to a phase's `bytes_read`."""
+
+    def __init__(self, raw, phase):
+        self._raw = raw
+        self._phase = phase
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        n_bytes = self._raw.readinto(buf)
+        if n_bytes:
+            self._phase.add(bytes_read=n_bytes)
+        return n_bytes
+
+    def close(self):
+        self._raw.close()
+        super().close()
+
+
+def counted(items, phase, key='rows_parsed', every=10000):
+    """Pass through an iterable, adding the number of items to one of a phase's counters."""
+    n_items = 0
+    try:
+        for item in items:
+            n_items += 1
+            if n_items == every:
+                phase.add(**{key: n_items})
+                n_items = 0
+            yield item
+    finally:
+        phase.add(**{key: n_items})
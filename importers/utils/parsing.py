@@ -0,0 +1,156 @@
+"""
+Helpers for parsing large line-oriented source files, in parallel if need be.
+"""
+import bz2
+import concurrent.futures
+import csv
+import functools
+import gzip
+import io
+import lzma
+import mmap
+import operator
+import os
+
+from importers.utils.metrics import CountingReader
+
+
+class ParseError(RuntimeError):
+    """An error in a source file, tied to the line it was found on."""
+
+    def __init__(self, line_no, reason):
+        self.line_no = line_no
+        self.reason = reason
+        super().__init__(f"line {line_no}: {reason}")
+
+    def __reduce__(self):
+        return (ParseError, (self.line_no, self.reason))
+
+
+# functions to open compressed files, by file extension
+_DECOMPRESSORS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+
+def is_compressed(path):
+    return os.path.splitext(path)[1] in _DECOMPRESSORS
+
+
+def find_source(path):
+    """
+    The path of a source file, or if it does not exist, of a compressed copy
+    of it (e.g. `path + '.gz'`) if there is one.
+    """
+    if not os.path.exists(path):
+        for ext in _DECOMPRESSORS:
+            if os.path.exists(path + ext):
+                return path + ext
+    return path
+
+
+def open_text(path, phase=None):
+    """
+    Open a source file for reading as text, decompressing it on the fly if
+    it is a .gz, .bz2 or .xz file. If a PhaseMetrics object is given, the
+    (uncompressed) bytes read from the file are added to its `bytes_read` count.
+    """
+    ext = os.path.splitext(path)[1]
+    if ext in _DECOMPRESSORS:
+        raw = _DECOMPRESSORS[ext](path, 'rb')
+    else:
+        raw = open(path, 'rb', buffering=0)
+    if phase is not None:
+        raw = CountingReader(raw, phase)
+    return io.TextIOWrapper(io.BufferedReader(raw))
+
+
+def select_columns(columns):
+    """A function picking the `columns` (a sequence of indexes) out of a row, as a tuple."""
+    if len(columns) == 1:
+        (ix,) = columns
+        return lambda cols: (cols[ix],)
+    return operator.itemgetter(*columns)
+
+
+def parse_rows(lines, delimiter, expected_col_count, first_line_no=1, columns=None, enums=None):
+    """
+    Parse and check delimited rows, yielding a (line_no, *values) tuple of
+    stripped values for each, numbering the rows from `first_line_no`.
+
+    Every row must have `expected_col_count` columns. `enums` maps column
+    indexes to (allowed_values, label) pairs; a value that is not allowed is
+    reported as "invalid <label>", and if `allowed_values` is a dict, each
+    value is replaced by what it maps to. `columns` picks out the columns to
+    yield, in order; by default, all of them. A ParseError is raised for the
+    first row with a problem.
+    """
+    pick = select_columns(range(expected_col_count) if columns is None else columns)
+    checks = sorted((enums or {}).items())
+    line_no = first_line_no - 1
+    for row in csv.reader(lines, delimiter=delimiter):
+        line_no += 1
+
+        cols = [c.strip() for c in row]
+        if len(cols) != expected_col_count:
+            n_cols = len(cols)
+            raise ParseError(line_no, f"expected {expected_col_count} cols, found {n_cols}")
+
+        for (ix, (allowed, label)) in checks:
+            if cols[ix] not in allowed:
+                raise ParseError(line_no, f"invalid {label}: {cols[ix]}")
+            if isinstance(allowed, dict):
+                cols[ix] = allowed[cols[ix]]
+
+        yield (line_no,) + pick(cols)
+
+
+def line_aligned_ranges(path, n_ranges, skip_lines=0):
+    """
+    Split a file into up to `n_ranges` (start, end) byte ranges of similar size,
+    each of which starts at the beginning of a line. The first `skip_lines`
+    lines (e.g. headers) are not included in any range. The file must not be
+    compressed.
+    """
+    with open(path, 'rb') as fd:
+        size = os.fstat(fd.fileno()).st_size
+        if size == 0:
+            return []
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            for _ in range(skip_lines):
+                newline = mm.find(b'\n', start)
+                start = size if newline == -1 else newline + 1
+
+            bounds = [start]
+            step = (size - start) / max(1, n_ranges)
+            for k in range(1, n_ranges):
+                newline = mm.find(b'\n', max(bounds[-1], int(start + k * step)))
+                if newline == -1 or newline + 1 >= size:
+                    break
+                if newline + 1 > bounds[-1]:
+                    bounds.append(newline + 1)
+            bounds.append(size)
+
+    return [(a, b) for (a, b) in zip(bounds, bounds[1:]) if b > a]
+
+
+def read_range(path, start, end, encoding='utf-8'):
+    """Read the text in a byte range of a file."""
+    with open(path, 'rb') as fd:
+        fd.seek(start)
+        return fd.read(end - start).decode(encoding)
+
+
+def map_ranges(fn, path, ranges, workers, **kwargs):
+    """
+    Call `fn(path, start, end, **kwargs)` for each byte range in a pool of
+    `workers` processes, yielding the results in file order as they become
+    available. `fn` must be a module-level function so that it can be sent to
+    the worker processes.
+    """
+    task = functools.partial(fn, path, **kwargs)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(task, [r[0] for r in ranges], [r[1] for r in ranges])
@@ -0,0 +1,73 @@
+"""
+Runs the stages of an import concurrently, connected by bounded queues.
+"""
+import queue
+import threading
+
+
+# marks the end of a stage's output
+_DONE = object()
+
+
+class _Failure(object):
+    """Carries an exception raised in a stage's thread to its consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def in_thread(items, maxsize=4, chunk_size=1):
+    """
+    Iterate over `items` in a background thread, handing them to the caller
+    through a bounded queue, so that producing the items overlaps with
+    whatever the caller does with them.
+
+    Items are passed over in lists of up to `chunk_size` to keep the cost of
+    queueing low for small items, so at most `maxsize * chunk_size` items are
+    held between the two threads at a time. An exception raised while producing
+    the items is re-raised in the caller; if the caller stops iterating early,
+    the background thread stops too.
+    """
+    handoff = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            chunk = []
+            for item in items:
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    if not put(chunk):
+                        return
+                    chunk = []
+            if chunk and not put(chunk):
+                return
+            put(_DONE)
+        except BaseException as err:
+            put(_Failure(err))
+        finally:
+            if hasattr(items, 'close'):
+                items.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = handoff.get()
+            if chunk is _DONE:
+                return
+            if isinstance(chunk, _Failure):
+                raise chunk.error
+            yield from chunk
+    finally:
+        stop.set()
+        thread.join()
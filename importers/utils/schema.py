@@ -0,0 +1,116 @@
+"""
+Validates documents against the JSON schemas in /schemas before they are sent
+to the RE API, so that bad rows are reported before any upload time is spent.
+"""
+import concurrent.futures
+import functools
+import itertools
+
+import jsonschema
+import yaml
+
+
+@functools.lru_cache(maxsize=None)
+def compiled_validator(schema_path):
+    """
+    Load the `schema` of a collection schema file and compile a validator for
+    it. Validators are cached, so each process only compiles a schema once.
+    """
+    with open(schema_path) as fd:
+        schema = yaml.safe_load(fd)['schema']
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema)
+
+
+def _describe(error):
+    path = '/'.join(str(p) for p in error.absolute_path)
+    return f"{path}: {error.message}" if path else error.message
+
+
+def _validate_chunk(schema_path, docs):
+    """
+    Validate a list of docs, for use in a worker process. Returns an
+    (index, reason) pair for each doc that failed.
+    """
+    validator = compiled_validator(schema_path)
+    failures = []
+    for (ix, doc) in enumerate(docs):
+        if validator.is_valid(doc):
+            # collecting and sorting every error is only worth it for the docs that have some
+            continue
+        errors = sorted(validator.iter_errors(doc), key=lambda e: list(map(str, e.absolute_path)))
+        if errors:
+            failures.append((ix, '; '.join(_describe(e) for e in errors)))
+    return failures
+
+
+class SchemaValidationError(RuntimeError):
+    """Raised when documents do not match their collection's schema."""
+
+    def __init__(self, coll_name, failures):
+        self.coll_name = coll_name
+        self.failures = failures
+        lines = [f"{len(failures)} doc(s) do not match the schema for collection {coll_name}:"]
+        for (ref, reason) in failures:
+            lines.append(f"  {ref}: {reason}")
+        super().__init__('\n'.join(lines))
+
+
+class SchemaValidator(object):
+    """
+    Validates documents against a collection schema file in chunks of
+    `chunk_size`, spread over a pool of `workers` processes if there is more
+    than one. Each worker compiles the schema once and reuses it for every
+    chunk that it is sent.
+
+    Documents are passed in as (ref, doc) pairs, where `ref` identifies the
+    source of the doc (e.g. 'line 12') in error reports.
+    """
+
+    def __init__(self, schema_path, workers=1, chunk_size=5000):
+        self.schema_path = schema_path
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        # fail early if the schema itself is invalid
+        compiled_validator(schema_path)
+
+    def iter_valid(self, items, failures):
+        """
+        Yield the docs from (ref, doc) pairs that match the schema, in order,
+        appending a (ref, reason) pair to the list `failures` for each that does not.
+        """
+        items = iter(items)
+        chunks = iter(lambda: list(itertools.islice(items, self.chunk_size)), [])
+        for (chunk, chunk_failures) in self._validate_chunks(chunks):
+            reasons = dict(chunk_failures)
+            for (ix, (ref, doc)) in enumerate(chunk):
+                if ix in reasons:
+                    failures.append((ref, reasons[ix]))
+                else:
+                    yield doc
+
+    def errors(self, items):
+        """Validate (ref, doc) pairs, returning the (ref, reason) pairs of those that failed."""
+        failures = []
+        for _ in self.iter_valid(items, failures):
+            pass
+        return failures
+
+    def _validate_chunks(self, chunks):
+        """Yield (chunk, failures) pairs in order, with a bounded number of chunks in flight."""
+        if self.workers == 1:
+            for chunk in chunks:
+                yield (chunk, _validate_chunk(self.schema_path, [doc for (_, doc) in chunk]))
+            return
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = []
+            for chunk in chunks:
+                docs = [doc for (_, doc) in chunk]
+                pending.append((chunk, executor.submit(_validate_chunk, self.schema_path, docs)))
+                if len(pending) >= 2 * self.workers:
+                    (done, future) = pending.pop(0)
+                    yield (done, future.result())
+            for (done, future) in pending:
+                yield (done, future.result())
@@ -0,0 +1,239 @@
+"""
+Helpers for sending documents to the RE API in bounded batches.
+"""
+import concurrent.futures
+import gzip
+import json
+import random
+import threading
+import time
+
+import requests
+import requests.adapters
+
+
+def batch_docs(docs, max_docs, max_bytes):
+    """
+    Serialize an iterable of documents into newline-delimited JSON batches.
+
+    A batch is cut as soon as adding another document would take it over
+    `max_docs` documents or `max_bytes` bytes. A single document that is larger
+    than `max_bytes` is sent in a batch of its own. `max_docs` may also be a
+    callable, which is consulted at the start of each batch.
+
+    Documents are serialized on the fly, so only one batch is held in memory
+    at a time. Yields (doc_count, body) tuples, where `body` is a bytes object.
+    """
+    doc_limit = max_docs if callable(max_docs) else (lambda: max_docs)
+    limit = doc_limit()
+    lines = []
+    size = 0
+    for doc in docs:
+        line = json.dumps(doc).encode()
+        if lines and (len(lines) >= limit or size + len(line) > max_bytes):
+            yield (len(lines), b'\n'.join(lines))
+            limit = doc_limit()
+            lines = []
+            size = 0
+        lines.append(line)
+        # allow for the newline separator
+        size += len(line) + 1
+
+    if lines:
+        yield (len(lines), b'\n'.join(lines))
+
+
+def merge_results(totals, result):
+    """Add the counts from one RE API save response to a running total."""
+    for (key, val) in result.items():
+        if isinstance(val, int) and not isinstance(val, bool):
+            totals[key] = totals.get(key, 0) + val
+    return totals
+
+
+class AdaptiveBatchSize(object):
+    """
+    Tracks the number of docs to put in each batch, adjusting it as responses
+    come in: the size shrinks multiplicatively after a failed request or one
+    slower than `target_latency` seconds, and grows gradually while requests
+    succeed well inside the target. A `target_latency` of 0 fixes the size.
+    """
+
+    def __init__(self, initial, minimum=10, maximum=None, target_latency=10.0):
+        self.minimum = min(minimum, initial)
+        self.maximum = max(maximum or initial, initial)
+        self.target_latency = target_latency
+        self.size = initial
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        return self.size
+
+    def record(self, count, latency, ok):
+        """Record the outcome of a request that sent `count` docs."""
+        if not self.target_latency:
+            return
+        with self._lock:
+            if not ok:
+                size = self.size // 2
+            elif latency > self.target_latency:
+                # scale down in proportion to how far over the target we were
+                size = int(self.size * self.target_latency / latency)
+            elif latency < self.target_latency / 2 and count >= self.size:
+                # only grow if the batch was actually full
+                size = int(self.size * 1.25) + 1
+            else:
+                return
+            self.size = max(self.minimum, min(self.maximum, size))
+
+
+class UploadError(RuntimeError):
+    """Raised when one or more batches could not be saved."""
+
+    def __init__(self, coll_name, failures):
+        self.coll_name = coll_name
+        self.failures = failures
+        lines = [f"{len(failures)} batch(es) failed to save to collection {coll_name}:"]
+        for failure in failures:
+            lines.append(f"  batch {failure['batch']} ({failure['docs']} docs): {failure['error']}")
+        super().__init__('\n'.join(lines))
+
+
+# responses that are worth retrying: rate limiting and server-side errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class BatchUploader(object):
+    """
+    Sends batches of documents to the RE API, keeping up to `workers` requests
+    in flight over a single pooled keep-alive session.
+
+    Requests that time out, fail to connect or get a 429 or 5xx response are
+    retried up to `retries` times with jittered exponential backoff. The result
+    of every attempt is fed to `batch_size` (an AdaptiveBatchSize), which can
+    be passed to `batch_docs` as its `max_docs` limit.
+
+    If `gzip_level` is between 1 and 9, request bodies are gzipped at that
+    level and sent with a `Content-Encoding: gzip` header.
+    """
+
+    def __init__(self, api_url, auth_token, workers=4, session=None, batch_size=None,
+                 retries=5, backoff=1.0, max_backoff=60.0, timeout=300.0, gzip_level=0):
+        self.url = api_url + '/api/v1/documents'
+        self.gzip_level = gzip_level
+        self.workers = max(1, workers)
+        self.batch_size = batch_size or AdaptiveBatchSize(10000, target_latency=0)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Authorization'] = auth_token
+
+    def upload(self, coll_name, batches, params=None, on_progress=None, metrics=None):
+        """
+        Upload (doc_count, body) batches to a collection.
+
+        Batches are pulled from `batches` only as fast as they can be sent, so at
+        most 2 * `workers` serialized batches exist at any one time. Once a batch
+        fails, no new batches are started; the batches already in flight are
+        allowed to finish and every failure is reported in a single UploadError.
+
+        As batches complete, `on_progress` (if given) is called with the number
+        of docs at the start of the stream that have all been saved; batches that
+        finish out of order are only counted once every earlier batch has.
+
+        If `metrics` (a PhaseMetrics) is given, the docs and bytes sent and the
+        latency of every request are recorded in it. Bytes are counted both
+        before (`bytes_serialized`) and after (`bytes_sent`) any compression.
+
+        Returns the summed counts from the RE API responses.
+        """
+        params = dict(params or {}, collection=coll_name)
+        totals = {}
+        failures = []
+        in_flight = set()
+        # doc counts of saved batches that are not yet part of the saved prefix
+        saved = {}
+        progress = {'next_batch': 0, 'docs': 0}
+
+        def collect(done):
+            for future in done:
+                (batch_no, count, result, error) = future.result()
+                if error is None:
+                    merge_results(totals, result)
+                    saved[batch_no] = count
+                else:
+                    failures.append({'batch': batch_no, 'docs': count, 'error': error})
+            start = progress['next_batch']
+            while progress['next_batch'] in saved:
+                progress['docs'] += saved.pop(progress['next_batch'])
+                progress['next_batch'] += 1
+            if on_progress is not None and progress['next_batch'] > start:
+                on_progress(progress['docs'])
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for (batch_no, (count, body)) in enumerate(batches):
+                if len(in_flight) >= 2 * self.workers:
+                    concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                done = {f for f in in_flight if f.done()}
+                in_flight -= done
+                collect(done)
+                if failures:
+                    break
+                if metrics is not None:
+                    metrics.add(docs_serialized=count, bytes_serialized=len(body))
+                in_flight.add(executor.submit(self._send, batch_no, count, body, params, metrics))
+            (done, _) = concurrent.futures.wait(in_flight)
+            collect(done)
+
+        if failures:
+            raise UploadError(coll_name, sorted(failures, key=lambda f: f['batch']))
+        return totals
+
+    def _send(self, batch_no, count, body, params, metrics=None):
+        """Send one batch, retrying if need be; returns (batch_no, count, result, error)."""
+        headers = {}
+        if self.gzip_level:
+            body = gzip.compress(body, compresslevel=self.gzip_level)
+            headers['Content-Encoding'] = 'gzip'
+        if metrics is not None:
+            metrics.add(bytes_sent=len(body))
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            retry_after = None
+            try:
+                resp = self.session.put(self.url, params=params, data=body, headers=headers, timeout=self.timeout)
+            except (requests.Timeout, requests.ConnectionError) as err:
+                error = f'{type(err).__name__}: {err}'
+                if metrics is not None:
+                    metrics.record_request(time.monotonic() - start, False)
+            except requests.RequestException as err:
+                return (batch_no, count, None, f'{type(err).__name__}: {err}')
+            else:
+                latency = time.monotonic() - start
+                if metrics is not None:
+                    metrics.record_request(latency, resp.ok)
+                if resp.ok:
+                    self.batch_size.record(count, latency, True)
+                    return (batch_no, count, resp.json(), None)
+                error = f'HTTP {resp.status_code}: {resp.text}'
+                if resp.status_code not in RETRY_STATUSES:
+                    return (batch_no, count, None, error)
+                retry_after = resp.headers.get('Retry-After')
+
+            self.batch_size.record(count, time.monotonic() - start, False)
+            if attempt >= self.retries:
+                return (batch_no, count, None, f'{error} (gave up after {attempt + 1} attempts)')
+            time.sleep(self._delay(attempt, retry_after))
+            attempt += 1
+
+    def _delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number `attempt` ("full jitter" backoff)."""
+        if retry_after and retry_after.isdigit():
+            return min(self.max_backoff, float(retry_after))
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
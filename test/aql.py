@@ -0,0 +1,177 @@
+"""
+A rough tokenizer for the AQL of the stored queries, for checks that do not
+need a database. It knows just enough AQL to find the clauses of a query
+(FOR, FILTER, SORT, LIMIT and so on), the variables bound by FOR loops and
+the collections they read, and the attributes referenced in each clause.
+"""
+import re
+
+# the keywords that start a clause (or an operation) in AQL
+CLAUSE_KEYWORDS = [
+    'FOR', 'LET', 'FILTER', 'SEARCH', 'SORT', 'LIMIT', 'COLLECT', 'WINDOW', 'PRUNE', 'OPTIONS',
+    'RETURN', 'WITH', 'INSERT', 'UPDATE', 'REPLACE', 'REMOVE', 'UPSERT',
+]
+
+_COMMENT_OR_STRING = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`[^`]*`', re.S)
+# keywords are case-insensitive, and are not attribute names (`doc.limit`) or bind vars (`@limit`)
+_CLAUSE_START = re.compile(r'(?<![\w.@])(' + '|'.join(CLAUSE_KEYWORDS) + r')(?![\w])', re.I)
+_FOR = re.compile(r'FOR\s+(\w+(?:\s*,\s*\w+)*)\s+IN\s+(.*)$', re.I | re.S)
+_TRAVERSAL = re.compile(r'(?:[\w@]+(?:\s*\.\.\s*[\w@]+)?\s+)?(?:OUTBOUND|INBOUND|ANY)\b', re.I)
+_FULLTEXT = re.compile(r'FULLTEXT\s*\(\s*(@@\w+|\w+)', re.I)
+_COLLECTION = re.compile(r'(@@\w+|\w+)\s*$')
+_ATTRIBUTE = re.compile(r'(?<![\w.@])([A-Za-z_]\w*)((?:\.[A-Za-z_]\w*)+)')
+
+
+class Clause(object):
+    """
+    A clause of a query: its keyword (upper-cased), text, offset in the
+    query, line number (from 1) and scope, the offset of the innermost open
+    parenthesis that it is in (-1 at the top level), which is shared by the
+    clauses of a subquery.
+    """
+
+    def __init__(self, keyword, text, start=0, line=1, scope=-1):
+        self.keyword = keyword
+        self.text = text
+        self.start = start
+        self.line = line
+        self.scope = scope
+
+    def attributes(self):
+        """The (variable, attribute path) pairs referenced in the clause, such as ('doc', 'a.b')."""
+        return [(var, path[1:]) for (var, path) in _ATTRIBUTE.findall(self.text)]
+
+    def __repr__(self):
+        return f'Clause({self.keyword!r}, {self.text!r}, {self.line})'
+
+
+class Loop(object):
+    """
+    A FOR loop over a collection. `collections` holds the names of the
+    collections it may read, which are all the examples of a collection bind
+    var; it is None if a bind var has no examples. `kind` is 'scan' for a
+    loop over a collection, with any index chosen from its filters, or
+    'fulltext' for a loop over the results of FULLTEXT().
+    """
+
+    def __init__(self, var, collections, kind, line):
+        self.var = var
+        self.collections = collections
+        self.kind = kind
+        self.line = line
+        self.filters = []
+        self.sorts = []
+
+
+def strip(query):
+    """
+    The query with its comments and string literals blanked out, keeping
+    the position of everything else, so that their contents are not taken
+    for AQL.
+    """
+    def blank(match):
+        text = match.group(0)
+        if text.startswith('/'):
+            return re.sub(r'[^\n]', ' ', text)
+        # keep the quotes, so that an empty string is still a value
+        return text[0] + re.sub(r'[^\n]', ' ', text[1:-1]) + text[-1]
+    return _COMMENT_OR_STRING.sub(blank, query)
+
+
+def line_of(text, pos):
+    """The line number (from 1) of a position in a query."""
+    return text.count('\n', 0, pos) + 1
+
+
+def scopes(text):
+    """The scope of each position in a stripped query; see Clause."""
+    (open_parens, result) = ([], [])
+    for (pos, char) in enumerate(text):
+        if char == ')' and open_parens:
+            open_parens.pop()
+        result.append(open_parens[-1] if open_parens else -1)
+        if char == '(':
+            open_parens.append(pos)
+    return result
+
+
+def clauses(query):
+    """The Clauses of a query, in order."""
+    text = strip(query)
+    starts = [match.start() for match in _CLAUSE_START.finditer(text)]
+    scope = scopes(text)
+    result = []
+    for (start, end) in zip(starts, starts[1:] + [len(text)]):
+        clause_text = text[start:end].rstrip()
+        keyword = _CLAUSE_START.match(clause_text).group(1).upper()
+        result.append(Clause(keyword, clause_text, start, line_of(text, start), scope[start]))
+    return result
+
+
+def collection_bind_vars(params):
+    """The collections named in the examples of each collection bind var (`@@name`) in a params schema."""
+    return {
+        '@@' + name[1:]: prop.get('examples') or None
+        for (name, prop) in (params or {}).get('properties', {}).items()
+        if name.startswith('@')
+    }
+
+
+def loops(query, collections, params=None):
+    """
+    The Loops over collections in a query, with the attributes of their
+    documents that are filtered and sorted on, as (attribute path, line
+    number) pairs. `collections` is the set of known collection names; loops
+    over anything else (subquery results, views, graph traversals) are left
+    out. Bind vars are resolved from the examples in the params schema.
+    """
+    bind_vars = collection_bind_vars(params)
+    result = []
+    # the loop that each variable is currently bound to, or None if it is not a collection loop
+    bound = {}
+    for clause in clauses(query):
+        if clause.keyword == 'FOR':
+            match = _FOR.match(clause.text)
+            if not match:
+                continue
+            names = [name.strip() for name in match.group(1).split(',')]
+            target = match.group(2).strip()
+            for name in names:
+                bound[name] = None
+            if _TRAVERSAL.match(target):
+                continue
+            fulltext = _FULLTEXT.match(target)
+            coll = fulltext.group(1) if fulltext else None
+            if not fulltext and _COLLECTION.match(target):
+                coll = _COLLECTION.match(target).group(1)
+            if coll is None:
+                continue
+            if coll.startswith('@@'):
+                colls = bind_vars.get(coll)
+            elif coll in collections:
+                colls = [coll]
+            else:
+                continue
+            loop = Loop(names[0], colls, 'fulltext' if fulltext else 'scan', clause.line)
+            bound[names[0]] = loop
+            result.append(loop)
+        elif clause.keyword in ('FILTER', 'SORT'):
+            for (var, path) in clause.attributes():
+                loop = bound.get(var)
+                if loop is not None:
+                    (loop.filters if clause.keyword == 'FILTER' else loop.sorts).append((path, clause.line))
+    return result
+
+
+def query_line(path):
+    """
+    The line of a stored query file on which its `query` starts, which is
+    added to the line numbers of its clauses to give lines in the file.
+    Returns 0 if it cannot be found.
+    """
+    with open(path) as fd:
+        for (line_no, line) in enumerate(fd, 1):
+            if re.match(r'query\s*:', line):
+                # a block scalar starts on the next line
+                return line_no if re.match(r'query\s*:\s*[|>]', line) else line_no - 1
+    return 0
@@ -0,0 +1,132 @@
+"""
+Lint the AQL of the stored queries, without a database, for patterns that
+do not scale:
+
+  count-materialized    COUNT() or LENGTH() of a subquery with no LIMIT whose
+                        results are not used otherwise, which builds every
+                        result in memory just to count them
+  filter-after-limit    a FILTER after a LIMIT in the same loop, which drops
+                        documents after the limit is applied, so fewer results
+                        are returned than the limit even when more match; a
+                        permission filter belongs before any LIMIT
+  unbounded-traversal   a traversal of more than MAX_DEPTH hops (or of a depth
+                        set by a bind var with no maximum) with no LIMIT on the
+                        number of results
+
+A query opts out of rules with a comment in its AQL, which may list several,
+or `all`:
+
+    // aql-lint: disable=count-materialized,unbounded-traversal
+"""
+import re
+
+from test import aql
+
+RULES = ['count-materialized', 'filter-after-limit', 'unbounded-traversal']
+
+# traversals of up to this many hops need no LIMIT
+MAX_DEPTH = 10
+
+_DISABLE = re.compile(r'aql-lint\s*:\s*disable\s*=\s*([\w-]+(?:\s*,\s*[\w-]+)*)')
+_LET = re.compile(r'LET\s+(\w+)\s*=', re.I)
+_SUBQUERY = re.compile(r'LET\s+(\w+)\s*=\s*\($', re.I)
+_FOR_TARGET = re.compile(r'FOR\s+\w+\s+IN\s+(\w+)\s*$', re.I)
+_DEPTH = re.compile(r'FOR\s.*?\sIN\s+(?:([\w@]+)\s*\.\.\s*)?([\w@]+)\s+(?:OUTBOUND|INBOUND|ANY)\b', re.I | re.S)
+
+
+def disabled_rules(query):
+    """The rules that a query opts out of in `aql-lint: disable=..` comments."""
+    return {rule.strip() for match in _DISABLE.finditer(query) for rule in match.group(1).split(',')}
+
+
+def _in_scope(clauses, start, scope):
+    """The clauses after `start` up to the end of `scope`, skipping those in nested subqueries."""
+    for clause in clauses[start + 1:]:
+        if clause.scope < scope:
+            break
+        if clause.scope == scope:
+            yield clause
+
+
+def _is_bounded(clauses, scope, variables):
+    """
+    Whether a subquery's number of results is capped, by a LIMIT after its
+    last FOR, or because it only loops over `variables`, which are already
+    in memory.
+    """
+    in_scope = [clause for clause in clauses if clause.scope == scope]
+    keywords = [clause.keyword for clause in in_scope]
+    loop_targets = [_FOR_TARGET.match(clause.text) for clause in in_scope if clause.keyword == 'FOR']
+    if all(target and target.group(1) in variables for target in loop_targets):
+        return True
+    last_for = len(keywords) - 1 - keywords[::-1].index('FOR')
+    return 'LIMIT' in keywords[last_for:]
+
+
+def _max_depth(bound, params):
+    """The maximum depth of a traversal, given as a number or a bind var; None if there is none."""
+    if bound.isdigit():
+        return int(bound)
+    prop = (params or {}).get('properties', {}).get(bound.lstrip('@'), {})
+    return prop.get('maximum')
+
+
+def lint(query, params=None, offset=0):
+    """
+    Lint a query, with its params schema (used to find the maximum of bind
+    vars), returning a list of (line, rule, message) tuples, in line order,
+    for the rules it does not opt out of. Line numbers count from 1 at the
+    start of the query, plus `offset`.
+    """
+    clauses = aql.clauses(query)
+    for clause in clauses:
+        clause.line += offset
+    text = aql.strip(query)
+    variables = {match.group(1) for match in (_LET.match(clause.text) for clause in clauses) if match}
+    problems = []
+    for (ix, clause) in enumerate(clauses):
+        subquery = _SUBQUERY.match(clause.text)
+        if subquery:
+            # the subquery's clauses are in the scope of the parenthesis that ends the LET clause
+            scope = clause.start + clause.text.rindex('(')
+            var = subquery.group(1)
+            counts = list(re.finditer(r'\b(COUNT|LENGTH)\s*\(\s*' + var + r'\s*\)', text, re.I))
+            # the LET clause is one use; a subquery whose results are also used otherwise is not just counted
+            uses = len(re.findall(r'(?<![\w.@])' + var + r'\b', text)) - 1
+            if counts and len(counts) == uses and not _is_bounded(clauses, scope, variables):
+                for match in counts:
+                    problems.append((aql.line_of(text, match.start()) + offset, 'count-materialized', (
+                        f'{match.group(1)}({var}) builds every result of the subquery on line {clause.line}, '
+                        'which has no LIMIT, just to count them; count with COLLECT WITH COUNT INTO instead'
+                    )))
+        elif clause.keyword == 'LIMIT':
+            filters = []
+            for later in _in_scope(clauses, ix, clause.scope):
+                if later.keyword in ('FOR', 'COLLECT'):
+                    break
+                if later.keyword == 'FILTER':
+                    filters.append(str(later.line))
+            if filters:
+                problems.append((clause.line, 'filter-after-limit', (
+                    f"LIMIT before the FILTER on line(s) {', '.join(filters)} in the same loop, so documents "
+                    'are dropped after the limit is applied; filter (especially on permissions) first'
+                )))
+        elif clause.keyword == 'FOR':
+            depth = _DEPTH.match(clause.text)
+            if not depth:
+                continue
+            max_depth = _max_depth(depth.group(2), params)
+            limited = any(later.keyword == 'LIMIT' for later in _in_scope(clauses, ix, clause.scope))
+            if (max_depth is None or max_depth > MAX_DEPTH) and not limited:
+                hops = f'{max_depth} hops' if max_depth is not None else f'{depth.group(2)} hops (no maximum)'
+                problems.append((clause.line, 'unbounded-traversal', (
+                    f'traversal of up to {hops} has no LIMIT on the number of results'
+                )))
+    disabled = disabled_rules(query)
+    problems = [problem for problem in problems if problem[1] not in disabled and 'all' not in disabled]
+    for match in _DISABLE.finditer(query):
+        for rule in match.group(1).split(','):
+            if rule.strip() not in RULES + ['all']:
+                line = aql.line_of(query, match.start()) + offset
+                problems.append((line, 'aql-lint', f'unknown rule {rule.strip()} in aql-lint comment'))
+    return sorted(problems)
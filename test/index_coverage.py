@@ -0,0 +1,116 @@
+"""
+Check, without a database, which of the attributes that the stored queries
+filter and sort on are covered by the indexes declared in the collection
+schemas, and which declared indexes no stored query can use.
+
+An attribute of a collection's documents is covered in a loop over the
+collection if it is in the leading fields of an index that the loop's filters
+(and sorts) can use: a persistent index on [a, b, c] serves filters on a, or
+a and b, and so on, but not on b alone. _key and _id (the primary index) and
+_from and _to (the edge index) are always covered. A loop whose filters can
+use no index at all reads the whole collection.
+
+This is a static approximation of the query optimizer. Use the query plan
+audit (test/query_plans.py) for the plans that arangodb actually chooses.
+Indexes that are only used by loaders, or by queries outside this repo, are
+reported as unused too.
+"""
+import collections
+
+from test import aql
+
+# attributes served by the indexes that every collection (or every edge collection) has
+BUILTIN_INDEXED = {'_key', '_id', '_from', '_to'}
+
+# index types that serve equality and range filters and sorts on their leading fields
+_SORTED_TYPES = {'persistent', 'skiplist'}
+
+
+def _covered(fields, attrs):
+    """The leading fields of an index on `fields` that are all in `attrs`."""
+    covered = []
+    for field in fields:
+        if field not in attrs:
+            break
+        covered.append(field)
+    return covered
+
+
+def analyze(schemas, queries):
+    """
+    Cross-check the attributes that stored queries filter and sort on with the
+    declared indexes. `schemas` maps collection names to their schema data,
+    and `queries` stored query names to their data (with `query` and `params`).
+
+    Returns a dict with:
+      unindexed: {(collection, attribute): [(query name, line), ..]} for every
+        filter or sort attribute that no declared index covers;
+      full_scans: {(collection, attribute): [(query name, line), ..]}, the
+        subset of those that are in loops with no usable index at all;
+      unused_indexes: [(collection, index), ..] for indexes no loop can use;
+      unresolved: [(query name, line), ..] for loops over a collection bind var
+        that has no examples, whose attributes cannot be checked.
+    """
+    indexes = {name: data.get('indexes', []) for (name, data) in schemas.items()}
+    unindexed = collections.defaultdict(list)
+    full_scans = collections.defaultdict(list)
+    used = set()
+    unresolved = []
+    for (query_name, data) in sorted(queries.items()):
+        for loop in aql.loops(data['query'], set(schemas), data.get('params')):
+            resolved = loop.collections is not None
+            if not resolved:
+                unresolved.append((query_name, loop.line))
+            filtered = {path for (path, _) in loop.filters}
+            sorted_on = {path for (path, _) in loop.sorts}
+            # a loop over an unknown collection might use the indexes of any of them
+            for coll in (loop.collections if resolved else sorted(indexes)):
+                covered = set(BUILTIN_INDEXED)
+                for (ix, index) in enumerate(indexes.get(coll, [])):
+                    if index['type'] == 'fulltext':
+                        if loop.kind == 'fulltext':
+                            used.add((coll, ix))
+                        continue
+                    leading = _covered(index['fields'], filtered)
+                    if index['type'] in _SORTED_TYPES:
+                        # a sort can use the fields that follow those that are filtered on
+                        leading += _covered(index['fields'][len(leading):], sorted_on)
+                    if leading:
+                        used.add((coll, ix))
+                        covered.update(leading)
+                if not resolved:
+                    continue
+                scan = loop.kind == 'scan' and not (filtered & covered)
+                for (path, line) in sorted(set(loop.filters + loop.sorts), key=lambda use: use[1]):
+                    if path not in covered:
+                        unindexed[(coll, path)].append((query_name, line))
+                        if scan and (path, line) in loop.filters:
+                            full_scans[(coll, path)].append((query_name, line))
+    unused = [
+        (coll, index)
+        for (coll, coll_indexes) in sorted(indexes.items())
+        for (ix, index) in enumerate(coll_indexes)
+        if (coll, ix) not in used
+    ]
+    return {
+        'unindexed': dict(unindexed),
+        'full_scans': dict(full_scans),
+        'unused_indexes': unused,
+        'unresolved': unresolved,
+    }
+
+
+def hot_attributes(results):
+    """
+    The unindexed attributes, hottest first: those that cause full scans,
+    then by the number of queries that use them.
+    """
+    def heat(item):
+        ((coll, path), uses) = item
+        return (-len({name for (name, _) in results['full_scans'].get((coll, path), [])}),
+                -len({name for (name, _) in uses}), coll, path)
+    return sorted(results['unindexed'].items(), key=heat)
+
+
+def describe_index(index):
+    return f"{index['type']} index on [{', '.join(index['fields'])}]"
@@ -0,0 +1,159 @@
+"""
+Audit the execution plans of the stored queries, as given by arangodb's
+/_api/explain, for full collection scans, filters that are not served by an
+index, sorts done in memory and the estimated cost, and compare them with a
+recorded baseline.
+"""
+import json
+import os
+
+from test import aql
+
+# a query's estimated cost may grow by this fraction before it counts as worse than the baseline
+COST_TOLERANCE = 0.2
+# cost differences smaller than this are treated as noise
+_MIN_COST_DIFF = 1.0
+
+# bind values for params with no examples or default, by JSON schema type
+_PLACEHOLDERS = {
+    'string': 'x',
+    'integer': 0,
+    'number': 0,
+    'boolean': False,
+    'array': [],
+    'object': {},
+    'null': None,
+}
+
+
+def example_bind_vars(params):
+    """
+    Bind vars for a stored query, taken from the first of the `examples`, or
+    the `default`, of each property in its params schema, or failing those, a
+    placeholder value of the property's type. Collection bind vars (`@@name`)
+    are only taken from the examples, as by the index coverage check; those
+    with none are left out (see `unresolved_collections`).
+    """
+    collections = aql.collection_bind_vars(params)
+    bind_vars = {}
+    for (name, prop) in (params or {}).get('properties', {}).items():
+        if name.startswith('@'):
+            if collections['@' + name]:
+                bind_vars[name] = collections['@' + name][0]
+        elif prop.get('examples'):
+            bind_vars[name] = prop['examples'][0]
+        elif 'default' in prop:
+            bind_vars[name] = prop['default']
+        else:
+            types = prop.get('type', 'string')
+            bind_vars[name] = _PLACEHOLDERS.get(types[0] if isinstance(types, list) else types)
+    return bind_vars
+
+
+def unresolved_collections(params):
+    """The collection bind vars of a stored query that have no examples, so that it cannot be explained."""
+    return sorted(name for (name, colls) in aql.collection_bind_vars(params).items() if colls is None)
+
+
+def _iter_nodes(nodes):
+    """Every node in a plan, including those in subqueries."""
+    for node in nodes:
+        yield node
+        yield from _iter_nodes(node.get('subquery', {}).get('nodes', []))
+
+
+def _references(expression):
+    """The IDs of the variables referenced in a calculation's expression."""
+    refs = set()
+    stack = [expression]
+    while stack:
+        expr = stack.pop()
+        if expr.get('type') == 'reference':
+            refs.add(expr['id'])
+        stack.extend(expr.get('subNodes', []))
+    return refs
+
+
+def summarize_plan(plan):
+    """
+    The parts of a query plan that matter for performance: the collections
+    read with a full scan, the number of filters on fully scanned documents,
+    the number of sorts that are not served by an index, and the estimated cost.
+    """
+    nodes = list(_iter_nodes(plan['nodes']))
+    # variables bound to the documents of a full collection scan, and the collections
+    scanned = {}
+    # the variables that each calculation's result depends on
+    depends_on = {}
+    unindexed_filters = 0
+    for node in nodes:
+        if node['type'] == 'EnumerateCollectionNode':
+            scanned[node['outVariable']['id']] = node['collection']
+            # newer arangodb versions move filters into the scan itself
+            if node.get('filter'):
+                unindexed_filters += 1
+        elif node['type'] == 'CalculationNode':
+            depends_on[node['outVariable']['id']] = _references(node['expression'])
+    for node in nodes:
+        if node['type'] == 'FilterNode' and depends_on.get(node['inVariable']['id'], set()) & set(scanned):
+            unindexed_filters += 1
+    return {
+        'full_scans': sorted(set(scanned.values())),
+        'unindexed_filters': unindexed_filters,
+        'in_memory_sorts': sum(1 for node in nodes if node['type'] == 'SortNode'),
+        'estimated_cost': round(plan.get('estimatedCost', 0), 2),
+    }
+
+
+def explain_query(session, db_url, query, bind_vars):
+    """Explain a query, returning a summary of its plan; raises a RuntimeError if arangodb cannot."""
+    resp = session.post(db_url + '/_api/explain', data=json.dumps({'query': query, 'bindVars': bind_vars}).encode())
+    result = resp.json()
+    if result.get('error'):
+        raise RuntimeError(result.get('errorMessage'))
+    return summarize_plan(result['plan'])
+
+
+def describe(summary):
+    """A one-line description of a plan summary."""
+    return (f"cost {summary['estimated_cost']}; "
+            f"full scans: {', '.join(summary['full_scans']) or 'none'}; "
+            f"unindexed filters: {summary['unindexed_filters']}; "
+            f"in-memory sorts: {summary['in_memory_sorts']}")
+
+
+def find_regressions(summaries, baseline, cost_tolerance=COST_TOLERANCE):
+    """
+    Compare plan summaries for each query with a baseline of earlier ones,
+    returning a description of each way in which a query's plan is worse.
+    Queries that are not in the baseline are not compared.
+    """
+    regressions = []
+    for (name, summary) in sorted(summaries.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        new_scans = sorted(set(summary['full_scans']) - set(base['full_scans']))
+        if new_scans:
+            regressions.append(f"{name}: new full collection scans of {', '.join(new_scans)}")
+        for key in ['unindexed_filters', 'in_memory_sorts']:
+            if summary[key] > base[key]:
+                regressions.append(f"{name}: {key.replace('_', ' ')} went from {base[key]} to {summary[key]}")
+        (old_cost, new_cost) = (base['estimated_cost'], summary['estimated_cost'])
+        if new_cost > old_cost * (1 + cost_tolerance) and new_cost - old_cost > _MIN_COST_DIFF:
+            regressions.append(f"{name}: estimated cost went from {old_cost} to {new_cost}")
+    return regressions
+
+
+def load_baseline(path):
+    """The plan summaries recorded at `path`, or None if there are none."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as fd:
+        return json.load(fd)
+
+
+def save_baseline(path, summaries):
+    with open(path, 'w') as fd:
+        json.dump(summaries, fd, indent=2, sort_keys=True)
+        fd.write('\n')
@@ -4,23 +4,46 @@ Tests for the DJORNL Parser
 At the present time, this just ensures that the files are parsed correctly;
 it does not check data loading into the db.
 """
+import io
 import json
+import tempfile
 import time
 import unittest
+from unittest import mock
 import requests
 import os
+import shutil
 import contextlib
+import gzip
 
 from importers.djornl.parser import DJORNL_Parser
+from importers.utils.export import BulkExporter
+from importers.utils.integrity import IntegrityError
+from importers.utils.schema import SchemaValidationError
+from importers.utils.upload import AdaptiveBatchSize, BatchUploader
 
 from test.helpers import get_config, assert_subset, modified_environ
 from test.stored_queries.helpers import create_test_docs
+from test.stored_queries.test_importer_utils import FakeSession
 
 _CONF = get_config()
 _NOW = int(time.time() * 1000)
 _TEST_DIR = '/app/test'
 
 
+def read_export(export_dir):
+    """Read the docs for each collection from a BulkExporter's output."""
+    with open(os.path.join(export_dir, 'manifest.json')) as fd:
+        manifest = json.load(fd)
+    docs = {}
+    for (coll_name, coll) in manifest['collections'].items():
+        docs[coll_name] = []
+        for shard in coll['shards']:
+            with open(os.path.join(export_dir, shard['path'])) as fd:
+                docs[coll_name] += [json.loads(line) for line in fd]
+    return docs
+
+
 class Test_DJORNL_Parser(unittest.TestCase):
 
     @classmethod
@@ -143,3 +166,316 @@ class Test_DJORNL_Parser(unittest.TestCase):
             self.json_data["load_cluster_data"]
         )
 
+
+    def test_assemble_nodes(self):
+        """ test merging edge, metadata and cluster nodes into one doc per node """
+
+        RES_ROOT_DATA_PATH = os.path.join(_TEST_DIR, 'djornl', 'test_data')
+        parser = self.init_parser_with_path(RES_ROOT_DATA_PATH)
+
+        node_ix = {}
+        list(parser.iter_edges(node_ix))
+        nodes = list(parser.assemble_nodes(node_ix).docs())
+
+        all_keys = set()
+        for method in ["load_edges", "load_node_metadata", "load_cluster_data"]:
+            all_keys.update(n['_key'] for n in self.json_data[method]['nodes'])
+        self.assertEqual(len(nodes), len(all_keys))
+        self.assertEqual(set(n['_key'] for n in nodes), all_keys)
+
+        nodes_by_key = {n['_key']: n for n in nodes}
+        metadata = {n['_key']: n for n in self.json_data['load_node_metadata']['nodes']}
+        # metadata, with the cluster IDs added
+        self.assertEqual(
+            nodes_by_key['AT1G01020'],
+            dict(metadata['AT1G01020'], cluster_I2=5, cluster_I6=3)
+        )
+        # metadata only
+        self.assertEqual(nodes_by_key['AT1G01100'], metadata['AT1G01100'])
+
+    def test_parse_edges_parallel(self):
+        """ test that parsing the edge file in parallel gives the same results as in serial """
+
+        for data_dir in ['test_data', 'empty_files']:
+            RES_ROOT_DATA_PATH = os.path.join(_TEST_DIR, 'djornl', data_dir)
+            parser = self.init_parser_with_path(RES_ROOT_DATA_PATH)
+            with modified_environ(RES_ROOT_DATA_PATH=RES_ROOT_DATA_PATH, RES_PARSE_WORKERS='3'):
+                parallel_parser = DJORNL_Parser()
+                parallel_parser.config()
+
+            self.assertEqual(parallel_parser.config()['PARSE_WORKERS'], 3)
+            edges = parallel_parser.parse_edges()
+            self.assertEqual(list(edges), list(parser.iter_edge_rows()))
+            self.assertEqual(edges.node_ids, list(parser.parse_edges().node_ids))
+
+        # errors are reported with the line number in the original file
+        for (data_dir, err_msg) in [
+            ('invalid_types', 'line 2: invalid edge type: AraGWAS-Some-Old-Rubbish-I-Made-Up'),
+            ('col_count_errors', 'line 6: expected 5 cols, found 3'),
+        ]:
+            RES_ROOT_DATA_PATH = os.path.join(_TEST_DIR, 'djornl', data_dir)
+            with modified_environ(RES_ROOT_DATA_PATH=RES_ROOT_DATA_PATH, RES_PARSE_WORKERS='3'):
+                parallel_parser = DJORNL_Parser()
+                parallel_parser.config()
+            with self.assertRaisesRegex(RuntimeError, err_msg):
+                parallel_parser.parse_edges()
+
+    def test_hashed_edge_keys(self):
+        """ test the fixed-width hashed edge key scheme """
+
+        RES_ROOT_DATA_PATH = os.path.join(_TEST_DIR, 'djornl', 'test_data')
+        with modified_environ(RES_ROOT_DATA_PATH=RES_ROOT_DATA_PATH, RES_EDGE_KEY_SCHEME='hash'):
+            parser = DJORNL_Parser()
+            parser.config()
+
+        edge_data = parser.load_edges()
+        keys = [e['_key'] for e in edge_data['edges']]
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertTrue(all(len(k) == 24 for k in keys))
+        # apart from the key, the docs are unchanged
+        self.assertEqual(
+            [dict(e, _key=None) for e in edge_data['edges']],
+            [dict(e, _key=None) for e in self.json_data['load_edges']['edges']]
+        )
+        # the score does not affect the key
+        self.assertEqual(
+            parser.edge_key('AT1G01010', 'AT1G01020', 'ppi_hithru', '2.3'),
+            parser.edge_key('AT1G01010', 'AT1G01020', 'ppi_hithru', '9.9'),
+        )
+
+        # collisions are detected while parsing
+        with mock.patch('importers.djornl.parser.hashed_key', return_value='0' * 24):
+            with self.assertRaisesRegex(RuntimeError, 'line 3: edge key 0+ collides with the edge on line 2'):
+                parser.parse_edges()
+
+        # or, in a pipelined load, once the edges have been sent, so that no nodes are saved
+        env = {'RES_ROOT_DATA_PATH': RES_ROOT_DATA_PATH, 'RES_EDGE_KEY_SCHEME': 'hash', 'RES_PIPELINE': '1'}
+        with modified_environ(**env):
+            parser = DJORNL_Parser()
+            parser.config()
+        session = FakeSession()
+        parser._uploader = BatchUploader('http://re_api', 'token', session=session)
+        with mock.patch('importers.djornl.parser.hashed_key', return_value='0' * 24):
+            with self.assertRaisesRegex(RuntimeError, 'line 3: edge key 0+ collides with the edge on line 2'):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    parser.load_data()
+        self.assertEqual({coll_name for (coll_name, _) in session.bodies}, {'djornl_edge'})
+
+    def test_load_data_pipelined(self):
+        """ test that the pipelined load produces the same docs as the default one """
+
+        RES_ROOT_DATA_PATH = os.path.join(_TEST_DIR, 'djornl', 'test_data')
+        parser = self.init_parser_with_path(RES_ROOT_DATA_PATH)
+        parser.assemble_nodes()
+        node_rows = parser.metrics().report()['djornl_node']['rows_parsed']
+        exported = {}
+        for pipeline in ['0', '1']:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                with modified_environ(RES_ROOT_DATA_PATH=RES_ROOT_DATA_PATH, RES_PIPELINE=pipeline):
+                    parser = DJORNL_Parser(exporter=BulkExporter(tmp_dir))
+                    parser.config()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    parser.load_data()
+                exported[pipeline] = read_export(tmp_dir)
+                # both loads read the same rows and write the same docs
+                report = parser.metrics().report()
+                self.assertEqual(report['djornl_edge']['rows_parsed'], len(exported[pipeline]['djornl_edge']))
+                self.assertEqual(report['djornl_node']['docs_serialized'], 14)
+                # the node files are parsed once, by the integrity check and the load together
+                self.assertEqual(report['djornl_node']['rows_parsed'], node_rows)
+
+        self.assertEqual(exported['0']['djornl_edge'], exported['1']['djornl_edge'])
+        self.assertEqual(exported['0']['djornl_edge'], self.json_data['load_edges']['edges'])
+        # the nodes are the same, but may be in a different order
+        by_key = {n['_key']: n for n in exported['0']['djornl_node']}
+        self.assertEqual(len(by_key), 14)
+        self.assertEqual(by_key, {n['_key']: n for n in exported['1']['djornl_node']})
+
+    def test_resume_load(self):
+        """ test that a resumed load only sends the docs that were not saved """
+
+        RES_ROOT_DATA_PATH = os.path.join(_TEST_DIR, 'djornl', 'test_data')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            env = {
+                'RES_ROOT_DATA_PATH': RES_ROOT_DATA_PATH,
+                'RES_CHECKPOINT_PATH': os.path.join(tmp_dir, 'checkpoint.json'),
+                'RES_BATCH_SIZE': '4',
+                'RES_UPLOAD_TARGET_LATENCY': '0',
+                'RES_UPLOAD_WORKERS': '1',
+            }
+
+            # the first run fails after the first two batches of edges
+            with modified_environ(**env):
+                parser = DJORNL_Parser()
+                parser.config()
+            session = FakeSession(fail_after=2)
+            parser._uploader = BatchUploader('http://re_api', 'token', workers=1, session=session,
+                                             batch_size=AdaptiveBatchSize(4, target_latency=0))
+            with self.assertRaises(RuntimeError), contextlib.redirect_stdout(io.StringIO()):
+                parser.load_data()
+
+            # the second picks up where it left off
+            with modified_environ(**env):
+                parser = DJORNL_Parser(resume=True)
+                parser.config()
+            session = FakeSession()
+            parser._uploader = BatchUploader('http://re_api', 'token', workers=1, session=session,
+                                             batch_size=AdaptiveBatchSize(4, target_latency=0))
+            with contextlib.redirect_stdout(io.StringIO()):
+                parser.load_data()
+
+            sent = {}
+            for (coll_name, docs) in session.bodies:
+                sent.setdefault(coll_name, []).extend(docs)
+            self.assertEqual(sent['djornl_edge'], self.json_data['load_edges']['edges'][8:])
+            self.assertEqual(len(sent['djornl_node']), 14)
+            # the checkpoint is removed after a successful load
+            self.assertFalse(os.path.exists(env['RES_CHECKPOINT_PATH']))
+
+    def test_schema_validation(self):
+        """ test that docs that do not match their schema are reported and not sent """
+
+        RES_ROOT_DATA_PATH = os.path.join(_TEST_DIR, 'djornl', 'test_data')
+        edges = self.json_data['load_edges']['edges']
+        # the header is line 1
+        expected = [f"line {ix + 2}" for (ix, e) in enumerate(edges) if e['score'] > 100]
+        self.assertTrue(expected)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # only allow scores of up to 100
+            schema_path = os.path.join(tmp_dir, 'djornl_edge.yaml')
+            with open(schema_path, 'w') as fd:
+                json.dump({'schema': {'type': 'object', 'properties': {'score': {'maximum': 100}}}}, fd)
+
+            for pipeline in ['0', '1']:
+                env = {'RES_ROOT_DATA_PATH': RES_ROOT_DATA_PATH, 'RES_PIPELINE': pipeline, 'RES_VALIDATE_DOCS': '1'}
+                with modified_environ(**env):
+                    parser = DJORNL_Parser()
+                    parser.config()['_SCHEMA_PATHS']['djornl_edge'] = schema_path
+                session = FakeSession()
+                parser._uploader = BatchUploader('http://re_api', 'token', session=session)
+                with self.assertRaises(SchemaValidationError) as cm, contextlib.redirect_stdout(io.StringIO()):
+                    parser.load_data()
+                self.assertEqual([ref for (ref, _) in cm.exception.failures], expected)
+                self.assertIn('score: 170.5 is greater than the maximum of 100', str(cm.exception))
+
+                # only the valid edges are sent, and none of the nodes
+                sent = [doc for (coll_name, docs) in session.bodies for doc in docs]
+                self.assertEqual(sent, [e for e in edges if e['score'] <= 100])
+
+    def test_check_integrity(self):
+        """ test that edge endpoints missing from the node data are found before loading """
+
+        RES_ROOT_DATA_PATH = os.path.join(_TEST_DIR, 'djornl', 'test_data')
+        parser = self.init_parser_with_path(RES_ROOT_DATA_PATH)
+        self.assertEqual(parser.check_integrity(), {
+            'dangling_endpoints': [],
+            'unused_nodes': ['AT1G01070', 'AT1G01100', 'Na23', 'SDV'],
+        })
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = os.path.join(tmp_dir, 'data')
+            shutil.copytree(RES_ROOT_DATA_PATH, root)
+            with open(os.path.join(root, 'merged_edges-AMW-060820_AF.tsv'), 'a') as fd:
+                fd.write('AT1G01010\tAT1G0102O\t1.5\tAraNetv2_log-likelihood-score\tAraNetv2-LC_lit-curated-ppi\n')
+
+            for bloom in ['0', '1']:
+                with modified_environ(RES_ROOT_DATA_PATH=root, RES_INTEGRITY_BLOOM=bloom):
+                    parser = DJORNL_Parser()
+                    parser.config()
+                self.assertEqual(parser.check_integrity()['dangling_endpoints'], ['AT1G0102O'])
+
+            with modified_environ(RES_ROOT_DATA_PATH=root, RES_INTEGRITY_CHECK='fail'):
+                parser = DJORNL_Parser()
+                parser.config()
+            session = FakeSession()
+            parser._uploader = BatchUploader('http://re_api', 'token', session=session)
+            with self.assertRaisesRegex(IntegrityError, 'AT1G0102O'), contextlib.redirect_stdout(io.StringIO()):
+                parser.load_data()
+            # nothing is sent, so no stub node is created for the typo
+            self.assertEqual(session.bodies, [])
+
+            # a pipelined load sends the edges before they can be checked
+            with modified_environ(RES_ROOT_DATA_PATH=root, RES_INTEGRITY_CHECK='fail', RES_PIPELINE='1'):
+                with self.assertRaisesRegex(ValueError, 'INTEGRITY_CHECK=fail .* cannot be used with PIPELINE'):
+                    DJORNL_Parser().config()
+
+    def test_dedup_edges(self):
+        """ test that duplicate edges are collapsed according to the EDGE_DEDUP policy """
+
+        RES_ROOT_DATA_PATH = os.path.join(_TEST_DIR, 'djornl', 'test_data')
+        edges = self.json_data['load_edges']['edges']
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = os.path.join(tmp_dir, 'data')
+            shutil.copytree(RES_ROOT_DATA_PATH, root)
+            with open(os.path.join(root, 'merged_edges-AMW-060820_AF.tsv'), 'a') as fd:
+                # a reversed duplicate of a ppi edge with a higher score, and a repeated line
+                fd.write('AT1G01020\tAT1G01010\t2.9\tAraNetv2_log-likelihood-score\tAraNetv2-HT_high-throughput-ppi\n')
+                fd.write('As2\tAT1G01020\t8.4\tAraGWAS-Association_score\tAraGWAS-Phenotype_Associations\n')
+
+            with modified_environ(RES_ROOT_DATA_PATH=root):
+                parser = DJORNL_Parser()
+                parser.config()
+            self.assertEqual(len(parser.load_edges()['edges']), len(edges) + 2)
+
+            with modified_environ(RES_ROOT_DATA_PATH=root, RES_EDGE_DEDUP='max'):
+                parser = DJORNL_Parser()
+                parser.config()
+            with contextlib.redirect_stdout(io.StringIO()):
+                deduped = parser.load_edges()['edges']
+            self.assertEqual(len(deduped), len(edges))
+            self.assertIn('AT1G01020__AT1G01010__ppi_hithru__2.9', [e['_key'] for e in deduped])
+            self.assertNotIn('AT1G01010__AT1G01020__ppi_hithru__2.3', [e['_key'] for e in deduped])
+
+            with modified_environ(RES_ROOT_DATA_PATH=root, RES_EDGE_DEDUP='fail'):
+                parser = DJORNL_Parser()
+                parser.config()
+            with self.assertRaisesRegex(RuntimeError, 'line 13: duplicate of the edge on line 2'):
+                parser.load_edges()
+
+            with modified_environ(RES_ROOT_DATA_PATH=root, RES_EDGE_DEDUP='max', RES_PIPELINE='1'):
+                with self.assertRaisesRegex(ValueError, 'cannot be used with PIPELINE'):
+                    DJORNL_Parser().config()
+
+    def test_load_compressed_files(self):
+        """ test that compressed source files are read in place of missing uncompressed ones """
+
+        RES_ROOT_DATA_PATH = os.path.join(_TEST_DIR, 'djornl', 'test_data')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = os.path.join(tmp_dir, 'data')
+            shutil.copytree(RES_ROOT_DATA_PATH, root)
+            for (dir_path, _, file_names) in os.walk(root):
+                for name in file_names:
+                    path = os.path.join(dir_path, name)
+                    with open(path, 'rb') as fd, gzip.open(path + '.gz', 'wb') as gz:
+                        gz.write(fd.read())
+                    os.remove(path)
+
+            # parallel parsing falls back to reading the compressed file in one go
+            with modified_environ(RES_ROOT_DATA_PATH=root, RES_PARSE_WORKERS='2'):
+                parser = DJORNL_Parser()
+                parser.config()
+            self.assertEqual(parser.load_edges(), self.json_data['load_edges'])
+            self.assertEqual(parser.load_node_metadata(), self.json_data['load_node_metadata'])
+            self.assertEqual(parser.load_cluster_data(), self.json_data['load_cluster_data'])
+
+    def test_columnar_backend(self):
+        """ test that the columnar backend gives the same docs and errors as the row parser """
+
+        def outcome(fn):
+            try:
+                return fn()
+            except RuntimeError as err:
+                return str(err)
+
+        for data_dir in ['test_data', 'invalid_types', 'col_count_errors', 'empty_files']:
+            RES_ROOT_DATA_PATH = os.path.join(_TEST_DIR, 'djornl', data_dir)
+            results = {}
+            for backend in ['rows', 'columnar']:
+                with modified_environ(RES_ROOT_DATA_PATH=RES_ROOT_DATA_PATH, RES_PARSE_BACKEND=backend):
+                    parser = DJORNL_Parser()
+                    parser.config()
+                results[backend] = [outcome(parser.load_edges), outcome(parser.load_node_metadata)]
+            self.assertEqual(results['rows'], results['columnar'])
+            if data_dir == 'test_data':
+                self.assertEqual(results['columnar'][1], self.json_data['load_node_metadata'])
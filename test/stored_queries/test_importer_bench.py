@@ -0,0 +1,153 @@
+"""
+Tests for the importer benchmarking tools
+"""
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import requests
+
+from importers.bench.benchmark import find_regressions, run_benchmarks
+from importers.bench.generate import generate_dataset
+from importers.bench.server import StandInServer
+from importers.djornl.parser import DJORNL_Parser
+from importers.utils.upload import batch_docs, BatchUploader, UploadError
+
+from test.helpers import modified_environ
+
+_TEST_DIR = '/app/test'
+
+
+class Test_Importer_Bench(unittest.TestCase):
+
+    def test_stand_in_server(self):
+        """ the stand-in server saves docs as the RE API would """
+
+        with StandInServer() as server:
+            url = server.url + '/api/v1/documents'
+            headers = {'Authorization': 'token'}
+            body = '\n'.join(json.dumps(d) for d in [{'_key': 'a', 'x': 1}, {'_key': 'b', 'x': 2}])
+            resp = requests.put(url, params={'collection': 'coll'}, data=body, headers=headers)
+            self.assertEqual(resp.json(), {
+                'created': 2, 'errors': 0, 'empty': 0, 'updated': 0, 'ignored': 0, 'error': False,
+            })
+
+            body = json.dumps({'_key': 'a', 'y': 3})
+            params = {'collection': 'coll', 'display_errors': '1'}
+            resp = requests.put(url, params=params, data=body, headers=headers)
+            self.assertEqual(resp.json()['errors'], 1)
+            self.assertIn('conflicting key: a', resp.json()['details'][0])
+
+            resp = requests.put(url, params=dict(params, on_duplicate='update'), data=body, headers=headers)
+            self.assertEqual(resp.json()['updated'], 1)
+            self.assertEqual(server.collections['coll']['a'], {'_key': 'a', 'x': 1, 'y': 3})
+
+            resp = requests.put(url, params=dict(params, on_duplicate='replace'), data=body, headers=headers)
+            self.assertEqual(server.collections['coll']['a'], {'_key': 'a', 'y': 3})
+
+            resp = requests.put(url, params={'collection': 'coll', 'overwrite': 'true'}, data=body, headers=headers)
+            self.assertEqual(resp.json()['created'], 1)
+            self.assertEqual(list(server.collections['coll']), ['a'])
+
+            resp = requests.put(url, params={'collection': 'coll'}, data='{', headers=headers)
+            self.assertEqual(resp.status_code, 400)
+            resp = requests.put(url, params={'on_duplicate': 'update'}, data=body, headers=headers)
+            self.assertEqual(resp.status_code, 400)
+            resp = requests.put(url, params={'collection': 'coll'}, data=body)
+            self.assertEqual(resp.status_code, 403)
+
+            stats = requests.get(server.url + '/stats').json()
+            self.assertEqual(stats['requests'], 8)
+            self.assertEqual(stats['failed_requests'], 3)
+            self.assertEqual(stats['docs'], 6)
+            self.assertIsNotNone(stats['response_ms']['max'])
+
+
+    def test_stand_in_server_uploads(self):
+        """ the batch uploader works against the stand-in, including gzipped bodies and injected errors """
+
+        docs = [{'_key': str(n), 'n': n} for n in range(1000)]
+        with StandInServer(latency=0.01) as server:
+            uploader = BatchUploader(server.url, 'token', workers=4, gzip_level=1)
+            totals = uploader.upload('coll', batch_docs(docs, 100, 1024 * 1024), params={'on_duplicate': 'update'})
+            self.assertEqual(totals['created'], 1000)
+            self.assertEqual(len(server.collections['coll']), 1000)
+            stats = server.stats()
+            self.assertEqual((stats['requests'], stats['docs']), (10, 1000))
+            self.assertLess(stats['bytes_received'], stats['bytes_decoded'])
+            self.assertGreaterEqual(stats['response_ms']['p50'], 10)
+
+        with StandInServer(error_rate=1.0, error_status=500, seed=1) as server:
+            uploader = BatchUploader(server.url, 'token', retries=1, backoff=0.01)
+            with self.assertRaisesRegex(UploadError, 'HTTP 500.*gave up after 2 attempts'):
+                uploader.upload('coll', batch_docs(docs, 500, 1024 * 1024))
+            self.assertEqual(server.stats()['failed_requests'], server.stats()['requests'])
+            self.assertEqual(server.collections, {})
+
+
+    def test_djornl_load_against_stand_in(self):
+        """ a full DJORNL load can be run against the stand-in server """
+
+        RES_ROOT_DATA_PATH = os.path.join(_TEST_DIR, 'djornl', 'test_data')
+        with StandInServer(store=False) as server:
+            with modified_environ(RES_ROOT_DATA_PATH=RES_ROOT_DATA_PATH, RES_API_URL=server.url):
+                parser = DJORNL_Parser()
+                parser.config()
+            with contextlib.redirect_stdout(io.StringIO()):
+                parser.load_data()
+            self.assertEqual(len(server.collections['djornl_node']), 14)
+            self.assertEqual(server.stats()['docs'], 14 + len(server.collections['djornl_edge']))
+
+
+    def test_generate_dataset(self):
+        """ generated datasets parse cleanly and are the same for a given seed """
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            summary = generate_dataset(os.path.join(tmp_dir, 'a'), 500, seed=3)
+            generate_dataset(os.path.join(tmp_dir, 'b'), 500, seed=3)
+            parsed = {}
+            for name in ['a', 'b']:
+                with modified_environ(RES_ROOT_DATA_PATH=os.path.join(tmp_dir, name)):
+                    parser = DJORNL_Parser()
+                    parser.config()
+                parsed[name] = (parser.load_edges(), parser.load_node_metadata(), parser.load_cluster_data())
+            self.assertEqual(parsed['a'], parsed['b'])
+
+            (edges, nodes, clusters) = parsed['a']
+            self.assertEqual(len(edges['edges']), 500)
+            self.assertEqual(len(nodes['nodes']), summary['genes'] + summary['phenotypes'])
+            self.assertEqual(
+                {e['edge_type'] for e in edges['edges']},
+                {'domain_co_occur', 'gene_coexpr', 'pheno_assn', 'ppi_hithru', 'ppi_liter'},
+            )
+            self.assertEqual(
+                {label for n in clusters['nodes'] for label in n if label != '_key'},
+                {'cluster_I2', 'cluster_I4', 'cluster_I6'},
+            )
+            self.assertEqual(parser.check_integrity()['dangling_endpoints'], [])
+
+
+    def test_run_benchmarks(self):
+        """ benchmarks record time, throughput and peak RSS, and regressions are found """
+
+        # importer settings in the caller's environment do not reach the benchmarks
+        with tempfile.TemporaryDirectory() as tmp_dir, modified_environ(RES_PARSE_BACKEND='none'):
+            results = run_benchmarks(tmp_dir, {'tiny': 200}, ['load_edges', 'load_data'], log=lambda msg: None)
+        for benchmark in ['load_edges', 'load_data']:
+            result = results['tiny'][benchmark]
+            self.assertEqual(set(result), {'wall_secs', 'rows', 'rows_per_sec', 'peak_rss_kb'})
+            self.assertGreater(result['peak_rss_kb'], 0)
+        self.assertEqual(results['tiny']['load_edges']['rows'], 200)
+
+        baseline = {'tiny': {'load_edges': {'wall_secs': 1.0, 'peak_rss_kb': 100000}}}
+        current = {'tiny': {
+            'load_edges': {'wall_secs': 1.5, 'peak_rss_kb': 105000},
+            'load_data': {'wall_secs': 9.0, 'peak_rss_kb': 900000},
+        }}
+        self.assertEqual(find_regressions(current, baseline, threshold=0.2), [
+            'tiny load_edges wall_secs: 1.0 -> 1.5 (+50%)',
+        ])
+        self.assertEqual(find_regressions(current, baseline, threshold=0.6), [])
@@ -0,0 +1,707 @@
+"""
+Tests for the shared importer utilities.
+"""
+import bz2
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import tempfile
+import threading
+import tracemalloc
+import unittest
+
+import yaml
+
+from importers.utils.checkpoint import Checkpoint
+from importers.utils.columnar import iter_blocks, parse_block
+from importers.utils.dedup import dedup_edges, find_key_collision
+from importers.utils.edge_store import EdgeStore
+from importers.utils.export import BulkExporter
+from importers.utils.importer import Importer, parse_delimited
+from importers.utils.integrity import BloomFilter, check_references
+from importers.utils.manifest import DeltaManifest, fingerprint
+from importers.utils.metrics import ImportMetrics, counted
+from importers.utils.parsing import ParseError, find_source, line_aligned_ranges, open_text, read_range
+from importers.utils.pipeline import in_thread
+from importers.utils.schema import SchemaValidationError, SchemaValidator
+from importers.utils.upload import batch_docs, merge_results, AdaptiveBatchSize, BatchUploader, UploadError
+
+from test.helpers import modified_environ
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = json.dumps(body)
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeSession(object):
+    """
+    Stands in for requests.Session, failing any batch that contains a doc with key 'bad'.
+    The first `n_unavailable` requests get a 503 response, and if `fail_after` is set,
+    every request after that many successful ones gets a 400.
+    """
+
+    def __init__(self, n_unavailable=0, fail_after=None):
+        self.n_unavailable = n_unavailable
+        self.fail_after = fail_after
+        self.headers = {}
+        self.bodies = []
+        self.lock = threading.Lock()
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def put(self, url, params=None, data=None, headers=None, **kwargs):
+        if (headers or {}).get('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        docs = [json.loads(line) for line in data.split(b'\n')]
+        with self.lock:
+            if self.n_unavailable > 0:
+                self.n_unavailable -= 1
+                return FakeResponse(503, {'error': 'unavailable'})
+            if self.fail_after is not None and len(self.bodies) >= self.fail_after:
+                return FakeResponse(400, {'error': 'failing'})
+            self.bodies.append((params['collection'], docs))
+        if any(d['_key'] == 'bad' for d in docs):
+            return FakeResponse(400, {'error': 'bad doc'})
+        return FakeResponse(200, {'created': len(docs), 'error': False})
+
+
+class ThingImporter(Importer):
+    """ a minimal importer, loading a 'thing' collection from a CSV file """
+
+    REQUIRED_CONFIG = ['THING_PATH']
+    OPTIONAL_CONFIG = ['THING_SCALE']
+    CONFIG_DEFAULTS = {'THING_SCALE': 1}
+    COLLECTIONS = ['thing']
+
+    def configure(self, configuration):
+        if configuration['THING_SCALE'] < 1:
+            raise ValueError(f"Invalid THING_SCALE: {configuration['THING_SCALE']}")
+
+    def source_paths(self):
+        return [self.config()['THING_PATH']]
+
+    def load_data(self):
+        rows = self.iter_delimited(self.config()['THING_PATH'], 'thing', ',', 2)
+        docs = ({'_key': key, 'n': int(n) * self.config()['THING_SCALE']} for (_, key, n) in rows)
+        failures = []
+        self.save_docs('thing', self.valid_docs('thing', ((d['_key'], d) for d in docs), failures))
+        if failures:
+            raise SchemaValidationError('thing', failures)
+        self.finish_load()
+
+
+class Test_Importer_Utils(unittest.TestCase):
+
+    def test_batch_docs_by_count(self):
+        """ batches are capped at max_docs documents """
+
+        docs = ({'_key': str(n)} for n in range(7))
+        batches = list(batch_docs(docs, 3, 1024))
+        self.assertEqual([count for (count, _) in batches], [3, 3, 1])
+
+        keys = [json.loads(line)['_key'] for (_, body) in batches for line in body.split(b'\n')]
+        self.assertEqual(keys, [str(n) for n in range(7)])
+
+
+    def test_batch_docs_by_size(self):
+        """ batches are capped at max_bytes, with oversized docs sent alone """
+
+        docs = [{'_key': 'a'}, {'_key': 'b'}, {'_key': 'x' * 100}, {'_key': 'c'}]
+        batches = list(batch_docs(docs, 100, 30))
+        self.assertEqual([count for (count, _) in batches], [2, 1, 1])
+        for (_, body) in batches[0:1] + batches[3:]:
+            self.assertLessEqual(len(body), 30)
+
+
+    def test_batch_docs_empty(self):
+        """ an empty iterable produces no batches """
+
+        self.assertEqual(list(batch_docs(iter([]), 10, 10)), [])
+
+
+    def test_merge_results(self):
+
+        totals = {}
+        merge_results(totals, {'created': 2, 'updated': 1, 'error': False})
+        merge_results(totals, {'created': 3, 'errors': 0, 'error': False})
+        self.assertEqual(totals, {'created': 5, 'updated': 1, 'errors': 0})
+
+
+    def test_batch_uploader(self):
+        """ all batches are sent over the shared session and the counts summed """
+
+        session = FakeSession()
+        uploader = BatchUploader('http://re_api', 'token', workers=3, session=session)
+        docs = ({'_key': str(n)} for n in range(25))
+        totals = uploader.upload('coll', batch_docs(docs, 4, 1024), params={'on_duplicate': 'update'})
+
+        self.assertEqual(totals, {'created': 25})
+        self.assertEqual(session.headers['Authorization'], 'token')
+        self.assertEqual(len(session.bodies), 7)
+        keys = sorted(int(d['_key']) for (_, docs) in session.bodies for d in docs)
+        self.assertEqual(keys, list(range(25)))
+
+
+    def test_batch_uploader_errors(self):
+        """ failed batches are reported individually """
+
+        session = FakeSession()
+        uploader = BatchUploader('http://re_api', 'token', workers=1, session=session)
+        docs = [{'_key': 'a'}, {'_key': 'bad'}, {'_key': 'b'}]
+        with self.assertRaisesRegex(UploadError, r'batch 1 \(1 docs\): HTTP 400') as ctx:
+            uploader.upload('coll', batch_docs(docs, 1, 1024))
+        self.assertEqual([f['batch'] for f in ctx.exception.failures], [1])
+
+
+    def test_batch_uploader_retries(self):
+        """ 5xx responses are retried until the retry budget is spent """
+
+        session = FakeSession(n_unavailable=2)
+        uploader = BatchUploader('http://re_api', 'token', workers=1, session=session, retries=2, backoff=0)
+        totals = uploader.upload('coll', batch_docs([{'_key': 'a'}], 1, 1024))
+        self.assertEqual(totals, {'created': 1})
+
+        session = FakeSession(n_unavailable=3)
+        uploader = BatchUploader('http://re_api', 'token', workers=1, session=session, retries=2, backoff=0)
+        with self.assertRaisesRegex(UploadError, r'HTTP 503: .* \(gave up after 3 attempts\)'):
+            uploader.upload('coll', batch_docs([{'_key': 'a'}], 1, 1024))
+
+        # client errors are not retried
+        session = FakeSession()
+        uploader = BatchUploader('http://re_api', 'token', workers=1, session=session, retries=2, backoff=0)
+        with self.assertRaisesRegex(UploadError, r'HTTP 400: [^(]*$'):
+            uploader.upload('coll', batch_docs([{'_key': 'bad'}], 1, 1024))
+
+
+    def test_adaptive_batch_size(self):
+
+        size = AdaptiveBatchSize(100, minimum=10, maximum=200, target_latency=1.0)
+        # fast, full batches grow the size, up to the maximum
+        size.record(100, 0.1, True)
+        self.assertEqual(size(), 126)
+        for _ in range(10):
+            size.record(size(), 0.1, True)
+        self.assertEqual(size(), 200)
+        # fast batches that were not full leave it alone
+        size.record(5, 0.1, True)
+        self.assertEqual(size(), 200)
+        # slow batches shrink it in proportion
+        size.record(200, 4.0, True)
+        self.assertEqual(size(), 50)
+        # failures halve it, down to the minimum
+        for _ in range(5):
+            size.record(50, 0.1, False)
+        self.assertEqual(size(), 10)
+
+        # with no target latency, the size is fixed
+        fixed = AdaptiveBatchSize(100, target_latency=0)
+        fixed.record(100, 60.0, False)
+        self.assertEqual(fixed(), 100)
+
+
+    def test_batch_docs_adaptive_limit(self):
+        """ a callable limit is consulted at the start of each batch """
+
+        limits = iter([1, 2, 3])
+        batches = list(batch_docs(({'_key': str(n)} for n in range(6)), lambda: next(limits), 1024))
+        self.assertEqual([count for (count, _) in batches], [1, 2, 3])
+
+
+    def test_fingerprint(self):
+        """ fingerprints depend on content, not key order """
+
+        self.assertEqual(fingerprint({'_key': 'a', 'x': 1}), fingerprint({'x': 1, '_key': 'a'}))
+        self.assertNotEqual(fingerprint({'_key': 'a', 'x': 1}), fingerprint({'_key': 'a', 'x': 2}))
+
+
+    def test_delta_manifest(self):
+        """ only new and changed docs are passed through after the first load """
+
+        docs = [{'_key': 'a', 'x': 1}, {'_key': 'b', 'x': 2}, {'_key': 'c', 'x': 3}]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'manifest.json')
+
+            manifest = DeltaManifest(path)
+            self.assertEqual(list(manifest.changed('coll', docs)), docs)
+            manifest.save()
+
+            # nothing has changed
+            manifest = DeltaManifest(path)
+            self.assertEqual(list(manifest.changed('coll', docs)), [])
+            self.assertEqual(manifest.summary(), {
+                'coll': {'inserted': 0, 'updated': 0, 'unchanged': 3, 'deleted': 0}
+            })
+
+            # an update, an insert and a deletion, sorting this load's records in runs
+            manifest = DeltaManifest(path, run_size=2)
+            new_docs = [{'_key': 'a', 'x': 1}, {'_key': 'b', 'x': 20}, {'_key': 'd', 'x': 4}]
+            self.assertEqual(list(manifest.changed('coll', new_docs)), new_docs[1:])
+            self.assertEqual(manifest.deleted('coll'), ['c'])
+            self.assertEqual(manifest.summary(), {
+                'coll': {'inserted': 1, 'updated': 1, 'unchanged': 1, 'deleted': 1}
+            })
+            manifest.save()
+            # fixed-width records, and only the latest load's files are kept
+            self.assertEqual(os.path.getsize(path + '.2.coll.fp'), 3 * 24)
+            self.assertEqual(sorted(os.listdir(tmp_dir)), [
+                'manifest.json', 'manifest.json.2.coll.fp', 'manifest.json.2.coll.keys',
+            ])
+            self.assertEqual(DeltaManifest(path).deleted('coll'), ['a', 'b', 'd'])
+
+            # without a save, the previous load is still the baseline
+            manifest = DeltaManifest(path)
+            self.assertEqual(list(manifest.changed('coll', docs)), docs[1:])
+            manifest = DeltaManifest(path)
+            self.assertEqual(list(manifest.changed('coll', docs)), docs[1:])
+
+
+    def test_edge_store(self):
+        """ edges round-trip through the store, including the exact score text """
+
+        rows = [
+            (2, 'A', 'B', '8.4', 'x'),
+            (3, 'B', 'C', '2.50', 'y'),
+            (5, 'A', 'C', '1e3', 'x'),
+            (6, 'C', 'A', '4.40001558779779', 'y'),
+        ]
+        store = EdgeStore(['x', 'y'])
+        for row in rows:
+            store.append(*row)
+
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store.node_ids, ['A', 'B', 'C'])
+        self.assertEqual(list(store), rows)
+        self.assertEqual(store.row(1), rows[1])
+        with self.assertRaises(KeyError):
+            store.append(7, 'A', 'B', '1.0', 'z')
+
+        # merging stores remaps node IDs and line numbers
+        other = EdgeStore(['y', 'x'])
+        other.append(1, 'D', 'A', '0.5', 'x')
+        other.append(2, 'B', 'D', '3.00', 'y')
+        store.extend(other, line_offset=10)
+        self.assertEqual(store.node_ids, ['A', 'B', 'C', 'D'])
+        self.assertEqual(list(store)[4:], [(11, 'D', 'A', '0.5', 'x'), (12, 'B', 'D', '3.00', 'y')])
+
+
+    def test_line_aligned_ranges(self):
+        """ ranges start at line boundaries and cover every line after the skipped ones """
+
+        lines = ['header\n'] + [f'line {n}\n' for n in range(50)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'data.tsv')
+            with open(path, 'w') as fd:
+                fd.write(''.join(lines))
+
+            for n_ranges in [1, 3, 7, 100]:
+                ranges = line_aligned_ranges(path, n_ranges, skip_lines=1)
+                self.assertLessEqual(len(ranges), n_ranges)
+                text = [read_range(path, start, end) for (start, end) in ranges]
+                self.assertTrue(all(t.endswith('\n') for t in text))
+                self.assertEqual(''.join(text), ''.join(lines[1:]))
+
+
+    def test_bulk_exporter(self):
+        """ docs are written to checksummed shards, optionally gzipped """
+
+        docs = [{'_key': str(n)} for n in range(5)]
+        for compress in [False, True]:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                exporter = BulkExporter(tmp_dir, shard_size=2, compress=compress)
+                self.assertEqual(exporter.export('coll', iter(docs)), 5)
+                with open(exporter.write_manifest()) as fd:
+                    manifest = json.load(fd)
+
+                coll = manifest['collections']['coll']
+                self.assertEqual(coll['docs'], 5)
+                self.assertEqual(coll['on_duplicate'], 'update')
+                self.assertEqual([shard['docs'] for shard in coll['shards']], [2, 2, 1])
+
+                exported = []
+                for shard in coll['shards']:
+                    path = os.path.join(tmp_dir, shard['path'])
+                    self.assertTrue(path.endswith('.jsonl.gz' if compress else '.jsonl'))
+                    with open(path, 'rb') as fd:
+                        content = fd.read()
+                    self.assertEqual(hashlib.sha256(content).hexdigest(), shard['sha256'])
+                    self.assertEqual(len(content), shard['bytes'])
+                    if compress:
+                        content = gzip.decompress(content)
+                    exported += [json.loads(line) for line in content.splitlines()]
+                self.assertEqual(exported, docs)
+
+
+    def test_in_thread(self):
+        """ items pass through in order, and errors reach the consumer """
+
+        for chunk_size in [1, 3, 100]:
+            self.assertEqual(list(in_thread(iter(range(10)), maxsize=2, chunk_size=chunk_size)), list(range(10)))
+
+        def failing():
+            yield 1
+            raise ValueError('bad item')
+
+        with self.assertRaisesRegex(ValueError, 'bad item'):
+            list(in_thread(failing()))
+
+        # stopping early stops the producer
+        produced = []
+
+        def endless():
+            n = 0
+            while True:
+                produced.append(n)
+                yield n
+                n += 1
+
+        items = in_thread(endless(), maxsize=2)
+        self.assertEqual([next(items) for _ in range(5)], list(range(5)))
+        items.close()
+        n_produced = len(produced)
+        self.assertLess(n_produced, 10)
+
+
+    def test_batch_uploader_progress(self):
+        """ progress only counts the docs at the start of the stream that have all been saved """
+
+        progress = []
+        session = FakeSession()
+        uploader = BatchUploader('http://re_api', 'token', workers=1, session=session)
+        docs = [{'_key': 'a'}, {'_key': 'b'}, {'_key': 'c'}, {'_key': 'bad'}, {'_key': 'd'}]
+        with self.assertRaises(UploadError):
+            uploader.upload('coll', batch_docs(docs, 2, 1024), on_progress=progress.append)
+        self.assertEqual(progress, [2])
+
+
+    def test_checkpoint(self):
+        """ progress is only resumed if the source files are unchanged """
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = os.path.join(tmp_dir, 'source.tsv')
+            with open(source, 'w') as fd:
+                fd.write('some data\n')
+            path = os.path.join(tmp_dir, 'checkpoint.json')
+
+            checkpoint = Checkpoint(path, [source], flush_interval=0)
+            checkpoint.record('edges', 100, complete=True)
+            checkpoint.record('nodes', 20)
+
+            resumed = Checkpoint(path, [source], resume=True)
+            self.assertTrue(resumed.is_complete('edges'))
+            self.assertEqual(resumed.saved('edges'), 100)
+            self.assertFalse(resumed.is_complete('nodes'))
+            self.assertEqual(resumed.saved('nodes'), 20)
+
+            # without resume, everything starts from scratch
+            self.assertEqual(Checkpoint(path, [source]).saved('edges'), 0)
+
+            with open(source, 'a') as fd:
+                fd.write('more data\n')
+            with self.assertRaisesRegex(RuntimeError, 'Source files have changed'):
+                Checkpoint(path, [source], resume=True)
+
+            checkpoint.clear()
+            self.assertFalse(os.path.exists(path))
+
+
+    def test_import_metrics(self):
+        """ phases count rows, bytes and requests, and time their own code """
+
+        metrics = ImportMetrics()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'source.tsv')
+            with open(path, 'w') as fd:
+                fd.write('a\tb\n' * 25)
+
+            with metrics.timed('edges') as phase:
+                with open_text(path, phase) as fd:
+                    rows = list(counted(fd, phase, every=10))
+            self.assertEqual(len(rows), 25)
+
+            session = FakeSession()
+            uploader = BatchUploader('http://re_api', 'token', session=session)
+            docs = [{'_key': str(n)} for n in range(5)]
+            uploader.upload('edges', batch_docs(docs, 2, 1024), metrics=metrics.phase('edges'))
+
+            report = metrics.report()['edges']
+            self.assertEqual(report['rows_parsed'], 25)
+            self.assertEqual(report['bytes_read'], 100)
+            self.assertEqual(report['docs_serialized'], 5)
+            self.assertEqual(report['bytes_serialized'], sum(len(body) for (_, body) in batch_docs(docs, 2, 1024)))
+            self.assertEqual(report['requests'], 3)
+            self.assertEqual(report['failed_requests'], 0)
+            self.assertEqual(sum(report['latency_histogram'].values()), 3)
+            self.assertGreater(report['rss_kb'], 0)
+            self.assertIsNotNone(report['rows_per_sec'])
+
+            report_path = os.path.join(tmp_dir, 'metrics.json')
+            metrics.write_report(report_path)
+            with open(report_path) as fd:
+                self.assertEqual(json.load(fd), metrics.report())
+
+
+    def test_import_metrics_profile(self):
+        """ timed phases can be profiled and have their memory use traced """
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            metrics = ImportMetrics(profile_dir=tmp_dir, trace_memory=True)
+            self.addCleanup(tracemalloc.stop)
+            with metrics.timed('nodes'):
+                data = [str(n) for n in range(10000)]
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, 'nodes.prof')))
+            self.assertGreater(metrics.phase('nodes').peak_traced_bytes, 0)
+            del data
+
+            # the peak of a phase timed in several parts is the largest of any part
+            with metrics.timed('edges'):
+                data = bytearray(5 * 1024 * 1024)
+                del data
+            with metrics.timed('edges'):
+                data = bytearray(1024)
+                del data
+            self.assertGreater(metrics.phase('edges').peak_traced_bytes, 5 * 1024 * 1024)
+
+
+    def test_schema_validator(self):
+        """ docs are checked against a collection schema, in order, in one or more processes """
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            schema_path = os.path.join(tmp_dir, 'coll.yaml')
+            with open(schema_path, 'w') as fd:
+                fd.write('name: coll\nschema:\n  type: object\n  required: [_key]\n'
+                         '  properties:\n    n: {type: integer}\n')
+
+            items = [(f'line {n}', {'_key': str(n), 'n': n}) for n in range(20)]
+            items[3] = ('line 3', {'n': 3})
+            items[17] = ('line 17', {'_key': '17', 'n': 'x'})
+            for workers in [1, 2]:
+                validator = SchemaValidator(schema_path, workers=workers, chunk_size=3)
+                failures = []
+                valid = list(validator.iter_valid(iter(items), failures))
+                self.assertEqual(valid, [doc for (ref, doc) in items if ref not in ('line 3', 'line 17')])
+                self.assertEqual(failures, [
+                    ('line 3', "'_key' is a required property"),
+                    ('line 17', "n: 'x' is not of type 'integer'"),
+                ])
+                self.assertEqual(validator.errors(items[:3]), [])
+
+            err = SchemaValidationError('coll', failures)
+            self.assertEqual(str(err).splitlines(), [
+                "2 doc(s) do not match the schema for collection coll:",
+                "  line 3: '_key' is a required property",
+                "  line 17: n: 'x' is not of type 'integer'",
+            ])
+
+
+    def test_bloom_filter(self):
+        """ a Bloom filter has no false negatives and few false positives """
+
+        bloom = BloomFilter(10000, error_rate=0.01)
+        for n in range(10000):
+            bloom.add(f'AT{n}')
+        self.assertTrue(all(f'AT{n}' in bloom for n in range(10000)))
+        false_positives = sum(f'AX{n}' in bloom for n in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+    def test_check_references(self):
+        """ dangling edge endpoints and unused nodes are found with sets or Bloom filters """
+
+        endpoints = ['a', 'b', 'c', 'typo']
+        node_keys = ['a', 'b', 'c', 'd', 'e']
+        expected = {'dangling_endpoints': ['typo'], 'unused_nodes': ['d', 'e']}
+        self.assertEqual(check_references(endpoints, node_keys), expected)
+        self.assertEqual(check_references(endpoints, node_keys, bloom=True), expected)
+
+        # the node filter is sized from the nodes, so many more nodes than endpoints do not saturate it
+        node_keys = [f'AT{n}' for n in range(10000)]
+        report = check_references(['AT1', 'typo'], node_keys, bloom=True)
+        self.assertEqual(report['dangling_endpoints'], ['typo'])
+
+
+    def test_dedup_edges(self):
+        """ duplicate edges are collapsed, in memory or with sorted runs spilled to disk """
+
+        edges = EdgeStore(['ppi', 'assn'])
+        rows = [
+            (2, 'a', 'b', '1.0', 'ppi'),
+            (3, 'b', 'a', '3.0', 'ppi'),   # the same undirected edge, reversed
+            (4, 'a', 'b', '1.0', 'assn'),
+            (5, 'b', 'a', '2.0', 'assn'),  # not the same directed edge
+            (6, 'a', 'b', '2.50', 'assn'),
+            (7, 'c', 'd', '1.0', 'ppi'),
+            (8, 'a', 'b', '2.0', 'ppi'),
+        ]
+        for row in rows:
+            edges.append(*row)
+
+        for run_size in [100, 2]:
+            (deduped, n_duplicates) = dedup_edges(edges, 'max', {'ppi'}, run_size=run_size)
+            self.assertEqual(n_duplicates, 3)
+            self.assertEqual(list(deduped), [rows[1], rows[3], rows[4], rows[5]])
+
+            (deduped, n_duplicates) = dedup_edges(edges, 'first', {'ppi'}, run_size=run_size)
+            self.assertEqual(n_duplicates, 3)
+            self.assertEqual(list(deduped), [rows[0], rows[2], rows[3], rows[5]])
+
+            # without symmetric types, only exact repeats of direction count
+            (deduped, n_duplicates) = dedup_edges(edges, 'first', run_size=run_size)
+            self.assertEqual(n_duplicates, 2)
+
+            with self.assertRaisesRegex(ParseError, 'line 3: duplicate of the edge on line 2'):
+                dedup_edges(edges, 'fail', {'ppi'}, run_size=run_size)
+
+        (deduped, n_duplicates) = dedup_edges(EdgeStore(['ppi']), 'fail')
+        self.assertEqual((len(deduped), n_duplicates), (0, 0))
+
+
+    def test_find_key_collision(self):
+        """ distinct edges with the same key are found by sorting, and repeats of an edge are not collisions """
+
+        edges = EdgeStore(['ppi', 'assn'])
+        for row in [(2, 'a', 'b', '1.0', 'ppi'), (3, 'a', 'b', '2.0', 'ppi'), (4, 'c', 'd', '1.0', 'ppi'),
+                    (5, 'b', 'a', '1.0', 'ppi'), (6, 'a', 'b', '1.0', 'assn')]:
+            edges.append(*row)
+
+        def key_of(node1, node2, edge_type):
+            # 'a' to 'b' collides with 'b' to 'a', whatever the edge type
+            return ord(min(node1, node2))
+
+        for run_size in [100, 2]:
+            self.assertEqual(find_key_collision(edges, key_of, 1, run_size=run_size), (3, 0))
+            self.assertIsNone(find_key_collision(edges.select([1, 1, 1, 0, 0]), key_of, 1, run_size=run_size))
+        self.assertIsNone(find_key_collision(EdgeStore(['ppi']), key_of, 1))
+
+
+    def test_compressed_sources(self):
+        """ compressed source files are found and decompressed on the fly """
+
+        text = 'node1\tnode2\n' + 'a\tb\n' * 1000
+        metrics = ImportMetrics()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for (ext, module) in [('.gz', gzip), ('.bz2', bz2), ('.xz', lzma)]:
+                path = os.path.join(tmp_dir, 'edges' + ext[1:] + '.tsv')
+                with module.open(path + ext, 'wt') as fd:
+                    fd.write(text)
+                self.assertEqual(find_source(path), path + ext)
+                with open_text(find_source(path), metrics.phase(ext)) as fd:
+                    self.assertEqual(fd.read(), text)
+                self.assertEqual(metrics.phase(ext).counts['bytes_read'], len(text))
+
+            # uncompressed files are preferred, and missing files are left to fail when opened
+            path = os.path.join(tmp_dir, 'edgesgz.tsv')
+            with open(path, 'w') as fd:
+                fd.write(text)
+            self.assertEqual(find_source(path), path)
+            self.assertEqual(find_source(path + '.missing'), path + '.missing')
+
+
+    def test_batch_uploader_gzip(self):
+        """ request bodies can be gzipped """
+
+        metrics = ImportMetrics()
+        session = FakeSession()
+        uploader = BatchUploader('http://re_api', 'token', session=session, gzip_level=1)
+        docs = [{'_key': str(n), 'text': 'the same text ' * 10} for n in range(100)]
+        uploader.upload('coll', batch_docs(docs, 50, 1024 * 1024), metrics=metrics.phase('coll'))
+        # the batches are sent concurrently, so may arrive in any order
+        sent = sorted((doc for (_, batch) in session.bodies for doc in batch), key=lambda doc: int(doc['_key']))
+        self.assertEqual(sent, docs)
+        counts = metrics.phase('coll').counts
+        self.assertLess(counts['bytes_sent'], counts['bytes_serialized'] / 4)
+
+
+    def test_parse_block(self):
+        """ blocks of rows are checked and split into stripped columns """
+
+        lines = ['a , x\n', 'b,y \n', 'c,z\n', 'd\n', 'e,w\n']
+        blocks = list(iter_blocks(lines, ',', block_size=2))
+        self.assertEqual([len(b) for b in blocks], [2, 2, 1])
+        enums = {1: ({'x', 'y', 'z', 'w'}, 'letter')}
+        self.assertEqual(parse_block(blocks[0], 1, 2, enums), [['a', 'b'], ['x', 'y']])
+
+        with self.assertRaisesRegex(ParseError, 'line 4: expected 2 cols, found 1'):
+            parse_block(blocks[1], 3, 2, enums)
+        # the earliest problem is reported, whatever its kind
+        with self.assertRaisesRegex(ParseError, 'line 3: invalid letter: q'):
+            parse_block([['c', 'q'], ['d']], 3, 2, enums)
+        self.assertEqual(parse_block([], 1, 2, enums), [[], []])
+
+
+    def test_parse_delimited(self):
+        """ both parse backends pick, check and remap columns in the same way """
+
+        lines = ['a , x, 1\n', 'b,y ,2\n', 'c,x,3\n']
+        enums = {1: ({'x': 'ex', 'y': 'why'}, 'letter')}
+        for backend in ['rows', 'columnar']:
+            rows = parse_delimited(lines, ',', 3, first_line_no=2, columns=(2, 0, 1), enums=enums, backend=backend)
+            self.assertEqual(list(rows), [(2, '1', 'a', 'ex'), (3, '2', 'b', 'why'), (4, '3', 'c', 'ex')])
+            self.assertEqual(list(parse_delimited(lines[:1], ',', 3, columns=(0,), backend=backend)), [(1, 'a')])
+
+            with self.assertRaisesRegex(ParseError, 'line 2: invalid letter: z'):
+                list(parse_delimited(['a,x,1', 'b,z,2', 'c'], ',', 3, enums=enums, backend=backend))
+            with self.assertRaisesRegex(ParseError, 'line 2: expected 3 cols, found 1'):
+                list(parse_delimited(['a,x,1', 'c', 'b,z,2'], ',', 3, enums=enums, backend=backend))
+
+
+    def test_importer(self):
+        """ an importer built on the base class parses, validates, exports and reports on its data """
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, 'thing.yaml'), 'w') as fd:
+                yaml.safe_dump({'name': 'thing', 'type': 'vertex', 'schema': {
+                    'type': 'object',
+                    'required': ['_key', 'n'],
+                    'properties': {'n': {'type': 'integer', 'maximum': 10}},
+                }}, fd)
+
+            class TmpThingImporter(ThingImporter):
+                SCHEMA_DIR = tmp_dir
+
+            source_path = os.path.join(tmp_dir, 'things.csv.gz')
+            with gzip.open(source_path, 'wt') as fd:
+                fd.write('key,n\na,1\nb,2\nc,3\n')
+            metrics_path = os.path.join(tmp_dir, 'metrics.json')
+
+            for (scale, backend) in [(1, 'rows'), (2, 'columnar')]:
+                env = {
+                    'RES_THING_PATH': source_path, 'RES_THING_SCALE': str(scale),
+                    'RES_PARSE_BACKEND': backend, 'RES_METRICS_PATH': metrics_path, 'RES_VALIDATE_DOCS': '1',
+                }
+                with modified_environ(**env):
+                    importer = TmpThingImporter(exporter=BulkExporter(os.path.join(tmp_dir, backend)))
+                    self.assertEqual(importer.config()['_SCHEMA_PATHS'], {'thing': os.path.join(tmp_dir, 'thing.yaml')})
+                with contextlib.redirect_stdout(io.StringIO()):
+                    importer.load_data()
+                with open(os.path.join(tmp_dir, backend, 'thing', 'thing.00000.jsonl')) as fd:
+                    self.assertEqual([json.loads(line)['n'] for line in fd], [scale, 2 * scale, 3 * scale])
+                with open(metrics_path) as fd:
+                    counts = json.load(fd)['thing']
+                self.assertEqual((counts['rows_parsed'], counts['docs_serialized']), (3, 3))
+
+            with modified_environ(RES_THING_PATH=source_path, RES_THING_SCALE='4', RES_VALIDATE_DOCS='1'):
+                importer = TmpThingImporter(exporter=BulkExporter(os.path.join(tmp_dir, 'invalid')))
+                importer.config()
+            with self.assertRaisesRegex(SchemaValidationError, "1 doc.*\n  c: n: 12 is greater than the maximum of 10"):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    importer.load_data()
+
+            with modified_environ(RES_THING_PATH=source_path, RES_THING_SCALE='0'):
+                with self.assertRaisesRegex(ValueError, 'Invalid THING_SCALE: 0'):
+                    TmpThingImporter().config()
+            with modified_environ(RES_THING_PATH=source_path, RES_PARSE_BACKEND='fast'):
+                with self.assertRaisesRegex(ValueError, 'Invalid PARSE_BACKEND: fast'):
+                    TmpThingImporter().config()
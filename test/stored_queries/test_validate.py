@@ -0,0 +1,451 @@
+"""
+Tests for the spec validator in test/validate.py
+"""
+import contextlib
+import http.server
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import unittest
+
+import yaml
+
+import test.validate as validate
+from test import aql_lint, index_coverage, query_plans
+
+_VERTEX = {
+    'name': 'thing', 'type': 'vertex',
+    'schema': {'type': 'object', 'required': ['_key'], 'properties': {'_key': {'type': 'string'}}},
+}
+
+
+@contextlib.contextmanager
+def _spec_dir(files):
+    """Run in a temporary directory holding the given {path: data (or text)} files."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for (path, data) in files.items():
+            os.makedirs(os.path.join(tmp_dir, os.path.dirname(path)), exist_ok=True)
+            with open(os.path.join(tmp_dir, path), 'w') as fd:
+                if isinstance(data, str):
+                    fd.write(data)
+                elif path.endswith('.json'):
+                    json.dump(data, fd)
+                else:
+                    yaml.safe_dump(data, fd)
+        os.chdir(tmp_dir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                yield tmp_dir
+        finally:
+            os.chdir(cwd)
+
+
+def _fake_plan(query):
+    nodes = [{'type': 'SingletonNode'}]
+    for (ix, (var, coll)) in enumerate(re.findall(r'FOR (\w+) IN (\w+)', query)):
+        out = {'id': ix, 'name': var}
+        if f'FILTER {var}._key' in query:
+            nodes.append({'type': 'IndexNode', 'collection': coll, 'outVariable': out})
+            continue
+        nodes.append({'type': 'EnumerateCollectionNode', 'collection': coll, 'outVariable': out})
+        if f'FILTER {var}.' in query:
+            expression = {'type': 'compare ==', 'subNodes': [
+                {'type': 'attribute access', 'subNodes': [{'type': 'reference', 'name': var, 'id': ix}]},
+                {'type': 'value', 'value': 1},
+            ]}
+            nodes.append({'type': 'CalculationNode', 'expression': expression, 'outVariable': {'id': 100 + ix}})
+            nodes.append({'type': 'FilterNode', 'inVariable': {'id': 100 + ix}})
+    if 'SORT' in query:
+        nodes.append({'type': 'SortNode'})
+    return {'nodes': nodes, 'estimatedCost': 10.0 * len(nodes)}
+
+
+class FakeArangoHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Parses queries as arangodb's /_api/query would, for queries with no syntax
+    errors but 'FILTR', and explains simple queries: a FOR over a collection is
+    a full scan unless it filters on _key, and a SORT is done in memory.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        stats = self.server.stats
+        with stats['lock']:
+            stats['in_flight'] += 1
+            stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+            stats['clients'].add(self.client_address)
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        query = request['query']
+        time.sleep(0.02)
+        if self.path == '/_api/explain':
+            stats['bind_vars'].append(request['bindVars'])
+            colls = [val for (name, val) in request['bindVars'].items() if name.startswith('@')]
+            if any(coll not in ('thing', 'other') for coll in colls):
+                body = {'error': True, 'errorMessage': 'collection or view not found'}
+            else:
+                body = {'error': False, 'plan': _fake_plan(query)}
+        elif 'FILTR' in query:
+            body = {'error': True, 'errorMessage': 'syntax error, unexpected identifier near FILTR'}
+        else:
+            body = {'error': False, 'bindVars': sorted(set(re.findall(r'@(\w+)', query)))}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        with stats['lock']:
+            stats['in_flight'] -= 1
+
+
+@contextlib.contextmanager
+def _fake_arangodb():
+    """Serve a FakeArangoHandler in the background; yields its URL and stats."""
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeArangoHandler)
+    httpd.daemon_threads = True
+    httpd.stats = {'lock': threading.Lock(), 'in_flight': 0, 'max_in_flight': 0, 'clients': set(), 'bind_vars': []}
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        yield ('http://%s:%s' % httpd.server_address[:2], httpd.stats)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+class Test_Validate(unittest.TestCase):
+
+    def test_validate_json_schemas(self):
+        """ every problem is reported, including duplicate names """
+
+        files = {
+            'schemas/a/thing.yaml': _VERTEX,
+            'schemas/b/thing.yaml': _VERTEX,
+            'schemas/a/edge.yaml': dict(_VERTEX, name='edge', type='edge'),
+            'schemas/a/bad.yaml': dict(_VERTEX, name='bad', schema={'type': 'object', 'required': 'x'}),
+            'schemas/a/other.yaml': dict(_VERTEX, type='graph'),
+        }
+        with _spec_dir(files):
+            errors = validate.validate_json_schemas(workers=1)
+        self.assertEqual(len(errors), 4)
+        self.assertEqual(errors[0], 'Duplicate schemas named thing: schemas/a/thing.yaml and schemas/b/thing.yaml')
+        self.assertIn('Unable to load schema in schemas/a/bad.yaml', errors[1])
+        self.assertEqual(errors[2], 'Edge schemas must require "_from" and "_to" attributes in schemas/a/edge.yaml')
+        self.assertIn("Invalid collection schema in schemas/a/other.yaml: 'graph' is not one of", errors[3])
+
+
+    def test_validation_cache(self):
+        """ files that passed are skipped until they change, or the validator does """
+
+        files = {f'schemas/a/thing{n}.yaml': dict(_VERTEX, name=f'thing{n}') for n in range(25)}
+        files['views/a/view.json'] = {'name': 'view', 'type': 'arangosearch'}
+        with _spec_dir(files) as tmp_dir:
+            cache_path = os.path.join(tmp_dir, '.cache', 'validate.json')
+            cache = validate.ValidationCache(cache_path)
+            # enough files to use a pool of workers
+            self.assertEqual(validate.validate_json_schemas(cache, workers=2), [])
+            self.assertEqual(validate.validate_views(cache, workers=2), [])
+            cache.save()
+
+            cache = validate.ValidationCache(cache_path)
+            self.assertEqual(len(cache.valid), 26)
+            with open('schemas/a/thing3.yaml', 'w') as fd:
+                yaml.safe_dump(dict(_VERTEX, type='edge'), fd)
+            checked = []
+            check = validate.check_json_schema
+            validate.check_json_schema = lambda path: checked.append(path) or check(path)
+            try:
+                errors = validate.validate_json_schemas(cache, workers=1)
+                self.assertEqual(checked, ['schemas/a/thing3.yaml'])
+                self.assertEqual(len(errors), 1)
+                # failures are not cached
+                validate.validate_json_schemas(cache, workers=1)
+                self.assertEqual(checked, ['schemas/a/thing3.yaml'] * 2)
+                # with `only`, other files are not checked even if they are not in the cache
+                validate.validate_json_schemas(validate.ValidationCache(None), only={'schemas/a/thing1.yaml'})
+                self.assertEqual(checked[2:], ['schemas/a/thing1.yaml'])
+            finally:
+                validate.check_json_schema = check
+
+            self.assertEqual(validate.ValidationCache(cache_path, version='other').valid, {})
+
+
+    def test_check_stored_query(self):
+        """ stored query structure is checked without a database """
+
+        query = {
+            'name': 'fetch_thing', 'query_prefix': 'WITH thing',
+            'params': {'type': 'object', 'properties': {'key': {'type': 'string'}}},
+            'query': 'FOR t IN thing FILTER t._key == @key RETURN t',
+        }
+        with _spec_dir({
+            'stored_queries/fetch_thing.yaml': query,
+            'stored_queries/fetch_other.yaml': query,
+            'stored_queries/fetch_bad.yaml': dict(query, name='fetch_bad', params={'type': 'array'}),
+        }):
+            self.assertEqual(validate.check_stored_query('stored_queries/fetch_thing.yaml'), ([], {
+                'query': 'WITH thing FOR t IN thing FILTER t._key == @key RETURN t', 'params': ['key'],
+            }))
+            self.assertEqual(
+                validate.check_stored_query('stored_queries/fetch_other.yaml'),
+                (['Name key should match filename: fetch_thing vs fetch_other'], None),
+            )
+            self.assertEqual(
+                validate.check_stored_query('stored_queries/fetch_bad.yaml'),
+                (["Params schema must have type 'object' in stored_queries/fetch_bad.yaml"], None),
+            )
+
+
+    def test_check_queries_syntax(self):
+        """ queries are parsed concurrently over a few kept-alive connections, and every error is returned """
+
+        items = [(f'q{n}.yaml', {'query': 'FOR t IN thing FILTER t._key == @key RETURN t', 'params': ['key']})
+                 for n in range(40)]
+        items[5] = ('q5.yaml', {'query': 'FOR t IN thing FILTR t._key == @key RETURN t', 'params': ['key']})
+        items[9] = ('q9.yaml', {'query': 'FOR t IN thing FILTER t._key == @key RETURN t', 'params': ['id']})
+        with _fake_arangodb() as (db_url, stats):
+            errors = validate.check_queries_syntax(items, concurrency=4, db_url=db_url, db_auth=('root', ''))
+
+        self.assertEqual(len(errors), 40)
+        self.assertEqual(errors[5], ['q5.yaml: syntax error, unexpected identifier near FILTR'])
+        self.assertEqual(errors[9], [
+            "Bind vars are invalid in q9.yaml.\n  Extra vars in query: {'key'}.\n  Extra params in schema: {'id'}"
+        ])
+        self.assertEqual([e for (ix, e) in enumerate(errors) if ix not in (5, 9)], [[]] * 38)
+        self.assertGreater(stats['max_in_flight'], 1)
+        self.assertLessEqual(stats['max_in_flight'], 4)
+        self.assertLessEqual(len(stats['clients']), 4)
+
+        errors = validate.check_queries_syntax(items[:1], db_url=db_url, db_auth=('root', ''))
+        self.assertRegex(errors[0][0], 'q0.yaml: unable to parse the query on arangodb: .*Connection')
+
+
+    def test_summarize_plan(self):
+        """ full scans, filters on scanned docs and sorts are found, including in subqueries """
+
+        ref = {'type': 'reference', 'name': 'n', 'id': 1}
+        subquery = {'nodes': [
+            {'type': 'SingletonNode'},
+            {'type': 'EnumerateCollectionNode', 'collection': 'djornl_node', 'outVariable': {'id': 1}},
+            {'type': 'CalculationNode', 'outVariable': {'id': 2}, 'expression': {
+                'type': 'logical or', 'subNodes': [{'type': 'attribute access', 'subNodes': [ref]}],
+            }},
+            {'type': 'FilterNode', 'inVariable': {'id': 2}},
+            {'type': 'SortNode'},
+        ]}
+        plan = {'estimatedCost': 1234.567, 'nodes': [
+            {'type': 'SingletonNode'},
+            {'type': 'SubqueryNode', 'subquery': subquery},
+            {'type': 'IndexNode', 'collection': 'djornl_edge', 'outVariable': {'id': 3}},
+            {'type': 'CalculationNode', 'outVariable': {'id': 4}, 'expression': {'type': 'reference', 'id': 3}},
+            {'type': 'FilterNode', 'inVariable': {'id': 4}},
+            {'type': 'EnumerateCollectionNode', 'collection': 'ws_object', 'outVariable': {'id': 5}, 'filter': {}},
+            {'type': 'EnumerateCollectionNode', 'collection': 'djornl_node', 'outVariable': {'id': 6},
+             'filter': {'type': 'compare =='}},
+        ]}
+        self.assertEqual(query_plans.summarize_plan(plan), {
+            'full_scans': ['djornl_node', 'ws_object'],
+            'unindexed_filters': 2,
+            'in_memory_sorts': 1,
+            'estimated_cost': 1234.57,
+        })
+
+
+    def test_audit_stored_queries(self):
+        """ query plans are audited against a recorded baseline """
+
+        params = {'type': 'object', 'properties': {
+            'key': {'type': 'string', 'examples': ['a'], 'default': 'b'},
+            'ids': {'type': 'array', 'default': [1]},
+            'n': {'type': ['integer', 'null']},
+        }}
+        queries = {
+            'fetch_thing': 'FOR t IN thing FILTER t._key == @key RETURN t',
+            'list_things': 'FOR t IN thing FILTER t.id IN @ids LIMIT @n RETURN t',
+        }
+        files = {
+            f'stored_queries/{name}.yaml': {'name': name, 'params': params, 'query': query}
+            for (name, query) in queries.items()
+        }
+        with _spec_dir(files) as tmp_dir, _fake_arangodb() as (db_url, stats):
+            baseline_path = os.path.join(tmp_dir, 'baseline.json')
+
+            def audit(update_baseline=False):
+                return validate.audit_stored_queries(
+                    baseline_path, update_baseline, db_concurrency=2, db_url=db_url, db_auth=('root', '')
+                )
+
+            # there is nothing to compare with until a baseline is recorded
+            self.assertEqual(audit(), [])
+            self.assertEqual(audit(update_baseline=True), [])
+            self.assertEqual(stats['bind_vars'][0], {'key': 'a', 'ids': [1], 'n': 0})
+            self.assertEqual(query_plans.load_baseline(baseline_path)['list_things'], {
+                'full_scans': ['thing'], 'unindexed_filters': 1, 'in_memory_sorts': 0, 'estimated_cost': 40.0,
+            })
+            self.assertEqual(audit(), [])
+
+            with open('stored_queries/fetch_thing.yaml', 'w') as fd:
+                query = 'FOR t IN thing FILTER t.name == @key FOR o IN other SORT t.id RETURN t'
+                yaml.safe_dump({'name': 'fetch_thing', 'params': params, 'query': query}, fd)
+            self.assertEqual(audit(), [
+                'fetch_thing: new full collection scans of other, thing',
+                'fetch_thing: unindexed filters went from 0 to 1',
+                'fetch_thing: in memory sorts went from 0 to 1',
+                'fetch_thing: estimated cost went from 20.0 to 60.0',
+            ])
+
+            # a collection bind var is taken from its examples; with none, the query is not explained
+            coll_props = {
+                'scan_thing': {'@coll': {'type': 'string', 'examples': ['thing']}},
+                'scan_any': {'@coll': {'type': 'string'}},
+            }
+            for (name, props) in coll_props.items():
+                with open(f'stored_queries/{name}.yaml', 'w') as fd:
+                    params = {'type': 'object', 'properties': props}
+                    yaml.safe_dump({'name': name, 'params': params, 'query': 'FOR t IN @@coll RETURN t'}, fd)
+            stats['bind_vars'].clear()
+            self.assertEqual(audit(update_baseline=True), [])
+            self.assertIn({'@coll': 'thing'}, stats['bind_vars'])
+            self.assertEqual(len(stats['bind_vars']), 3)
+            baseline = query_plans.load_baseline(baseline_path)
+            self.assertEqual(sorted(baseline), ['fetch_thing', 'list_things', 'scan_thing'])
+
+
+    def test_index_coverage(self):
+        """ filtered and sorted attributes are checked against the declared indexes, without a database """
+
+        indexes = [
+            {'type': 'persistent', 'fields': ['a', 'b']},
+            {'type': 'hash', 'fields': ['c']},
+            {'type': 'fulltext', 'fields': ['name']},
+        ]
+        files = {
+            'schemas/thing.yaml': dict(_VERTEX, indexes=indexes),
+            'schemas/edge.yaml': dict(_VERTEX, name='edge', type='edge', indexes=[
+                {'type': 'persistent', 'fields': ['score']},
+            ]),
+            'stored_queries/by_a.yaml': {
+                'name': 'by_a', 'query': 'FOR t IN thing FILTER t.a == @a AND t.b == 1 AND t.d == 2 RETURN t',
+            },
+            # a collection bind var is resolved from its examples; the traversal and comment are ignored
+            'stored_queries/by_e.yaml': (
+                'name: by_e\n'
+                'params:\n'
+                '  type: object\n'
+                '  properties:\n'
+                '    "@coll": {type: string, examples: [thing]}\n'
+                'query: |\n'
+                '  FOR t IN @@coll\n'
+                '    // FILTER t.c == 1\n'
+                '    FILTER t.e == 1 OR t.b == "t.c"\n'
+                '    SORT t.a\n'
+                '    FOR v IN 1..3 OUTBOUND t edge\n'
+                '      FILTER v.score > 1\n'
+                '      RETURN v\n'
+            ),
+        }
+        with _spec_dir(files):
+            (schemas, _) = validate._load_specs('schemas/*.yaml')
+            (queries, _) = validate._load_specs('stored_queries/*.yaml')
+            results = index_coverage.analyze(schemas, queries)
+            self.assertEqual(results['unindexed'], {
+                ('thing', 'd'): [('by_a', 1)],
+                ('thing', 'e'): [('by_e', 3)],
+                ('thing', 'b'): [('by_e', 3)],
+            })
+            self.assertEqual(results['full_scans'], {('thing', 'e'): [('by_e', 3)], ('thing', 'b'): [('by_e', 3)]})
+            self.assertEqual(results['unused_indexes'], [
+                ('edge', {'type': 'persistent', 'fields': ['score']}), ('thing', indexes[1]), ('thing', indexes[2]),
+            ])
+            self.assertEqual(results['unresolved'], [])
+
+            self.assertEqual(validate.check_index_coverage(), [])
+            self.assertEqual(validate.check_index_coverage(strict=True), [
+                'stored_queries/by_e.yaml:9: filter on unindexed thing.b reads the whole collection',
+                'stored_queries/by_e.yaml:9: filter on unindexed thing.e reads the whole collection',
+            ])
+
+        bad_index = dict(_VERTEX, indexes=[{'type': 'btree', 'fields': ['a']}])
+        bad_fulltext = dict(_VERTEX, name='other', indexes=[{'type': 'fulltext', 'fields': ['a', 'b']}])
+        with _spec_dir({'schemas/thing.yaml': bad_index, 'schemas/other.yaml': bad_fulltext}):
+            errors = validate.validate_json_schemas()
+        self.assertEqual(errors[0], 'A fulltext index must have exactly one field in schemas/other.yaml')
+        self.assertIn("Invalid collection schema in schemas/thing.yaml: 'btree' is not one of", errors[1])
+
+
+    def test_lint_stored_queries(self):
+        """ AQL patterns that do not scale are found without a database, unless a query opts out """
+
+        files = {
+            # results is counted, but also looped over, so only the count of matches builds a subquery just to count it
+            'stored_queries/search.yaml': (
+                'name: search\n'
+                'params:\n'
+                '  type: object\n'
+                '  properties:\n'
+                '    depth: {type: integer, maximum: 50}\n'
+                'query: |\n'
+                '  LET results = (\n'
+                '    FOR t IN thing\n'
+                '      FILTER t.name == "LIMIT 1"\n'
+                '      RETURN t\n'
+                '  )\n'
+                '  LET ids = (FOR r IN results LIMIT 10 RETURN r._id)\n'
+                '  LET names = (FOR r IN results RETURN r.name)\n'
+                '  LET matches = (\n'
+                '    FOR t IN thing\n'
+                '      FILTER t.name == "x"\n'
+                '      RETURN 1\n'
+                '  )\n'
+                '  LET related = (\n'
+                '    FOR v IN 1..@depth ANY results[0] edge\n'
+                '      LIMIT 100\n'
+                '      FILTER v.is_public\n'
+                '      RETURN v\n'
+                '  )\n'
+                '  RETURN {ids, related, count: COUNT(results), n_matches: COUNT(matches), names: LENGTH(names)}\n'
+            ),
+            'stored_queries/lineage.yaml': (
+                'name: lineage\n'
+                'query: |\n'
+                '  FOR t IN thing\n'
+                '    FOR v IN 1..100 OUTBOUND t edge\n'
+                '      RETURN v\n'
+                '  // aql-lint: disable=unbounded-traversal, no-such-rule\n'
+            ),
+            'stored_queries/children.yaml': {
+                'name': 'children',
+                'query': 'FOR t IN thing FOR v IN 1..100 INBOUND t edge FILTER v.a LIMIT 10 RETURN v',
+            },
+        }
+        with _spec_dir(files):
+            self.assertEqual(validate.lint_stored_queries(), [])
+            self.assertEqual(validate.lint_stored_queries(only={'stored_queries/children.yaml'}, strict=True), [])
+            errors = validate.lint_stored_queries(strict=True)
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(errors[0], (
+            'stored_queries/lineage.yaml:6: [aql-lint] unknown rule no-such-rule in aql-lint comment'
+        ))
+        self.assertRegex(errors[1], (
+            r'^stored_queries/search.yaml:21: \[filter-after-limit\] .* on line\(s\) 22 '
+        ))
+        self.assertRegex(errors[2], (
+            r'^stored_queries/search.yaml:25: \[count-materialized\] COUNT\(matches\) .* line 14,'
+        ))
+
+        # traversals deeper than MAX_DEPTH, or to a depth with no maximum, need a LIMIT
+        query = 'FOR t IN thing FOR v IN 1..@depth OUTBOUND t edge RETURN v'
+        self.assertEqual(aql_lint.lint(query, {'properties': {'depth': {'maximum': 5}}}), [])
+        self.assertEqual(aql_lint.lint(query, offset=10), [(
+            11, 'unbounded-traversal',
+            'traversal of up to @depth hops (no maximum) has no LIMIT on the number of results',
+        )])
+        self.assertEqual(aql_lint.lint('// aql-lint: disable=all\n' + query), [])
@@ -1,18 +1,65 @@
 """
 Validate everything in this repo, such as syntax, structure, etc.
+
+Files are checked in a pool of worker processes. Files that passed on an
+earlier run, and have not changed since (nor has this validator), are
+recorded in a cache and skipped.
+
+    python -m test.validate                  # check everything that has changed since the last run
+    python -m test.validate --changed-only   # only the files changed since the last git commit
+    python -m test.validate --watch          # re-check files as they are edited
+
+The stored queries are linted for AQL patterns that do not scale (see
+test/aql_lint.py). Unless only some files are checked, the attributes that the stored queries
+filter and sort on are then checked against the indexes declared in the
+schemas (see test/index_coverage.py), and the plans of the stored queries are
+audited against the baseline in test/query_plan_baseline.json (see
+test/query_plans.py). Record a new baseline with --update-baseline.
 """
+import argparse
+import concurrent.futures
+import contextlib
+import hashlib
+import itertools
 import sys
 import os
 import glob
+import subprocess
+import time
 import yaml
 import jsonschema
 import requests
+import requests.adapters
 import json
 from jsonschema.exceptions import ValidationError
 
+from test import aql, aql_lint, index_coverage, query_plans
 from test.helpers import get_config, wait_for_arangodb
 
-_CONF = get_config()
+
+def _package_version(name):
+    try:
+        import importlib.metadata
+        return importlib.metadata.version(name)
+    except ImportError:  # python < 3.8
+        import pkg_resources
+        return pkg_resources.get_distribution(name).version
+
+
+# the cache is cleared whenever this file or the jsonschema package changes
+with open(__file__, 'rb') as _fd:
+    _VALIDATOR_VERSION = hashlib.sha256(_fd.read() + _package_version('jsonschema').encode()).hexdigest()[:16]
+
+_CACHE_PATH = os.path.join('.cache', 'validate.json')
+
+# query plan summaries that the stored queries are audited against
+_PLAN_BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'query_plan_baseline.json')
+
+# number of queries to send to arangodb for parsing at once
+_DB_CONCURRENCY = 8
+
+# fewer files than this are quicker to check in this process than to hand to a pool
+_MIN_POOL_FILES = 20
 
 # JSON schema for vertex and edge collection schemas found in /schema
 schema_schema = {
@@ -28,55 +75,182 @@ schema_schema = {
             'type': 'string',
             'enum': ['vertex', 'edge']
         },
-        'schema': {'type': 'object'}
+        'schema': {'type': 'object'},
+        'indexes': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'required': ['type', 'fields'],
+                'additionalProperties': False,
+                'properties': {
+                    'type': {
+                        'type': 'string',
+                        'enum': ['persistent', 'hash', 'skiplist', 'fulltext', 'geo', 'ttl']
+                    },
+                    'fields': {
+                        'type': 'array',
+                        'minItems': 1,
+                        'items': {'type': 'string'}
+                    },
+                    'name': {'type': 'string'},
+                    'unique': {'type': 'boolean'},
+                    'sparse': {'type': 'boolean'},
+                    'minLength': {'type': 'integer'},
+                    'geoJson': {'type': 'boolean'},
+                    'expireAfter': {'type': 'number'}
+                }
+            }
+        }
     }
 }
 
 
-def validate_json_schemas():
-    """Validate the syntax of all the JSON schemas."""
-    print('Validating JSON schemas..')
-    names = set()  # type: set
-    for path in glob.iglob('schemas/**/*.yaml', recursive=True):
-        name = os.path.basename(path)
-        print(f'  validating {path}..')
-        with open(path) as fd:
-            data = yaml.safe_load(fd)
-        jsonschema.validate(data, schema_schema)
-        # Check for any duplicate schema names
-        if name in names:
-            _fatal('Duplicate schemas for name ' + name)
+class ValidationCache(object):
+    """
+    The content hashes of the files that passed validation, stored as JSON at
+    `path`, along with the version of the validator that checked them. A file
+    is only taken as valid if its content is unchanged; failures are never
+    cached, so they are reported on every run until they are fixed.
+    """
+
+    def __init__(self, path, version=_VALIDATOR_VERSION):
+        self.path = path
+        self.version = version
+        self.valid = {}
+        if path and os.path.exists(path):
+            with open(path) as fd:
+                saved = json.load(fd)
+            if saved.get('version') == version:
+                self.valid = saved['valid']
+
+    def is_valid(self, path, digest):
+        return self.valid.get(path) == digest
+
+    def record(self, path, digest):
+        self.valid[path] = digest
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fd:
+            json.dump({'version': self.version, 'valid': self.valid}, fd, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def _digest(path):
+    with open(path, 'rb') as fd:
+        return hashlib.sha256(fd.read()).hexdigest()
+
+
+def _check_files(check, paths, cache, workers):
+    """
+    Run `check(path)`, which returns a (errors, info) pair, on each of `paths`
+    that is not valid according to the cache, in a pool of `workers` processes.
+    Returns a list of (path, digest, errors, info) tuples, in the order of
+    `paths`, and the number of paths skipped.
+    """
+    digests = {path: _digest(path) for path in paths}
+    todo = [path for path in paths if not cache.is_valid(path, digests[path])]
+    if workers > 1 and len(todo) >= _MIN_POOL_FILES:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(check, todo, chunksize=max(1, len(todo) // (workers * 4))))
+    else:
+        results = [check(path) for path in todo]
+    return ([(path, digests[path], errors, info) for (path, (errors, info)) in zip(todo, results)],
+            len(paths) - len(todo))
+
+
+def _validate_files(pattern, label, check, cache, workers, only, check_more=None):
+    """
+    Check each of the files matching a glob pattern (or with `only`, a set of
+    paths, just those among them) with `check`, recording the files that pass
+    in the cache. If `check_more` is given, it is called with a list of the
+    (path, info) pairs that passed `check`, and returns a list of errors for
+    each of them. Returns a list of all the errors.
+    """
+    cache = cache or ValidationCache(None)
+    paths = sorted(glob.glob(pattern, recursive=True))
+    errors = _duplicate_names(paths, label)
+    todo = paths if only is None else [path for path in paths if path in only]
+    (results, n_skipped) = _check_files(check, todo, cache, workers)
+    more_errors = {}
+    passed = [(path, info) for (path, _, file_errors, info) in results if not file_errors]
+    if check_more is not None and passed:
+        more_errors = dict(zip([path for (path, _) in passed], check_more(passed)))
+    for (path, digest, file_errors, info) in results:
+        file_errors = file_errors or more_errors.get(path, [])
+        if file_errors:
+            errors += file_errors
         else:
-            names.add(name)
-        # Make sure it can be used as a JSON schema
-        # If the schema is invalid, a SchemaError will get raised
-        # Otherwise, the schema will work and a ValidationError will get raised (what we want)
-        try:
-            jsonschema.validate({}, data['schema'])
-        except ValidationError:
-            pass
-        except Exception as err:
-            print('=' * 80)
-            print('Unable to load schema in ' + path)
-            print(str(err))
-            exit(1)
-        # All schemas must be object types
-        if data['schema']['type'] != 'object':
-            _fatal('Schemas must be an object. Schema in %s is not an object.' % path)
-        required = data['schema'].get('required', [])
-        # Edges must require _from and _to while vertices must require _key
-        has_edge_fields = ('_from' in required and '_to' in required)
-        has_delta_edge_fields = ('from' in required and 'to' in required)
-        if data['type'] == 'edge' and data.get('delta') and not has_delta_edge_fields:
-            _fatal('Time-travel edge schemas must require "from" and "to" attributes in ' + path)
-        elif data['type'] == 'edge' and not data.get('delta') and not has_edge_fields:
-            _fatal('Edge schemas must require "_from" and "_to" attributes in ' + path)
-        elif data['type'] == 'vertex' and data.get('delta') and 'id' not in required:
-            _fatal('Time-travel vertex schemas must require the "id" attribute in ' + path)
-        elif data['type'] == 'vertex' and not data.get('delta') and '_key' not in required:
-            _fatal('Vertex schemas must require the "_key" attribute in ' + path)
-        print(f'✓ {name} is valid.')
-    print('..all valid.')
+            cache.record(path, digest)
+            print(f'✓ {path} is valid.')
+    if n_skipped:
+        print(f'  {n_skipped} unchanged file(s) skipped.')
+    if not errors:
+        print('..all valid.')
+    return errors
+
+
+def _duplicate_names(paths, label):
+    """Errors for any files that share a file name, which gives the name of what they define."""
+    seen = {}
+    errors = []
+    for path in sorted(paths):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name in seen:
+            errors.append(f'Duplicate {label} named {name}: {seen[name]} and {path}')
+        else:
+            seen[name] = path
+    return errors
+
+
+def check_json_schema(path):
+    """Check a single collection schema file, returning (errors, None)."""
+    with open(path) as fd:
+        data = yaml.safe_load(fd)
+    try:
+        jsonschema.validate(data, schema_schema)
+    except ValidationError as err:
+        return ([f'Invalid collection schema in {path}: {err.message}'], None)
+    # Make sure it can be used as a JSON schema
+    # If the schema is invalid, a SchemaError will get raised
+    # Otherwise, the schema will work and a ValidationError will get raised (what we want)
+    try:
+        jsonschema.validate({}, data['schema'])
+    except ValidationError:
+        pass
+    except Exception as err:
+        return ([f'Unable to load schema in {path}: {err}'], None)
+    for index in data.get('indexes', []):
+        if index['type'] in ('fulltext', 'ttl') and len(index['fields']) != 1:
+            return ([f"A {index['type']} index must have exactly one field in {path}"], None)
+    # All schemas must be object types
+    if data['schema']['type'] != 'object':
+        return (['Schemas must be an object. Schema in %s is not an object.' % path], None)
+    required = data['schema'].get('required', [])
+    # Edges must require _from and _to while vertices must require _key
+    has_edge_fields = ('_from' in required and '_to' in required)
+    has_delta_edge_fields = ('from' in required and 'to' in required)
+    if data['type'] == 'edge' and data.get('delta') and not has_delta_edge_fields:
+        return (['Time-travel edge schemas must require "from" and "to" attributes in ' + path], None)
+    elif data['type'] == 'edge' and not data.get('delta') and not has_edge_fields:
+        return (['Edge schemas must require "_from" and "_to" attributes in ' + path], None)
+    elif data['type'] == 'vertex' and data.get('delta') and 'id' not in required:
+        return (['Time-travel vertex schemas must require the "id" attribute in ' + path], None)
+    elif data['type'] == 'vertex' and not data.get('delta') and '_key' not in required:
+        return (['Vertex schemas must require the "_key" attribute in ' + path], None)
+    return ([], None)
+
+
+def validate_json_schemas(cache=None, workers=1, only=None):
+    """
+    Validate the syntax of all the JSON schemas, or with `only`, a set of
+    paths, just those among them. Returns a list of errors.
+    """
+    print('Validating JSON schemas..')
+    return _validate_files('schemas/**/*.yaml', 'schemas', check_json_schema, cache, workers, only)
 
 
 stored_query_schema = {
@@ -91,50 +265,224 @@ stored_query_schema = {
 }
 
 
-def validate_stored_queries():
-    """Validate the structure and syntax of all the queries."""
+def check_stored_query(path):
+    """
+    Check the structure of a single stored query file, returning (errors, info),
+    where `info` has the full query text and param names, for parsing the query.
+    """
+    with open(path) as fd:
+        data = yaml.safe_load(fd)
+    try:
+        jsonschema.validate(data, stored_query_schema)
+    except ValidationError as err:
+        return ([f'Invalid stored query in {path}: {err.message}'], None)
+    name = data['name']
+    filename = os.path.splitext(os.path.basename(path))[0]
+    if name != filename:
+        return ([f'Name key should match filename: {name} vs {filename}'], None)
+    # Make sure `params` can be used as a JSON schema
+    if data.get('params'):
+        # Make sure it can be used as a JSON schema
+        # If the schema is invalid, a SchemaError will get raised
+        # Otherwise, the schema will work and a ValidationError will get raised (what we want)
+        try:
+            jsonschema.validate({}, data['params'])
+        except ValidationError:
+            pass
+        except Exception as err:
+            return ([f'Unable to load params schema in {path}: {err}'], None)
+        # Params must be of type 'object'
+        if data['params'].get('type') != 'object':
+            return ([f"Params schema must have type 'object' in {path}"], None)
+    info = {
+        'query': data.get('query_prefix', '') + ' ' + data['query'],
+        'params': sorted(data.get('params', {}).get('properties', {}).keys()),
+    }
+    return ([], info)
+
+
+def check_query_syntax(path, info, session, db_url):
+    """Parse a stored query on arangodb, returning a list of errors."""
+    try:
+        resp = session.post(db_url + '/_api/query', data=json.dumps({'query': info['query']}).encode())
+        parsed = resp.json()
+    except (requests.RequestException, ValueError) as err:
+        return [f'{path}: unable to parse the query on arangodb: {err}']
+    if parsed['error']:
+        return [f"{path}: {parsed['errorMessage']}"]
+    query_bind_vars = set(parsed['bindVars'])
+    params = set(info['params'])
+    if params != query_bind_vars:
+        return [(f"Bind vars are invalid in {path}.\n"
+                 f"  Extra vars in query: {query_bind_vars - params}.\n"
+                 f"  Extra params in schema: {params - query_bind_vars}")]
+    return []
+
+
+def check_queries_syntax(items, concurrency=_DB_CONCURRENCY, db_url=None, db_auth=None):
+    """
+    Parse the queries from (path, info) pairs on arangodb, `concurrency` at a
+    time over a single keep-alive session, returning a list of errors for each.
+    """
+    with _db_session(concurrency, db_url, db_auth) as (session, db_url):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(lambda item: check_query_syntax(*item, session, db_url), items))
+
+
+@contextlib.contextmanager
+def _db_session(concurrency, db_url=None, db_auth=None):
+    """
+    A keep-alive session for arangodb with a connection for each of `concurrency`
+    threads, and the arangodb URL, which comes from the test config by default.
+    """
+    if db_url is None:
+        (db_url, db_auth) = (get_config()['db_url'], get_config()['db_auth'])
+    with requests.Session() as session:
+        session.auth = db_auth
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        yield (session, db_url)
+
+
+def validate_stored_queries(cache=None, workers=1, only=None, db_concurrency=_DB_CONCURRENCY):
+    """
+    Validate the structure and syntax of all the queries, or with `only`, a
+    set of paths, just those among them. Returns a list of errors.
+    """
     print('Validating AQL queries..')
-    names = set()  # type: set
-    for path in glob.iglob('stored_queries/**/*.yaml', recursive=True):
-        print(f'  validating {path}..')
+    # the structure is checked in the worker processes, then the AQL is parsed on arangodb
+    return _validate_files(
+        'stored_queries/**/*.yaml', 'queries', check_stored_query, cache, workers, only,
+        check_more=lambda items: check_queries_syntax(items, db_concurrency),
+    )
+
+
+def audit_stored_queries(baseline_path=_PLAN_BASELINE_PATH, update_baseline=False,
+                         db_concurrency=_DB_CONCURRENCY, db_url=None, db_auth=None):
+    """
+    Explain every stored query on arangodb, with bind vars taken from the
+    examples and defaults in its params schema, and report the full collection
+    scans, unindexed filters, in-memory sorts and estimated cost of its plan.
+    Returns a list of errors, including every way in which a plan has got
+    worse than in the baseline. With `update_baseline`, the baseline is
+    replaced with the current plans instead. Queries with a collection bind
+    var that has no examples are listed as unresolved, and not explained.
+    """
+    print('Auditing AQL query plans..')
+    queries = []
+    for path in sorted(glob.glob('stored_queries/**/*.yaml', recursive=True)):
         with open(path) as fd:
             data = yaml.safe_load(fd)
-        jsonschema.validate(data, stored_query_schema)
-        name = data['name']
-        filename = os.path.splitext(os.path.basename(path))[0]
-        if name != filename:
-            _fatal(f'Name key should match filename: {name} vs {filename}')
-        if name in names:
-            _fatal(f'Duplicate queries named {name}')
-        else:
-            names.add(name)
-        # Make sure `params` can be used as a JSON schema
-        if data.get('params'):
-            # Make sure it can be used as a JSON schema
-            # If the schema is invalid, a SchemaError will get raised
-            # Otherwise, the schema will work and a ValidationError will get raised (what we want)
-            try:
-                jsonschema.validate({}, data['params'])
-            except ValidationError:
-                pass
-            # Params must be of type 'object'
-            if data['params'].get('type') != 'object':
-                _fatal("Params schema must have type 'object'")
+        unresolved = query_plans.unresolved_collections(data.get('params'))
+        if unresolved:
+            print(f"  {data['name']}: unresolved, with no examples for {', '.join(unresolved)}")
+            continue
         query = data.get('query_prefix', '') + ' ' + data['query']
-        # Parse the AQL query on arangodb
-        url = _CONF['db_url'] + '/_api/query'
-        resp = requests.post(url, data=json.dumps({'query': query}), auth=_CONF['db_auth'])
-        parsed = resp.json()
-        if parsed['error']:
-            _fatal(parsed['errorMessage'])
-        query_bind_vars = set(parsed['bindVars'])
-        params = set(data.get('params', {}).get('properties', {}).keys())
-        if params != query_bind_vars:
-            _fatal((f"Bind vars are invalid.\n"
-                    f"  Extra vars in query: {query_bind_vars - params}.\n"
-                    f"  Extra params in schema: {params - query_bind_vars}"))
-        print(f'✓ {path} is valid.')
-    print('..all valid.')
+        queries.append((data['name'], query, query_plans.example_bind_vars(data.get('params'))))
+
+    with _db_session(db_concurrency, db_url, db_auth) as (session, db_url):
+
+        def explain(item):
+            (name, query, bind_vars) = item
+            try:
+                return (name, query_plans.explain_query(session, db_url, query, bind_vars))
+            except (requests.RequestException, ValueError, RuntimeError) as err:
+                return (name, err)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=db_concurrency) as executor:
+            results = list(executor.map(explain, queries))
+
+    errors = []
+    summaries = {}
+    for (name, result) in results:
+        if isinstance(result, Exception):
+            errors.append(f'{name}: unable to explain the query: {result}')
+        else:
+            summaries[name] = result
+            print(f'  {name}: {query_plans.describe(result)}')
+
+    if update_baseline:
+        query_plans.save_baseline(baseline_path, summaries)
+        print(f'..baseline of {len(summaries)} query plans written to {baseline_path}.')
+        return errors
+    baseline = query_plans.load_baseline(baseline_path)
+    if baseline is None:
+        print(f'..no baseline at {baseline_path} to compare with; record one with --update-baseline.')
+        return errors
+    errors += query_plans.find_regressions(summaries, baseline)
+    if not errors:
+        print('..no plan is worse than the baseline.')
+    return errors
+
+
+def _load_specs(pattern):
+    """The data in each of the yaml files matching a glob pattern, by name, and their paths."""
+    (specs, paths) = ({}, {})
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        with open(path) as fd:
+            data = yaml.safe_load(fd)
+        specs[data['name']] = data
+        paths[data['name']] = path
+    return (specs, paths)
+
+
+def check_index_coverage(strict=False):
+    """
+    Cross-check the attributes that the stored queries filter and sort on with
+    the indexes declared in the schemas, without a database, listing the
+    unindexed attributes (hottest first) and the indexes that no query can use.
+    Returns a list of errors, which is empty unless `strict` is set, when there
+    is one for every filter that makes a query read a whole collection.
+    """
+    print('Checking index coverage..')
+    (schemas, _) = _load_specs('schemas/**/*.yaml')
+    (queries, query_paths) = _load_specs('stored_queries/**/*.yaml')
+    # clause line numbers are counted from the start of each query
+    offsets = {name: aql.query_line(path) for (name, path) in query_paths.items()}
+    results = index_coverage.analyze(schemas, queries)
+
+    def where(uses):
+        return ', '.join(f'{query_paths[name]}:{offsets[name] + line}' for (name, line) in uses)
+
+    for ((coll, attr), uses) in index_coverage.hot_attributes(results):
+        scan = ' (full scan)' if (coll, attr) in results['full_scans'] else ''
+        print(f'  unindexed {coll}.{attr}{scan}: {where(uses)}')
+    for (coll, index) in results['unused_indexes']:
+        print(f'  unused {index_coverage.describe_index(index)} in {coll}')
+    for use in results['unresolved']:
+        print(f'  {where([use])}: collection bind var has no examples, so its attributes are not checked')
+    errors = []
+    if strict:
+        for ((coll, attr), uses) in sorted(results['full_scans'].items()):
+            errors += [f'{where([use])}: filter on unindexed {coll}.{attr} reads the whole collection'
+                       for use in uses]
+    if not results['unindexed'] and not results['unused_indexes']:
+        print('..every filter and sort is indexed, and every index is used.')
+    return errors
+
+
+def lint_stored_queries(only=None, strict=False):
+    """
+    Lint all the stored queries, or with `only`, a set of paths, just those
+    among them, for AQL patterns that do not scale, without a database, and
+    print a diagnostic with the file and line of each. Returns a list of
+    errors, which is empty unless `strict` is set, when every diagnostic is one.
+    """
+    print('Linting AQL queries..')
+    problems = []
+    for path in sorted(glob.glob('stored_queries/**/*.yaml', recursive=True)):
+        if only is not None and path not in only:
+            continue
+        with open(path) as fd:
+            data = yaml.safe_load(fd)
+        for (line, rule, message) in aql_lint.lint(data['query'], data.get('params'), aql.query_line(path)):
+            problems.append(f'{path}:{line}: [{rule}] {message}')
+    for problem in problems:
+        print('  ' + problem)
+    if not problems:
+        print('..no problems found.')
+    return problems if strict else []
 
 
 # JSON schema for arangosearch views found in /views
@@ -155,36 +503,144 @@ view_schema = {
 }
 
 
-def validate_views():
-    """Validate the structure and syntax of arangosearch views"""
-    print('Validating views..')
-    names = set()  # type: set
-    for path in glob.iglob('views/**/*.json', recursive=True):
-        print(f'  validating {path}..')
-        with open(path) as fd:
-            data = json.load(fd)
+def check_view(path):
+    """Check a single arangosearch view file, returning (errors, None)."""
+    with open(path) as fd:
+        data = json.load(fd)
+    try:
         jsonschema.validate(data, view_schema)
-        name = data['name']
-        filename = os.path.splitext(os.path.basename(path))[0]
-        if name != filename:
-            _fatal(f'Name key should match filename: {name} vs {filename}')
-        if name in names:
-            _fatal(f'Duplicate queries named {name}')
-        else:
-            names.add(name)
+    except ValidationError as err:
+        return ([f'Invalid view in {path}: {err.message}'], None)
+    name = data['name']
+    filename = os.path.splitext(os.path.basename(path))[0]
+    if name != filename:
+        return ([f'Name key should match filename: {name} vs {filename}'], None)
+    return ([], None)
 
-        print(f'✓ {name} is valid.')
-    print('..all valid.')
+
+def validate_views(cache=None, workers=1, only=None):
+    """
+    Validate the structure and syntax of arangosearch views, or with `only`,
+    a set of paths, just those among them. Returns a list of errors.
+    """
+    print('Validating views..')
+    return _validate_files('views/**/*.json', 'views', check_view, cache, workers, only)
+
+
+def changed_files(since='HEAD'):
+    """The paths of the files changed since a git commit, including untracked files."""
+    def git(*args):
+        out = subprocess.run(['git'] + list(args), stdout=subprocess.PIPE, check=True).stdout.decode()
+        return out.splitlines()
+    return set(git('diff', '--name-only', since) + git('ls-files', '--others', '--exclude-standard'))
+
+
+def validate_all(cache, workers=1, only=None, db_concurrency=_DB_CONCURRENCY, audit=False, update_baseline=False,
+                 strict_indexes=False, strict_lint=False):
+    """
+    Run every validation and the AQL lint pass, then unless `only` is given,
+    the index coverage check, and if `audit` is set, the query plan audit,
+    saving the cache and returning the list of errors.
+    """
+    errors = []
+    try:
+        errors += validate_json_schemas(cache, workers, only)
+        errors += validate_stored_queries(cache, workers, only, db_concurrency)
+        errors += validate_views(cache, workers, only)
+    finally:
+        cache.save()
+    if not errors:
+        errors += lint_stored_queries(only, strict_lint)
+    if only is None and not errors:
+        errors += check_index_coverage(strict_indexes)
+    if audit and not errors:
+        errors += audit_stored_queries(update_baseline=update_baseline, db_concurrency=db_concurrency)
+    if errors:
+        sys.stderr.write('=' * 80 + '\n')
+        sys.stderr.write(f'{len(errors)} error(s):\n')
+        for error in errors:
+            sys.stderr.write(str(error) + '\n')
+    return errors
 
 
-def _fatal(msg):
-    """Fatal error."""
-    sys.stderr.write(str(msg) + '\n')
-    sys.exit(1)
+def _snapshot():
+    """The modification time of every file that is validated."""
+    paths = itertools.chain(
+        glob.glob('schemas/**/*.yaml', recursive=True),
+        glob.glob('stored_queries/**/*.yaml', recursive=True),
+        glob.glob('views/**/*.json', recursive=True),
+    )
+    return {path: os.stat(path).st_mtime_ns for path in paths}
+
+
+def watch(cache, workers=1, interval=1.0, db_concurrency=_DB_CONCURRENCY):
+    """Re-validate the files that change, until interrupted."""
+    previous = {}
+    while True:
+        current = _snapshot()
+        if current != previous:
+            only = {path for (path, mtime) in current.items() if previous.get(path) != mtime}
+            validate_all(cache, workers, None if not previous else only, db_concurrency)
+            previous = current
+            print('Watching for changes; Ctrl-C to stop..')
+        time.sleep(interval)
+
+
+def get_args():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--workers', type=int, default=os.cpu_count() or 1,
+        help='number of processes to check files in (default: %(default)s)'
+    )
+    argparser.add_argument(
+        '--db-concurrency', type=int, default=_DB_CONCURRENCY,
+        help='number of queries to parse on arangodb at once (default: %(default)s)'
+    )
+    argparser.add_argument(
+        '--cache', default=_CACHE_PATH,
+        help='where to record the files that passed (default: %(default)s)'
+    )
+    argparser.add_argument('--no-cache', action='store_true', help='check every file, ignoring the cache')
+    argparser.add_argument(
+        '--changed-only', action='store_true',
+        help='only check the files that differ from the git commit given by --since'
+    )
+    argparser.add_argument('--since', default='HEAD', help='the git commit for --changed-only (default: %(default)s)')
+    argparser.add_argument(
+        '--no-audit', action='store_true',
+        help="skip the audit of the stored queries' plans, which is not run with --changed-only or --watch"
+    )
+    argparser.add_argument(
+        '--update-baseline', action='store_true',
+        help=f'record the current query plans as the baseline to audit against, in {_PLAN_BASELINE_PATH}'
+    )
+    argparser.add_argument(
+        '--strict-indexes', action='store_true',
+        help='fail if a stored query filters on unindexed attributes only, and so reads a whole collection'
+    )
+    argparser.add_argument(
+        '--strict-lint', action='store_true',
+        help='fail if the AQL lint pass finds any problems in the stored queries'
+    )
+    argparser.add_argument(
+        '--watch', type=float, nargs='?', const=1.0, metavar='SECONDS',
+        help='keep running, re-checking files as they change, polling every SECONDS (default: 1)'
+    )
+    return argparser.parse_args()
 
 
 if __name__ == '__main__':
+    args = get_args()
     wait_for_arangodb()
-    validate_json_schemas()
-    validate_stored_queries()
-    validate_views()
+    cache = ValidationCache(None if args.no_cache else args.cache)
+    if args.watch:
+        try:
+            watch(cache, args.workers, args.watch, args.db_concurrency)
+        except KeyboardInterrupt:
+            pass
+    else:
+        only = changed_files(args.since) if args.changed_only else None
+        audit = not (args.no_audit or args.changed_only) or args.update_baseline
+        if validate_all(cache, args.workers, only, args.db_concurrency, audit, args.update_baseline,
+                        args.strict_indexes, args.strict_lint):
+            sys.exit(1)